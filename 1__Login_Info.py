@@ -60,7 +60,8 @@ def load_full_credentials():
         automations = Automations(
             mb_credentials=json.load(mb_credentials),
             sf_credentials=json.load(sf_credentials),
-            new_login=new_login
+            new_login=new_login,
+            query_cache=load_query_cache()
         )
         if new_login: st.json({'current-token':automations.get_mb_token()}, expanded=False)
         st.success('Your credentials were loaded')
@@ -78,7 +79,8 @@ def load_default_credentials():
         automations = Automations(
             mb_credentials='templates/default_mb_credentials.json',
             sf_credentials='templates/default_sf_credentials.json',
-            user=username
+            user=username,
+            query_cache=load_query_cache()
         )
         st.session_state.automations = automations
         st.rerun()
@@ -66,6 +66,7 @@ def allow_filtering():
     st.dataframe(found_mps, use_container_width=True)
 
     available_mps = found_mps.index.values
+    finder.prefetch_contacts(available_mps) # Para que los contactos ya estén listos cuando elijan MPs
     chosen_mps = st.sidebar.multiselect(
         label='Choose MP for contact information', 
         options=available_mps
@@ -35,6 +35,13 @@ def allow_filtering():
     show_type = col2.checkbox('Type')
     show_score = col3.checkbox('Score')
 
+    interval_days = st.sidebar.selectbox(
+        label='Activity window (days)',
+        options=[7, 30, 90, 365],
+        index=1,
+        help='Number of days used to count quotes and wos'
+    )
+
     if len(chosen_products) == 0 : 
         st.text('Please choose products to continue')
         return
@@ -47,7 +54,8 @@ def allow_filtering():
         show_wos=show_wos,
         show_status=show_status,
         show_type=show_type,
-        show_score=show_score
+        show_score=show_score,
+        interval_days=interval_days
     )
     
     if search_results.size <= 0:
@@ -70,6 +78,7 @@ def allow_filtering():
         st.warning(f'This products were NOT found:\n {missing_products}')
 
     available_mps = search_results.index.values
+    finder.prefetch_contacts(available_mps) # Para que los contactos ya estén listos cuando elijan MPs
     chosen_mps = st.sidebar.multiselect(
         label='Choose MP for contact information', 
         options=available_mps
@@ -97,7 +106,7 @@ def allow_filtering():
         mps=chosen_mps
     )
 
-    if contact_info.size <= 0:
+    if contact_info is None or contact_info.size <= 0:
         st.warning('There is no contact information on those MPs')
         return
     
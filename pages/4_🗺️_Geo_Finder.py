@@ -21,16 +21,23 @@ def allow_geolocation():
     chosen_product = st.session_state.chosen_product
     
     if chosen_product is None: return
-    figure, data = finder.plot_product_availability(chosen_product, quantiles=True)
+    interactive_map = st.sidebar.toggle('Interactive map', value=True)
+
+    if interactive_map:
+        deck, data = finder.map_product_availability(chosen_product, quantiles=True)
+    else:
+        image, data = finder.render_product_availability(chosen_product, quantiles=True)
     
     tab_fig, tab_data = st.tabs(['Map', 'Data'])
 
     with tab_fig:
-        
-        st.pyplot(
-            figure, 
-            use_container_width=False
-        )
+        if interactive_map:
+            st.pydeck_chart(deck, use_container_width=True)
+        else:
+            st.image(
+                image,
+                width=600
+            )
 
     with tab_data:
         display_data = (
@@ -26,9 +26,11 @@ def render_page():
         st.title('Hello Mariano')
     
     add_description_to_page('Elige el tipo de valor que deseas actualizar.')
-    choice = st.sidebar.radio('Update', options=['WOs & Quotes', 'MP Status', 'Main Process', 'OTIF', 'Last WOs Date', 'Quoted Items'], label_visibility='collapsed')
+    choice = st.sidebar.radio('Update', options=['Incremental Sync', 'WOs & Quotes', 'MP Status', 'Main Process', 'OTIF', 'Last WOs Date', 'Quoted Items'], label_visibility='collapsed')
 
-    if choice == 'WOs & Quotes':
+    if choice == 'Incremental Sync':
+        sync_incremental()
+    elif choice == 'WOs & Quotes':
         update_wos_quotes()
     elif choice == 'MP Status':
         update_status()
@@ -74,6 +76,17 @@ def update_scorecards():
                 except IndexError:
                     st.error('No se encontró el ID del MP')
 
+def sync_incremental():
+    automations = st.session_state.automations
+
+    st.markdown('WOs & Quotes, OTIF y Last WOs Date usando solo los cambios desde la última sincronización.')
+    full = st.checkbox('Descargar todo otra vez', value=False)
+
+    if st.button('Sync'):
+        errors = automations.sync_incremental(full=full, verbose=True)
+        st.success('Values have been synced')
+        show_errors(errors=errors)
+
 def update_otif():
     automations = st.session_state.automations
     mb_query = 'queries/otif_mb.sql'
@@ -0,0 +1,10 @@
+-- Compañías creadas o modificadas desde {watermark}
+with changed_companies as (
+    select id, salesforce_id, updated_at
+    from companies
+    where updated_at >= {watermark}
+)
+select *
+from changed_companies
+--insert_where_clause_here
+--insert_order_by_clause_here
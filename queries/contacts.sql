@@ -0,0 +1,2 @@
+select AccountId, LastName, FirstName, Phone, MobilePhone, Email, Title
+from Contact
\ No newline at end of file
@@ -0,0 +1,33 @@
+-- Cuenta los quotes y working orders que cada MP ha tenido por día a partir de {start_date}
+with quotes as (
+    select companies.salesforce_id as mp_id, date(quotations.created_at) as doc_day, count(*) as quotes
+    from quotations
+    join companies on companies.id = quotations.manufacturing_partner_id
+    where quotations.manufacturing_partner_id is not null and quotations.deleted_at is null
+    and quotations.created_at >= {start_date}
+    group by companies.salesforce_id, date(quotations.created_at)
+),
+working_orders as (
+    select companies.salesforce_id as mp_id, date(wos.created_at) as doc_day, count(*) as wos
+    from wos
+    join companies on companies.id = wos.companyid
+    where wos.companyid is not null and wos.cancelled_at is null
+    and wos.created_at >= {start_date}
+    group by companies.salesforce_id, date(wos.created_at)
+),
+final_query as (
+    select
+        -- Id único por MP y día para poder paginar cuando hay más de 2,000 renglones
+        concat(coalesce(quotes.mp_id, working_orders.mp_id), '_', to_char(coalesce(quotes.doc_day, working_orders.doc_day), 'YYYY-MM-DD')) as activity_id,
+        coalesce(quotes.mp_id, working_orders.mp_id) as mp_id,
+        coalesce(quotes.doc_day, working_orders.doc_day) as doc_day,
+        coalesce(quotes.quotes, 0) as quotes,
+        coalesce(working_orders.wos, 0) as wos
+    from quotes
+    full outer join working_orders on working_orders.mp_id = quotes.mp_id and working_orders.doc_day = quotes.doc_day
+    where coalesce(quotes.mp_id, working_orders.mp_id) is not null
+)
+select *
+from final_query
+--insert_where_clause_here
+--insert_order_by_clause_here
@@ -0,0 +1,10 @@
+-- Entregas de purchase orders creadas o modificadas desde {watermark}
+with changed_deliveries as (
+    select id, purchase_order_id, status, in_full, on_time, updated_at
+    from purchase_order_deliveries
+    where updated_at >= {watermark}
+)
+select *
+from changed_deliveries
+--insert_where_clause_here
+--insert_order_by_clause_here
@@ -0,0 +1,10 @@
+-- Quotations creados o modificados desde {watermark}
+with changed_quotations as (
+    select id, manufacturing_partner_id as mp_id, created_at, deleted_at, updated_at
+    from quotations
+    where updated_at >= {watermark}
+)
+select *
+from changed_quotations
+--insert_where_clause_here
+--insert_order_by_clause_here
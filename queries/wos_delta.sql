@@ -0,0 +1,10 @@
+-- Working orders creados o modificados desde {watermark}
+with changed_wos as (
+    select id, companyid as mp_id, purchase_order_id, created_at, cancelled_at, updated_at
+    from wos
+    where updated_at >= {watermark}
+)
+select *
+from changed_wos
+--insert_where_clause_here
+--insert_order_by_clause_here
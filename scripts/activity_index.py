@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+
+class ActivityIndex:
+    '''
+    Esta clase guarda, para cada MP, el número de quotes y working orders por día en arreglos de numpy
+    junto con sus sumas acumuladas. Con eso la actividad de cualquier ventana (7, 30, 90, 365 días)
+    para todos los MPs es una resta vectorizada, sin volver a consultar Metabase.
+
+    Los objetos no se modifican: extend regresa un índice nuevo con los días que se agregaron.
+    '''
+    def __init__(self, activity:pd.DataFrame, start_date:date, end_date:date) -> None:
+        '''
+        :param activity: dataframe con columnas mp_id, doc_day, quotes, wos (un renglón por MP y día)
+        :param start_date: primer día que cubre el índice
+        :param end_date: último día que cubre el índice (normalmente hoy)
+        '''
+        activity = self.__clean(activity)
+        self.__start = np.datetime64(start_date, 'D')
+        self.__end = np.datetime64(end_date, 'D')
+        self.__mp_ids = np.unique(activity.mp_id.to_numpy(dtype=str))
+
+        n_days = int((self.__end - self.__start).astype(int)) + 1
+        counts = np.zeros((2, self.__mp_ids.size, n_days), dtype=np.int32)
+        self.__fill(counts, activity)
+        self.__set_counts(counts)
+
+    @property
+    def start_date(self) -> date:
+        return self.__start.astype(date)
+
+    @property
+    def end_date(self) -> date:
+        return self.__end.astype(date)
+
+    def window_counts(self, days:int) -> pd.DataFrame:
+        '''
+        Regresa los quotes y wos de cada MP en la ventana formada por el último día del índice y los `days` días anteriores.
+
+        :param days: tamaño de la ventana en días
+        :return: dataframe con columnas mp_id, quotes, wos
+        '''
+        n_days = self.__cumulative.shape[2] - 1
+        first = max(0, n_days - (int(days) + 1))
+        totals = self.__cumulative[:, :, -1] - self.__cumulative[:, :, first]
+
+        return pd.DataFrame({
+            'mp_id':self.__mp_ids,
+            'quotes':totals[0],
+            'wos':totals[1]
+        })
+
+    def extend(self, activity:pd.DataFrame, start_date:date, end_date:date, history_days:int=None) -> 'ActivityIndex':
+        '''
+        Regresa un nuevo índice con la actividad de los días nuevos.
+        Los días a partir de start_date se reemplazan con lo que venga en activity (el último día normalmente estaba incompleto).
+
+        :param activity: dataframe con columnas mp_id, doc_day, quotes, wos desde start_date
+        :param start_date: primer día que trae activity
+        :param end_date: nuevo último día del índice
+        :param history_days: número máximo de días a conservar, None para conservarlos todos
+        '''
+        activity = self.__clean(activity)
+        new_start = np.datetime64(start_date, 'D')
+        new_end = np.datetime64(end_date, 'D')
+
+        first_day = self.__start
+        if history_days is not None:
+            first_day = max(first_day, new_end - np.timedelta64(int(history_days), 'D'))
+
+        mp_ids = np.union1d(self.__mp_ids, activity.mp_id.to_numpy(dtype=str))
+        n_days = int((new_end - first_day).astype(int)) + 1
+        counts = np.zeros((2, mp_ids.size, n_days), dtype=np.int32)
+
+        # Copiamos los días viejos que siguen siendo válidos (de first_day hasta antes de new_start)
+        old_from = int((first_day - self.__start).astype(int))
+        old_to = min(self.__counts.shape[2], int((new_start - self.__start).astype(int)))
+        if old_to > old_from:
+            rows = np.searchsorted(mp_ids, self.__mp_ids)
+            counts[:, rows, :old_to - old_from] = self.__counts[:, :, old_from:old_to]
+
+        index = ActivityIndex.__new__(ActivityIndex)
+        index.__start = first_day
+        index.__end = new_end
+        index.__mp_ids = mp_ids
+        index.__fill(counts, activity[activity.doc_day >= new_start])
+        index.__set_counts(counts)
+        return index
+
+    def __fill(self, counts:np.ndarray, activity:pd.DataFrame) -> None:
+        '''
+        Suma la actividad en la matriz de conteos (tipo x MP x día). Se ignoran los días fuera del índice.
+        '''
+        rows = np.searchsorted(self.__mp_ids, activity.mp_id.to_numpy(dtype=str))
+        columns = (activity.doc_day.to_numpy().astype('datetime64[D]') - self.__start).astype(int)
+        on_range = (columns >= 0) & (columns < counts.shape[2])
+
+        rows, columns = rows[on_range], columns[on_range]
+        np.add.at(counts[0], (rows, columns), activity.quotes.to_numpy()[on_range])
+        np.add.at(counts[1], (rows, columns), activity.wos.to_numpy()[on_range])
+
+    def __set_counts(self, counts:np.ndarray) -> None:
+        '''
+        Guarda los conteos diarios y sus sumas acumuladas (con un cero al inicio para poder restar ventanas)
+        '''
+        self.__counts = counts
+        self.__cumulative = np.zeros((2, counts.shape[1], counts.shape[2] + 1), dtype=np.int64)
+        np.cumsum(counts, axis=2, out=self.__cumulative[:, :, 1:])
+
+    def __clean(self, activity:pd.DataFrame) -> pd.DataFrame:
+        '''
+        Deja la actividad con tipos consistentes: doc_day como datetime64[D] y conteos enteros
+        '''
+        activity = activity.dropna(subset=['mp_id', 'doc_day'])
+        return pd.DataFrame({
+            'mp_id':activity.mp_id.astype(str),
+            'doc_day':pd.to_datetime(activity.doc_day, format='ISO8601').dt.tz_localize(None).dt.normalize(),
+            'quotes':activity.quotes.astype(np.int32),
+            'wos':activity.wos.astype(np.int32)
+        })
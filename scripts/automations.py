@@ -1,4 +1,3 @@
-import time
 import warnings
 import numpy as np
 import pandas as pd
@@ -6,26 +5,54 @@ from streamlit import markdown
 # from my_apis.excel_functions import DataExtraction
 from my_apis.mb_connection import MetabaseConnection
 from my_apis.sf_connection import SalesforceConnection, SalesforceFunctions
+from scripts.sf_rest import SalesforceRest
+from scripts.sf_writer import SalesforceWriter
+from scripts.sf_executor import SalesforceExecutor
+from scripts.reconciliation import Reconciler
+from scripts.sf_cache import SalesforceTableCache
+from scripts.sf_stream import SalesforceStreamer
+from scripts.incremental_sync import IncrementalSync
+from scripts.mb_pagination import ParallelPaginator
+from scripts.mb_export import MetabaseExporter
+from scripts.query_schemas import QuerySchemas
+from scripts.query_cache import QueryCache
+from scripts.query_executor import QueryExecutor
 
 class Automations:
-    def __init__(self, mb_credentials:str, sf_credentials:str=None, new_login:bool=False, user:str=None) -> None:
+    def __init__(self, mb_credentials:str, sf_credentials:str=None, new_login:bool=False, user:str=None, query_cache:QueryCache=None) -> None:
         '''
         :param mb_credentials: path to json file with username, password y current-token.
         :param sf_credentials: path to json file with security_token, username, password, domain.
         :param new_login: wether or not to make a new login in metabase. Token lasts 14 days.
         :param logins_are_paths: wether or not the credentials are paths to files or are jsons alredy. Useful when using streamlit application
         :param sf_login: wether or not to log in with given credentials, otherwise, default values are used
+        :param query_cache: cache de resultados compartido entre sesiones, si es None se usa uno propio sobre cache/queries
         '''
         warnings.filterwarnings('error') # Para poder cachar warnings como exceptions.
 
         self.__mbc = MetabaseConnection(mb_credentials, new_login=new_login)
         self.__sfc = SalesforceConnection(sf_credentials)
+        # SalesforceConnection no expone su cliente de simple_salesforce, así que para el REST API se abre uno propio.
+        # El login se hace hasta la primera escritura o lectura por página, y se repite si la sesión caduca
+        self.__sf_rest = SalesforceRest.from_credentials(sf_credentials) if sf_credentials is not None else None
         self.__sff = SalesforceFunctions(self.__sfc)
         try:
             self.__user = mb_credentials["username"]
         except:
             self.__user = user if user is not None else 'default-user'
         self.__DATABASE_ID = 6
+        self.__mb_credentials = mb_credentials
+        self.__mb_exporter = None # se construye hasta que se usa, con la sesión vigente de la conexión
+        self.__schemas = QuerySchemas()
+        self.__executor = QueryExecutor(self.__mbc, self.__sfc, cache=query_cache, database_id=self.__DATABASE_ID, sf_rest=self.__sf_rest)
+        self.__SF_BATCH_SIZE = 200
+        self.__SF_MAX_WORKERS = 4 # llamadas simultáneas a Salesforce
+        self.__SF_REQUESTS_PER_SECOND = 10
+        self.__SF_MAX_RETRIES = 5
+        self.__sf_writer = None
+        self.__sf_streamer = SalesforceStreamer.from_rest(self.__sf_rest)
+        self.__reconciler = Reconciler()
+        self.__incremental_sync = None
 
     def get_user(self) -> str:
         '''
@@ -39,6 +66,7 @@ class Automations:
         El default es 6, pero en caso de que en algún momento se necesite cambiar lo permito aquí.
         '''
         self.__DATABASE_ID = database_id
+        self.__executor.set_database_id(database_id)
 
     def get_mb_token(self) -> str:
         '''
@@ -56,6 +84,26 @@ class Automations:
         '''
         return self.__sfc
     
+    def get_salesforce_rest(self) -> SalesforceRest:
+        '''
+        Regresa el cliente del REST API de Salesforce (escrituras en lote y lecturas por página),
+        o None si no se especificaron credenciales de Salesforce.
+        '''
+        return self.__sf_rest
+
+    def get_mb_exporter(self) -> MetabaseExporter:
+        '''
+        Regresa el exportador de Metabase (endpoint de CSV) construido con las mismas credenciales y la sesión
+        de la conexión, o None si las credenciales no traen el dominio de Metabase.
+        '''
+        if self.__mb_exporter is None:
+            self.__mb_exporter = MetabaseExporter.from_credentials(
+                self.__mb_credentials,
+                session_id=self.get_mb_token(),
+                database_id=self.__DATABASE_ID
+            )
+        return self.__mb_exporter
+
     def get_metabase_connection(self) -> MetabaseConnection:
         '''
         Esta función regresa la conexción a Metabase,
@@ -66,35 +114,53 @@ class Automations:
         '''
         return self.__mbc
 
-    def __change_values(self, df:pd.DataFrame, sf_field:str, verbose:bool=False, sleep_time:int=0, print_every:int=1, object_type:str='Account') -> list:
+    def __change_values(self, df:pd.DataFrame, sf_field:str, verbose:bool=False, print_every:int=1, object_type:str='Account') -> list:
         '''
         Esta función recibe un dataframe con índices (salesforce ids) y una sola columna con el valor a cambiar.
+        Los cambios se mandan en lotes de 200 registros por llamada (sObject Collections), varios lotes en paralelo
+        y reintentando los errores temporales.
         
         :param df: df con el foramto especificado
         :param sf_field: el nombre del campo en salesforce a cambiar
+        :param print_every: cada cuántos registros imprimir el avance (se redondea a lotes)
         :param object_type: el tipo de objeto en salesforce que se modificará
+
+        :return: lista con los renglones (Index, valor) que no se pudieron cambiar
         '''
-        if print_every <= 0: print_every = 1
-        sfc = self.__sfc
+        rows = list(df.itertuples())
+        records = [(sf_id, {sf_field:value}) for sf_id, value in rows]
 
-        if verbose: markdown(f'Registros a cambiar: **{df.size}**')
-        i = 1
-        errors = []
-        for row in df.itertuples():
-            sf_id, value = row
-            try:
-                sfc.update_record(object_type, sf_id, {sf_field:value})
-            except:
-                if verbose: print(sf_id, value)
-                errors.append(row)
-            if verbose and i % print_every == 0: print(f'{i}/{df.size}')
-            i += 1
-            time.sleep(sleep_time)
-        return errors
+        errors = self.__get_sf_writer().update_records(
+            object_type,
+            records,
+            verbose=verbose,
+            print_every=max(1, print_every // self.__SF_BATCH_SIZE)
+        )
+        self.__executor.invalidate([object_type]) # los resultados guardados de ese objeto ya no son válidos
+        if verbose:
+            for position, message, _ in errors: print(rows[position].Index, message)
+
+        return [rows[position] for position, _, _ in errors]
+
+    def __get_sf_writer(self) -> SalesforceWriter:
+        '''
+        Regresa el writer de Salesforce, creándolo la primera vez con la sesión de la conexión actual
+        '''
+        if self.__sf_writer is None:
+            if self.__sf_rest is None:
+                raise Exception('Salesforce credentials are required to update records through the REST API')
+            executor = SalesforceExecutor(
+                max_workers=self.__SF_MAX_WORKERS,
+                requests_per_second=self.__SF_REQUESTS_PER_SECOND,
+                max_retries=self.__SF_MAX_RETRIES
+            )
+            self.__sf_writer = SalesforceWriter(self.__sf_rest, batch_size=self.__SF_BATCH_SIZE, executor=executor)
+        return self.__sf_writer
     
     def __update_values(self, df:pd.DataFrame, sf_id:str, verbose:bool=False, print_every:int=1, object_type:str='Account') -> list:
         '''
         Esta función actualiza los valores para un solo MP.
+        Todos los campos se mandan en una sola llamada (con los mismos reintentos que change_values).
 
         :param df: pandas dataframe con índice correspondiente al nombre del campo de salesfore y el valor que se cambia´ra. A diferencia de change_values, esta cambia varios valores para un solo MP, mientras que change_values cambia el mismo valor para varios MPs.
         :param sf_id: el id de salesforce del MP que se desea cambiar.
@@ -102,22 +168,26 @@ class Automations:
 
         :return: lista con nombres de los errores
         '''
-        sfc = self.__sfc
-        if print_every <= 0: print_every = 1
+        rows = [tuple(row) for row in df.itertuples()]
+        fields = dict(rows)
 
-        i = 1
+        # Salesforce actualiza el registro completo o nada, así que si dice qué campos fallaron se quitan y se manda el resto otra vez
         errors = []
-        for row in df.itertuples():
-            sf_field, value = row
-            try:
-                sfc.update_record(object_type, sf_id, {sf_field:value})
-                if verbose: markdown(f'{sf_field}')
-            except:
-                if verbose: print(sf_field, value)
-                errors.append([sf_field, value])
-            if verbose and i % print_every == 0: print(f'{i}/{df.size}')
-            i += 1
-            
+        while len(fields) > 0:
+            writer_errors = self.__get_sf_writer().update_records(object_type, [(sf_id, fields)], verbose=verbose, print_every=print_every)
+            if len(writer_errors) == 0: break
+
+            _, message, failed_fields = writer_errors[0]
+            failed_fields = [sf_field for sf_field in failed_fields if sf_field in fields]
+            if len(failed_fields) == 0: failed_fields = list(fields)
+
+            if verbose: print(message)
+            for sf_field in failed_fields:
+                if verbose: print(sf_field, fields[sf_field])
+                errors.append([sf_field, fields.pop(sf_field)])
+
+        self.__executor.invalidate([object_type])
+        if verbose and len(fields) > 0: markdown(', '.join([f'{sf_field}' for sf_field in fields]))
         return errors
     
     def update_main_process(self, mb_query:str, sf_query:str, mb_is_path:bool=True, sf_is_path:bool=True, verbose:bool=False, id_col:str='salesforce_id') -> tuple:
@@ -366,14 +436,7 @@ class Automations:
 
         :return: lista con errores
         '''
-        account_status_name = 'Account_Status__c'
-        errors = (
-            self
-            .__execute_query_in_mb(query, is_path, id_col)
-            .set_index('salesforce_id')
-            .pipe(lambda df: self.__change_values(df, account_status_name, verbose=verbose, print_every=(df.size//10)+1))
-        )
-        return errors
+        return self.sync_values('status', mb_query=query, mb_is_path=is_path, verbose=verbose, id_col=id_col)
 
     
     def update_wos_quotes(self, mb_query:str, sf_query:str, mb_is_path:bool=True, sf_is_path:bool=True, verbose:bool=False, id_col:str='salesforce_id') -> list:
@@ -387,62 +450,7 @@ class Automations:
 
         :return: lista con los errores que que se hayan encontrado
         '''
-        completed_wos_sf = 'Completed_Work_Orders__c'
-        completed_quotes_sf = 'Number_of_RFQs_MP_has_quoted__c'
-        # 1. Sacamos los wos y quotes de metabase
-        mb_data = (
-            self
-            .__execute_query_in_mb(mb_query, is_path=mb_is_path, id_col=id_col)
-            .set_index('salesforce_id')
-        )
-
-        # 2. Sacamos los wos y quotes de salesforce
-        sf_data = (
-            self
-            .__execute_query_in_sf(sf_query, is_path=sf_is_path)
-            .set_index('Id')
-            .rename({'Number_of_RFQs_MP_has_quoted__c':'sf_quotes', 'Completed_Work_Orders__c':'sf_wos'}, axis=1)
-            .replace(0, np.nan)
-        )
-
-        # 3. Juntamos los datos y encontramos las diferencias
-        differences = (
-            mb_data
-            .join(sf_data, how='left')
-            .assign(
-                dif_wos=lambda x: x.mb_wos != x.sf_wos,
-                dif_quotes=lambda x: x.mb_quotes != x.sf_quotes
-            )
-        )
-
-        # 4. Actualizamos
-        if verbose: 
-            print('Updating WOS')
-            markdown('Updating **WOs**')
-
-        errors_wos = (
-            differences
-            .query('dif_wos')
-            .dropna(subset=['mb_wos', 'sf_wos'], how='all')
-            [['mb_wos']]
-            .replace([np.nan, 0], None)
-            .pipe(lambda df: self.__change_values(df, completed_wos_sf, verbose=verbose, print_every=df.size//10))  
-        )
-
-        if verbose: 
-            print('Updating QUOTES')
-            markdown('Updating **Quotes**')
-        errors_quotes = (
-            differences
-            .query('dif_quotes')
-            .dropna(subset=['mb_quotes', 'sf_quotes'], how='all')
-            [['mb_quotes']]
-            .replace([np.nan, 0], None)
-            .pipe(lambda df: self.__change_values(df, completed_quotes_sf, verbose=verbose, print_every=df.size//10))
-        )
-
-        errors_wos.extend(errors_quotes)
-        return errors_wos
+        return self.sync_values('wos_quotes', mb_query, sf_query, mb_is_path, sf_is_path, verbose=verbose, id_col=id_col)
     
     def update_otif(self, mb_query:str, sf_query:str, mb_is_path:bool, sf_is_path:bool, verbose:bool=False, id_col:str='salesforce_id') -> list:
         '''
@@ -456,29 +464,7 @@ class Automations:
 
         :return: lista con los errores que que se hayan encontrado
         '''
-        mb_data = (
-            self
-            .__execute_query_in_mb(query=mb_query, is_path=mb_is_path, id_col=id_col)
-            .set_index(id_col)
-        )
-
-        sf_data = (
-            self
-            .__execute_query_in_sf(query=sf_query, is_path=sf_is_path)
-            .set_index('Id')
-        )
-
-        otif_mb = mb_data.columns[0]
-        otif_sf = sf_data.columns[0]
-
-        errors = (
-            mb_data
-            .join(sf_data, how='outer')
-            .query(f'{otif_mb} != {otif_sf}')
-            .drop([otif_sf], axis=1)
-            .pipe(lambda df: self.__change_values(df, otif_sf, verbose=verbose, print_every=(df.size//10)+1))
-        )
-        return errors
+        return self.sync_values('otif', mb_query, sf_query, mb_is_path, sf_is_path, verbose=verbose, id_col=id_col)
     
     def update_last_wo_date(self, mb_query:str, sf_query:str, mb_is_path:bool, sf_is_path:bool, verbose:bool=False, id_col:str='sf_id') -> list:
         '''
@@ -492,80 +478,136 @@ class Automations:
 
         :return: lista con los errores encontrados en la ejecución
         '''
-        mb_data = (
-            self
-            .__execute_query_in_mb(mb_query, sf_is_path, id_col)
-            .set_index(id_col)
-        )
+        return self.sync_values('last_wo_date', mb_query, sf_query, mb_is_path, sf_is_path, verbose=verbose, id_col=id_col)
 
-        sf_data = (
-            self
-            .__execute_query_in_sf(sf_query, sf_is_path)
-            .set_index('Id')
+    def sync_values(self, job:str, mb_query:str=None, sf_query:str=None, mb_is_path:bool=True, sf_is_path:bool=True, verbose:bool=False, id_col:str=None) -> list:
+        '''
+        Sincroniza en Salesforce los valores de un job de Reconciler: saca los datos de ambos lados, calcula las diferencias
+        y manda solo lo que cambió (todos los campos de un MP en el mismo registro).
+
+        :param job: nombre del job (eg. 'wos_quotes', 'otif', 'last_wo_date', 'status')
+        :param mb_query: query de metabase, por default el del job
+        :param sf_query: query de salesforce, por default el del job
+        :param *_is_path: si el query correspondiente es un path a un archivo y no el query en sí
+        :param id_col: columna por la que se ordena cuando hay más de 2,000 registros en MB, por default el id del job
+
+        :return: lista con los renglones (Index = salesforce id, un campo por columna) que no se pudieron cambiar
+        '''
+        config = self.__reconciler.get_job(job)
+        if mb_query is None: mb_query, mb_is_path = config['mb_query'], True
+        if sf_query is None: sf_query, sf_is_path = config['sf_query'], True
+
+        mb_data = self.__execute_query_in_mb(mb_query, is_path=mb_is_path, id_col=id_col or config['mb_id'])
+        sf_data = self.__execute_query_in_sf(sf_query, is_path=sf_is_path) if sf_query is not None else None
+
+        changes = self.__reconciler.diff(job, mb_data, sf_data)
+        if verbose: markdown(f'Valores a cambiar: **{len(changes)}**')
+        return self.__apply_changes(changes, object_type=config['object_type'], verbose=verbose)
+
+    def sync_incremental(self, jobs:list=None, full:bool=False, verbose:bool=False) -> list:
+        '''
+        Sincroniza los jobs usando las copias locales de Metabase y Salesforce (cache/sync y cache/salesforce).
+        Solo se descargan los renglones modificados desde la última corrida, así que se puede correr cada pocos minutos.
+
+        :param jobs: lista de jobs a sincronizar, por default todos los que se pueden sincronizar de forma incremental
+        :param full: si se quiere descargar todo otra vez en lugar de solo el delta
+        :param verbose: wether to print or not
+
+        :return: lista con los renglones (Index = salesforce id, un campo por columna) que no se pudieron cambiar
+        '''
+        incremental_sync = self.__get_incremental_sync()
+        errors = []
+        for job in (jobs if jobs is not None else incremental_sync.get_jobs()):
+            config = self.__reconciler.get_job(job)
+            mb_data = incremental_sync.get_mb_data(job, full=full)
+            sf_data = incremental_sync.get_sf_data(job, config['sf_query'])
+
+            changes = self.__reconciler.diff(job, mb_data, sf_data)
+            if verbose: markdown(f'**{job}**: {len(changes)} valores a cambiar')
+            errors.extend(self.__apply_changes(changes, object_type=config['object_type'], verbose=verbose))
+        return errors
+
+    def __get_incremental_sync(self) -> IncrementalSync:
+        '''
+        Regresa el sincronizador incremental, creándolo la primera vez
+        '''
+        if self.__incremental_sync is None:
+            sf_cache = SalesforceTableCache(self.__sfc, cache_dir='cache/salesforce', streamer=self.__sf_streamer)
+            self.__incremental_sync = IncrementalSync(self.__mbc, sf_cache, state_dir='cache/sync', database_id=self.__DATABASE_ID)
+        return self.__incremental_sync
+
+    def __apply_changes(self, changes:pd.DataFrame, object_type:str='Account', verbose:bool=False) -> list:
+        '''
+        Manda a Salesforce un conjunto de cambios de Reconciler (columnas id, field, new), un registro por id con todos sus campos.
+
+        :return: lista con los renglones (Index = salesforce id, un campo por columna) que no se pudieron cambiar
+        '''
+        if len(changes) == 0: return []
+
+        ids = changes.id.unique()
+        fields = {sf_id: {} for sf_id in ids}
+        for sf_id, sf_field, value in zip(changes.id, changes.field, changes.new):
+            fields[sf_id][sf_field] = value
+        records = [(sf_id, fields[sf_id]) for sf_id in ids]
+
+        errors = self.__get_sf_writer().update_records(
+            object_type,
+            records,
+            verbose=verbose,
+            print_every=max(1, len(records) // (10 * self.__SF_BATCH_SIZE))
         )
+        self.__executor.invalidate([object_type])
+        if len(errors) == 0: return []
 
-        errors = (
-            mb_data
-            .join(sf_data, how='left')
-            # Casteamos a fechas
-            .assign(
-                aux_date=lambda x: pd.to_datetime(x.date_last_wo, utc=True),
-                date_last_wo=lambda x: x.aux_date.dt.strftime('%Y-%m-%d')
-            )
-            .query('date_last_wo != last_wo_date__c')
-            [['date_last_wo']]
-            .pipe(lambda df: self.__sff.change_values(df, 'last_wo_date__c', verbose, print_every=10))
+        failed = (
+            pd.DataFrame([{'Index':records[position][0], **records[position][1]} for position, _, _ in errors])
+            .set_index('Index')
         )
-        
-        return errors
+        if verbose:
+            for position, message, _ in errors: print(records[position][0], message)
+        return list(failed.itertuples())
 
     def __execute_query_in_mb(self, query:str, is_path:bool=False, id_col:str=None) -> pd.DataFrame:
         '''
-        Esta función ejectua un query en metabase y regresa los resultados en un dataframe.
+        Esta función ejectua un query en metabase (o lo lee del cache compartido) y regresa los resultados en un dataframe.
 
         :param query: el query a ejecutar, puede ser el path a un sql file.
         :param is_path: wether or not to load the query from the specified file 
         :param id_col: id_col es necesario cuando se extraen más de 2,000 registros de MB porque es por el que se ordenan para poder sacarlos todos.
         '''
-        # TODO: esta función puede hacerse más sencilla. En vez de preguntar si es path o no, simplemente se puede intentar leer
-        # y si no funciona o hay alguna exepción, entonces se supone que NO es path
-
-        if is_path:
-            with open(query, 'r') as f:
-                query = f.read()
-
-        try:
-            mb_data = (
-                self
-                .__mbc
-                .query_data(query, database_id=self.__DATABASE_ID)
-            )
-        except UserWarning:
-            assert id_col is not None, "Es necesario especificar id_col"
-            mb_data = (
-                self
-                .__mbc
-                .query_more_data(query, database_id=self.__DATABASE_ID, id_col=id_col)
-            )
-
-        return mb_data
+        return self.__executor.query_mb(query, is_path=is_path, id_col=id_col)
     
-    def __execute_query_in_sf(self, query:str, is_path:bool=False) -> pd.DataFrame:
+    def __execute_query_in_sf(self, query:str, is_path:bool=False, column_types:dict=None) -> pd.DataFrame:
         '''
-        Esta función ejecuta un query en salesforce y regresa los resultados en un dataframe.
+        Esta función ejecuta un query en salesforce (o lo lee del cache compartido) y regresa los resultados en un dataframe.
         '''
-        if is_path:
-            with open(query, 'r') as f:
-                query = f.read()
+        sf_data = self.__executor.query_sf(query, is_path=is_path, column_types=column_types)
+        if sf_data.size == 0: raise KeyError('records') # igual que extract_data cuando no hay registros
+        return sf_data
+    
+    def get_query_stats(self) -> dict:
+        '''
+        Regresa los contadores del cache de queries (hits, misses, etc.)
+        '''
+        return self.__executor.get_stats()
 
-        sf_data = (
+    def __get_new_items(self, pages, mb_query:str, existing_items:pd.DataFrame) -> list:
+        '''
+        Aplica el esquema a cada bloque de items cotizados y se queda solo con los que todavía no están en Salesforce.
+
+        :param pages: iterable de pd.DataFrame con los bloques del query
+        :return: lista de pd.DataFrame, uno por bloque
+        '''
+        return [
             self
-            .__sfc
-            .extract_data(query)
-        )
+            .__schemas
+            .apply(mb_query, page)
+            .merge(existing_items, on='name', how='left', indicator=True)
+            .query('_merge == "left_only"')
+            .drop(['_merge'], axis=1)
+            for page in pages
+        ]
 
-        return sf_data
-    
     def update_item_quotations(self, verbose:bool=False, print_every:int=10) -> list:
         '''
         Esta función descarga las cotizaciones de los items que están cargadas en Ichigo y las mete a Salesforce
@@ -576,23 +618,34 @@ class Automations:
         mb_query = 'queries/quoted_items.sql'
         sf_query = 'select Name from quoted_items__c'
 
-        existing_items = (
-            self
-            .__execute_query_in_sf(sf_query, is_path=False)
-            .rename({'Name':'name'}, axis=1)
-            .astype(int)
-        )
-        all_items = self.__execute_query_in_mb(
-            mb_query, 
-            is_path=True, 
-            id_col='name'
-        )
+        existing_items = self.__schemas.apply('quoted_items_names', self.__execute_query_in_sf(sf_query, is_path=False, column_types=self.__schemas.get_arrow_types('quoted_items_names')))
+        with open(mb_query, 'r') as f:
+            query = f.read()
+
+        # Son muchos renglones, así que se exportan en un solo CSV (o en páginas paralelas si no hay exportador
+        # o si la exportación falla, eg. por una sesión caducada) y de cada bloque solo se guardan los items nuevos
+        exporter = self.get_mb_exporter()
+        paginator = ParallelPaginator(self.__mbc, database_id=self.__DATABASE_ID)
+        if exporter is None:
+            new_items = self.__get_new_items(paginator.iter_pages(query, id_col='name'), mb_query, existing_items)
+        else:
+            try:
+                new_items = self.__get_new_items(
+                    exporter.iter_frames(query, column_types=self.__schemas.get_arrow_types(mb_query)),
+                    mb_query,
+                    existing_items
+                )
+            except Exception as e:
+                if verbose: markdown(f'Metabase export failed, using pagination instead: {e}')
+                new_items = self.__get_new_items(paginator.iter_pages(query, id_col='name'), mb_query, existing_items)
+
+        new_items = [page for page in new_items if page.size > 0]
+        if len(new_items) == 0:
+            if verbose: markdown('Changing 0 values')
+            return []
 
         upload_data = (
-            all_items
-            .merge(existing_items, on='name', how='outer', indicator=True)
-            .query('_merge == "left_only"')
-            .drop(['_merge'], axis=1)
+            pd.concat(new_items, ignore_index=True)
             .replace({np.NaN:None})
             .replace({'target_price__c':0.0}, None)
             .assign(item_name__c=lambda x: x.item_name__c.apply(lambda df: df[:255]))
@@ -608,6 +661,7 @@ class Automations:
             verbose=verbose, 
             print_every=print_every
         )
+        self.__executor.invalidate(['quoted_items__c'])
 
         return errors
 
@@ -0,0 +1,165 @@
+import time
+import threading
+import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING
+from scripts.query_templates import QueryTemplates
+
+if TYPE_CHECKING:
+    from my_apis.sf_connection import SalesforceConnection
+
+class ContactsCache:
+    '''
+    Esta clase guarda los contactos de Salesforce de cada MP por un tiempo (ttl) y se comparte entre sesiones.
+
+    Los contactos que faltan se piden en lotes con AccountId in (...) para no pasarnos del largo máximo de un query de SOQL.
+    También se pueden precargar en segundo plano (eg. los MPs que aparecen en una búsqueda) para que cuando
+    el usuario los elija ya estén listos. Si un MP ya se está cargando, se espera a esa carga en lugar de pedirlo otra vez,
+    y si esa carga falla se vuelve a pedir en el momento.
+
+    El cache guarda a lo más max_entries MPs; cuando se llena se descartan los que se usaron hace más tiempo.
+    '''
+    def __init__(self, sfc:'SalesforceConnection', ttl_seconds:int=900, batch_size:int=200, max_workers:int=2, max_entries:int=20000) -> None:
+        self.__FIELDS = ['AccountId', 'LastName', 'FirstName', 'Phone', 'MobilePhone', 'Email', 'Title']
+        self.__QUERY = 'queries/contacts.sql'
+
+        self.__sfc = sfc
+        self.__templates = QueryTemplates()
+        self.__ttl_seconds = ttl_seconds
+        self.__batch_size = batch_size
+        self.__max_workers = max_workers
+        self.__max_entries = max_entries
+
+        self.__entries = OrderedDict() # mp_id -> (momento en que se cargó, lista de contactos), del menos al más usado
+        self.__in_flight = {} # mp_id -> Future de la carga que lo trae
+        self.__executor = None
+        self.__lock = threading.Lock()
+
+    def get(self, mp_ids:list) -> pd.DataFrame:
+        '''
+        Regresa los contactos de los MPs especificados, pidiendo a Salesforce solo los que no están en el cache o ya caducaron.
+
+        :param mp_ids: lista con los ids de Salesforce de los MPs
+        :return: pd.DataFrame con columnas AccountId, LastName, FirstName, Phone, MobilePhone, Email, Title
+        '''
+        mp_ids = list(dict.fromkeys(mp_ids))
+        missing, pending = self.__claim(mp_ids)
+
+        if len(missing) > 0:
+            self.__load(missing)
+        self.__wait(pending)
+
+        with self.__lock:
+            records = []
+            for mp_id in mp_ids:
+                if mp_id not in self.__entries: continue
+                self.__entries.move_to_end(mp_id)
+                records.extend(self.__entries[mp_id][1])
+        return pd.DataFrame.from_records(records, columns=self.__FIELDS)
+
+    def prefetch(self, mp_ids:list) -> None:
+        '''
+        Carga en segundo plano los contactos de los MPs especificados que no estén en el cache.
+
+        :param mp_ids: lista con los ids de Salesforce de los MPs
+        '''
+        missing, _ = self.__claim(list(dict.fromkeys(mp_ids)))
+        if len(missing) == 0: return
+
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix='contacts-prefetch')
+            executor = self.__executor
+        executor.submit(self.__load, missing)
+
+    def invalidate(self, mp_ids:list=None) -> None:
+        '''
+        Borra del cache los contactos de los MPs especificados (o todos)
+        '''
+        with self.__lock:
+            if mp_ids is None:
+                self.__entries.clear()
+            else:
+                for mp_id in mp_ids:
+                    self.__entries.pop(mp_id, None)
+
+    def __wait(self, pending:list) -> None:
+        '''
+        Espera las cargas que ya estaban en curso. Los MPs cuya carga falló se vuelven a pedir aquí mismo,
+        y si vuelve a fallar se lanza el error en lugar de regresar esos MPs sin contactos.
+        '''
+        wait([future for _, future in pending])
+        failed = [mp_id for mp_id, future in pending if future.exception() is not None]
+        if len(failed) == 0: return
+
+        missing, pending = self.__claim(failed)
+        if len(missing) > 0:
+            self.__load(missing)
+        wait([future for _, future in pending])
+        for _, future in pending:
+            if future.exception() is not None:
+                raise future.exception()
+
+    def __claim(self, mp_ids:list) -> tuple:
+        '''
+        Separa los MPs que hay que pedir a Salesforce (y los marca como en carga) de los que ya se están cargando.
+
+        :return: (lista de (mp_id, future) que le toca cargar al que llama, lista de (mp_id, future) que ya se están cargando)
+        '''
+        now = time.monotonic()
+        missing, pending = [], []
+        with self.__lock:
+            for mp_id in mp_ids:
+                entry = self.__entries.get(mp_id)
+                if entry is not None and now - entry[0] <= self.__ttl_seconds: continue
+
+                if mp_id in self.__in_flight:
+                    pending.append((mp_id, self.__in_flight[mp_id]))
+                else:
+                    future = Future()
+                    self.__in_flight[mp_id] = future
+                    missing.append((mp_id, future))
+        return missing, pending
+
+    def __load(self, claimed:list) -> None:
+        '''
+        Pide a Salesforce los contactos de los MPs en lotes y los guarda en el cache.
+        Siempre libera los futures para que nadie se quede esperando aunque falle la carga.
+        '''
+        try:
+            for i in range(0, len(claimed), self.__batch_size):
+                batch = claimed[i:i + self.__batch_size]
+                contacts = self.__extract([mp_id for mp_id, _ in batch])
+
+                loaded_at = time.monotonic()
+                grouped = {mp_id: [] for mp_id, _ in batch}
+                for record in contacts.to_dict('records'):
+                    grouped.setdefault(record['AccountId'], []).append(record)
+
+                with self.__lock:
+                    for mp_id, records in grouped.items():
+                        self.__entries[mp_id] = (loaded_at, records)
+                        self.__entries.move_to_end(mp_id)
+                    while len(self.__entries) > self.__max_entries:
+                        self.__entries.popitem(last=False)
+                    for mp_id, future in batch:
+                        self.__in_flight.pop(mp_id, None)
+                        future.set_result(True)
+        except Exception as e:
+            with self.__lock:
+                for mp_id, future in claimed:
+                    if future.done(): continue
+                    self.__in_flight.pop(mp_id, None)
+                    future.set_exception(e)
+            raise
+
+    def __extract(self, mp_ids:list) -> pd.DataFrame:
+        '''
+        Ejecuta el query de contactos de un lote de MPs. extract_data truena con KeyError cuando no hay registros.
+        '''
+        query = self.__templates.render(self.__QUERY, filters=[('AccountId', 'in', mp_ids)], dialect='soql')
+        try:
+            return self.__sfc.extract_data(query)
+        except KeyError:
+            return pd.DataFrame(columns=self.__FIELDS)
@@ -0,0 +1,173 @@
+import time
+import threading
+import pandas as pd
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+class DataLoader:
+    '''
+    Esta clase carga un conjunto de fuentes de datos respetando las dependencias que hay entre ellas.
+    Las fuentes que no dependen entre sí (eg. los queries de Salesforce y Metabase) se ejecutan en paralelo,
+    y cada fuente arranca en cuanto sus dependencias están listas.
+
+    Cada fuente se carga una sola vez y bajo demanda: pedir una fuente solo carga sus dependencias,
+    y si varios hilos la piden al mismo tiempo todos esperan a la misma carga.
+    '''
+    def __init__(self, max_workers:int=6) -> None:
+        self.__sources = {}
+        self.__max_workers = max_workers
+        self.__executor = None
+        self.__futures = {}
+        self.__timings = {}
+        self.__lock = threading.RLock()
+
+    def add_source(self, name:str, function, depends_on:list=None) -> None:
+        '''
+        Registra una nueva fuente de datos.
+
+        :param name: nombre único de la fuente
+        :param function: función que carga la fuente. Recibe como keyword arguments los resultados de sus dependencias.
+        :param depends_on: lista con los nombres de las fuentes de las que depende
+
+        Eg. add_source('mps', load_mps, depends_on=['addresses', 'states']) llama load_mps(addresses=..., states=...)
+        '''
+        if name in self.__sources:
+            raise Exception(f'Source already registered: {name}')
+        self.__sources[name] = (function, list(depends_on or []))
+
+    def get(self, name:str):
+        '''
+        Regresa el resultado de una fuente, cargándola (junto con sus dependencias) si todavía no se ha cargado.
+
+        :param name: nombre de la fuente
+        '''
+        return self.load([name])[name]
+
+    def load(self, targets:list=None) -> dict:
+        '''
+        Carga las fuentes pedidas junto con todas sus dependencias.
+        Las que ya estaban cargadas no se vuelven a cargar.
+
+        :param targets: lista con los nombres de las fuentes a cargar, None para cargarlas todas
+        :return: diccionario con el resultado de cada fuente pedida y de sus dependencias
+        '''
+        targets = list(self.__sources) if targets is None else targets
+        order = self.__resolve_order(targets)
+
+        with self.__lock:
+            futures = {name: self.__schedule(name) for name in order}
+
+        # Esperamos a todas (aunque alguna falle) antes de revisar los resultados
+        wait(futures.values())
+        self.__release_executor()
+
+        results = {name: future.result() for name, future in futures.items()}
+        return results
+
+    def get_loaded(self) -> list:
+        '''
+        Regresa los nombres de las fuentes que ya se cargaron con éxito
+        '''
+        with self.__lock:
+            return [
+                name for name, future in self.__futures.items()
+                if future.done() and future.exception() is None
+            ]
+
+    def get_timings(self) -> pd.DataFrame:
+        '''
+        Regresa cuánto tardó en cargarse cada fuente, ordenado de la más lenta a la más rápida.
+
+        :return: pd.DataFrame con columnas source, seconds
+        '''
+        with self.__lock:
+            timings = dict(self.__timings)
+
+        return (
+            pd.DataFrame({'source':list(timings.keys()), 'seconds':list(timings.values())})
+            .sort_values('seconds', ascending=False, ignore_index=True)
+        )
+
+    def __release_executor(self) -> None:
+        '''
+        Apaga el executor cuando ya no queda ninguna fuente cargándose, para no dejar hilos vivos por cada DataLoader.
+        Si después se pide otra fuente, __schedule crea uno nuevo.
+        '''
+        with self.__lock:
+            if self.__executor is None: return
+            if any(not future.done() for future in self.__futures.values()): return
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+
+    def __resolve_order(self, targets:list) -> list:
+        '''
+        Ordena topológicamente las fuentes pedidas y sus dependencias.
+        Truena si hay fuentes que no existen o dependencias circulares.
+        '''
+        order = []
+        visiting = set()
+        visited = set()
+
+        def visit(name:str):
+            if name in visited: return
+            if name not in self.__sources:
+                raise Exception(f'Unknown source: {name}')
+            if name in visiting:
+                raise Exception(f'Circular dependency found on source: {name}')
+
+            visiting.add(name)
+            for dependency in self.__sources[name][1]:
+                visit(dependency)
+            visiting.remove(name)
+            visited.add(name)
+            order.append(name)
+
+        for target in targets:
+            visit(target)
+        return order
+
+    def __schedule(self, name:str) -> Future:
+        '''
+        Programa una fuente para que se ejecute en cuanto terminen sus dependencias.
+        Si la fuente ya se cargó (o se está cargando) regresa el mismo future; si falló, se vuelve a intentar.
+        Solo llamar con el lock tomado.
+        '''
+        existing = self.__futures.get(name)
+        if existing is not None and not (existing.done() and existing.exception() is not None):
+            return existing
+
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix='data-loader')
+        executor = self.__executor
+
+        function, depends_on = self.__sources[name]
+        result = Future()
+        self.__futures[name] = result
+        dependencies = {dependency: self.__schedule(dependency) for dependency in depends_on}
+        pending = [len(dependencies)]
+        pending_lock = threading.Lock()
+
+        def run():
+            try:
+                kwargs = {dependency: future.result() for dependency, future in dependencies.items()}
+                start = time.perf_counter()
+                value = function(**kwargs)
+                with self.__lock:
+                    self.__timings[name] = time.perf_counter() - start
+                result.set_result(value)
+            except BaseException as e:
+                result.set_exception(e)
+
+        def dependency_done(_):
+            with pending_lock:
+                pending[0] -= 1
+                ready = pending[0] == 0
+            if ready:
+                executor.submit(run)
+
+        if len(dependencies) == 0:
+            executor.submit(run)
+        else:
+            for future in dependencies.values():
+                future.add_done_callback(dependency_done)
+
+        return result
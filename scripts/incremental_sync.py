@@ -0,0 +1,263 @@
+import os
+import json
+import uuid
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import TYPE_CHECKING
+from scripts.sf_cache import SalesforceTableCache
+from scripts.mb_pagination import ParallelPaginator
+from scripts.query_schemas import QuerySchemas
+from scripts.query_templates import QueryTemplates
+
+if TYPE_CHECKING:
+    from my_apis.mb_connection import MetabaseConnection
+
+class IncrementalSync:
+    '''
+    Esta clase mantiene en disco (cache/sync) una copia de las tablas de Metabase que usan las sincronizaciones
+    de Automations (wos, quotations, companies y entregas) y calcula localmente los agregados por MP.
+
+    Cada tabla guarda su watermark (el updated_at más reciente que se ha visto) en la metadata de su mismo parquet, así que
+    la tabla y su watermark siempre se reemplazan juntos. En cada corrida solo se piden a Metabase
+    los renglones modificados desde entonces, que reemplazan a los anteriores por id. Los borrados lógicos (cancelled_at, deleted_at)
+    llegan como modificaciones; para los borrados físicos se hace una carga completa cada FULL_REFRESH_DAYS días.
+
+    Del lado de Salesforce se usa SalesforceTableCache, así que tampoco se vuelve a descargar la tabla de Accounts completa.
+    '''
+    def __init__(self, mbc:'MetabaseConnection', sf_cache:SalesforceTableCache, state_dir:str='cache/sync', database_id:int=6) -> None:
+        '''
+        :param mbc: conexión a Metabase
+        :param sf_cache: cache de tablas de Salesforce con el que se leen los valores actuales
+        :param state_dir: carpeta donde se guardan las tablas y sus watermarks
+        :param database_id: id de la base de datos de Metabase
+        '''
+        self.__DATABASE_ID = database_id
+        self.__FULL_REFRESH_DAYS = 7
+        # Se vuelve a pedir un poco antes del watermark por si alguna transacción larga escribió un updated_at viejo
+        self.__OVERLAP = pd.Timedelta(minutes=10)
+        self.__FIRST_WATERMARK = pd.Timestamp('1970-01-01', tz='UTC')
+        self.__METADATA_KEY = b'incremental_sync'
+        # Los nombres y tipos de las columnas de cada tabla vienen del esquema de su query (QuerySchemas)
+        self.__TABLES = {
+            'wos':'queries/wos_delta.sql',
+            'quotations':'queries/quotations_delta.sql',
+            'companies':'queries/companies_delta.sql',
+            'deliveries':'queries/deliveries_delta.sql'
+        }
+        # Job de Reconciler -> (tablas que usa, función que calcula los datos de Metabase a partir de las tablas)
+        self.__JOBS = {
+            'wos_quotes':(['companies', 'wos', 'quotations'], self.__build_wos_quotes),
+            'last_wo_date':(['companies', 'wos'], self.__build_last_wo_date),
+            'otif':(['companies', 'wos', 'deliveries'], self.__build_otif)
+        }
+
+        self.__schemas = QuerySchemas()
+        self.__templates = QueryTemplates()
+        self.__mbc = mbc
+        self.__sf_cache = sf_cache
+        self.__state_dir = state_dir
+        self.__lock = threading.Lock()
+
+    def get_jobs(self) -> list:
+        '''
+        Regresa los jobs de Reconciler que se pueden sincronizar de forma incremental
+        '''
+        return list(self.__JOBS)
+
+    def get_mb_data(self, job:str, full:bool=False) -> pd.DataFrame:
+        '''
+        Actualiza las tablas que usa el job y calcula los datos con el mismo formato que regresa el mb_query del job.
+
+        :param job: nombre del job (eg. 'wos_quotes')
+        :param full: si se quiere descargar las tablas completas en lugar de solo el delta
+        '''
+        if job not in self.__JOBS:
+            raise Exception(f'Job {job} cannot be synced incrementally. Available jobs: {list(self.__JOBS)}')
+
+        table_names, build = self.__JOBS[job]
+        tables = {name: self.update_table(name, full=full) for name in table_names}
+        return build(**tables)
+
+    def get_sf_data(self, job:str, sf_query:str, is_path:bool=True) -> pd.DataFrame:
+        '''
+        Regresa el resultado del sf_query del job usando la copia local de Salesforce (solo se pide el delta)
+        '''
+        if is_path:
+            with open(sf_query, 'r') as f:
+                sf_query = f.read()
+        return self.__sf_cache.load(f'sync_{job}', sf_query)
+
+    def update_table(self, name:str, full:bool=False) -> pd.DataFrame:
+        '''
+        Trae de Metabase los renglones de la tabla modificados desde su watermark y los junta con la copia local.
+
+        :param name: nombre de la tabla (eg. 'wos')
+        :param full: si se quiere descargar la tabla completa
+        :return: pd.DataFrame con la tabla actualizada
+        '''
+        with self.__lock:
+            table, metadata = self.__read(name)
+            loaded_at = pd.Timestamp.now(tz='UTC')
+
+            full_loaded_at = metadata.get('full_loaded_at')
+            if table is None or full_loaded_at is None or loaded_at - pd.Timestamp(full_loaded_at) > pd.Timedelta(days=self.__FULL_REFRESH_DAYS):
+                full = True
+
+            if full:
+                table = self.__query_delta(name, self.__FIRST_WATERMARK)
+                metadata = {'full_loaded_at':loaded_at.isoformat()}
+            else:
+                watermark = pd.Timestamp(metadata['watermark']) - self.__OVERLAP
+                table = self.__upsert(table, self.__query_delta(name, watermark))
+
+            if table.size > 0 and table.updated_at.notna().any():
+                metadata['watermark'] = table.updated_at.max().isoformat()
+            else:
+                metadata['watermark'] = metadata.get('watermark', self.__FIRST_WATERMARK.isoformat())
+
+            self.__write(name, table, metadata)
+            return table
+
+    def get_watermarks(self) -> dict:
+        '''
+        Regresa el watermark de cada tabla (None si nunca se ha cargado)
+        '''
+        return {name: self.__read_metadata(name).get('watermark') for name in self.__TABLES}
+
+    def reset(self, name:str=None) -> None:
+        '''
+        Borra la copia local de la tabla especificada (o de todas) para que la siguiente carga sea completa
+        '''
+        with self.__lock:
+            for table_name in (self.__TABLES if name is None else [name]):
+                data_path = self.__path(table_name)
+                if os.path.exists(data_path): os.remove(data_path)
+
+    def __query_delta(self, name:str, watermark:pd.Timestamp) -> pd.DataFrame:
+        '''
+        Ejecuta el query de la tabla desde el watermark y le aplica su esquema (ids enteros y fechas en UTC)
+        '''
+        query = self.__templates.render(self.__TABLES[name], params={'watermark':watermark})
+
+        try:
+            delta = self.__mbc.query_data(query, database_id=self.__DATABASE_ID)
+        except UserWarning:
+            delta = ParallelPaginator(self.__mbc, database_id=self.__DATABASE_ID).query_all(query, id_col='id')
+
+        return self.__schemas.apply(self.__TABLES[name], delta)
+
+    def __upsert(self, table:pd.DataFrame, delta:pd.DataFrame) -> pd.DataFrame:
+        '''
+        Reemplaza por id los renglones de la tabla que vienen en el delta y agrega los nuevos
+        '''
+        if delta.size == 0: return table
+        if table.size == 0: return delta.reset_index(drop=True)
+
+        table = table[~table.id.isin(delta.id)]
+        # Las columnas que vienen completamente vacías en el delta se igualan al tipo de la tabla para que concat no tenga que adivinarlo
+        delta = delta.astype({
+            column: table[column].dtype
+            for column in delta.columns
+            if column in table.columns and delta[column].isna().all() and delta[column].dtype != table[column].dtype
+        })
+        return pd.concat((table, delta[table.columns]), ignore_index=True)
+
+    def __build_wos_quotes(self, companies:pd.DataFrame, wos:pd.DataFrame, quotations:pd.DataFrame) -> pd.DataFrame:
+        '''
+        Mismo resultado que queries/wos_quotes_mb.sql: wos no cancelados y quotes no borrados por MP
+        '''
+        total_wos = wos[wos.cancelled_at.isna()].groupby('mp_id').id.nunique().rename('mb_wos')
+        total_quotes = quotations[quotations.deleted_at.isna()].groupby('mp_id').size().rename('mb_quotes')
+
+        return (
+            companies
+            .set_index('id')
+            [['salesforce_id']]
+            .join(total_wos, how='left')
+            .join(total_quotes, how='left')
+            .dropna(subset=['mb_wos', 'mb_quotes'], how='all')
+            .reset_index(drop=True)
+        )
+
+    def __build_last_wo_date(self, companies:pd.DataFrame, wos:pd.DataFrame) -> pd.DataFrame:
+        '''
+        Mismo resultado que queries/last_wo_date_mb.sql: fecha del último wo no cancelado por MP
+        '''
+        return (
+            wos[wos.cancelled_at.isna()]
+            .groupby('mp_id')
+            .created_at
+            .max()
+            .rename('date_last_wo')
+            .to_frame()
+            .join(companies.set_index('id')[['salesforce_id']], how='left')
+            .rename({'salesforce_id':'sf_id'}, axis=1)
+            .reset_index(drop=True)
+            [['sf_id', 'date_last_wo']]
+        )
+
+    def __build_otif(self, companies:pd.DataFrame, wos:pd.DataFrame, deliveries:pd.DataFrame) -> pd.DataFrame:
+        '''
+        Mismo resultado que queries/otif_mb.sql: porcentaje de entregas completas y a tiempo de los wos de cada MP
+        '''
+        fulfilled = deliveries[deliveries.status == 'Fulfilled']
+        outcomes = fulfilled[['purchase_order_id']].assign(otif=(fulfilled.in_full.fillna(False) & fulfilled.on_time.fillna(False)).astype(float))
+
+        return (
+            wos[['mp_id', 'purchase_order_id']]
+            .merge(outcomes, on='purchase_order_id', how='left')
+            .merge(companies[['id', 'salesforce_id']], left_on='mp_id', right_on='id', how='left')
+            # Igual que el group by del query, los wos sin salesforce_id también forman un grupo
+            .groupby('salesforce_id', dropna=False)
+            .otif
+            .mean()
+            .mul(100)
+            .dropna()
+            .reset_index()
+        )
+
+    def __read(self, name:str) -> tuple:
+        data_path = self.__path(name)
+        if not os.path.exists(data_path):
+            return None, {}
+
+        table = pq.read_table(data_path)
+        metadata = json.loads((table.schema.metadata or {}).get(self.__METADATA_KEY, b'{}'))
+        if metadata.get('watermark') is None:
+            return None, {}
+        # Se vuelve a aplicar el esquema por si la copia se guardó con otra versión de los tipos
+        return self.__schemas.apply(self.__TABLES[name], table.to_pandas()), metadata
+
+    def __read_metadata(self, name:str) -> dict:
+        data_path = self.__path(name)
+        if not os.path.exists(data_path): return {}
+        metadata = pq.read_schema(data_path).metadata or {}
+        return json.loads(metadata.get(self.__METADATA_KEY, b'{}'))
+
+    def __write(self, name:str, table:pd.DataFrame, metadata:dict) -> None:
+        '''
+        Guarda la tabla con su watermark en la metadata del parquet. Se escribe a un archivo temporal (único por proceso y
+        escritura) y luego se reemplaza, así que otros procesos nunca leen un archivo a medias ni un watermark que no
+        corresponda a la tabla.
+        '''
+        os.makedirs(self.__state_dir, exist_ok=True)
+        data_path = self.__path(name)
+
+        arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+        arrow_table = arrow_table.replace_schema_metadata({
+            **(arrow_table.schema.metadata or {}),
+            self.__METADATA_KEY:json.dumps(metadata).encode()
+        })
+
+        tmp_path = f'{data_path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+        pq.write_table(arrow_table, tmp_path)
+        os.replace(tmp_path, data_path)
+
+        # Las versiones anteriores guardaban la metadata en un json aparte
+        legacy_metadata_path = os.path.join(self.__state_dir, f'{name}.json')
+        if os.path.exists(legacy_metadata_path): os.remove(legacy_metadata_path)
+
+    def __path(self, name:str) -> str:
+        return os.path.join(self.__state_dir, f'{name}.parquet')
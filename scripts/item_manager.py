@@ -5,20 +5,34 @@ import pandas as pd
 from my_apis.mb_connection import MetabaseConnection
 from my_apis.sheets_functions import SheetsFunctions
 from my_apis.sf_connection import SalesforceConnection, SalesforceFunctions
+from scripts.sf_rest import SalesforceRest
+from scripts.mb_export import MetabaseExporter
+from scripts.query_schemas import QuerySchemas
+from scripts.query_cache import QueryCache
+from scripts.query_executor import QueryExecutor
+from scripts.result_cache import ResultCache
 
 class ItemManager:
     '''
     Esta clase permite que los ususarios interactúen con los items de ichigo
     '''
-    def __init__(self, mbc:MetabaseConnection, sf:SheetsFunctions, sfc:SalesforceConnection) -> None:
+    def __init__(self, mbc:MetabaseConnection, sf:SheetsFunctions, sfc:SalesforceConnection, exporter:MetabaseExporter=None, query_cache:QueryCache=None, sf_rest:SalesforceRest=None) -> None:
+        '''
+        :param exporter: exportador de Metabase para descargar los items en un solo CSV, si es None se piden en páginas
+        :param query_cache: cache de resultados compartido entre sesiones, si es None se usa uno propio sobre cache/queries
+        :param sf_rest: cliente del REST API de Salesforce para leer los queries página por página, si es None se usa extract_data
+        '''
         warnings.filterwarnings('error') # Para poder cachar warnings como exceptions.
 
         self.__DATABASE_ID = 6
+        self.__ITEMS_QUERY = 'queries/items_quotations.sql'
         
+        self.__schemas = QuerySchemas()
         self.__sfc = sfc
         self.__sff = SalesforceFunctions(sfc)
         self.__mbc = mbc
-        self.__items = self.__load_items()
+        self.__executor = QueryExecutor(mbc, sfc, cache=query_cache, database_id=self.__DATABASE_ID, exporter=exporter, sf_rest=sf_rest)
+        self.__rfq_items = ResultCache(max_entries=32)
         self.__manufacturing_products = self.__load_products()
         self.categories, self.subcategories = self.__load_categories() 
         self.__sheets = sf
@@ -27,39 +41,24 @@ class ItemManager:
         '''
         Carga los productos existentes en Salesforce de manufactura con columnas id, Name, manufacturing_product_category__c
         '''
-        products = self.__execute_query_in_sf(
-            query='queries/manufacturing_products.sql',
-            rename_output={'Name':'subcategory', 'manufacturing_product_category__c':'category'}
+        products = self.__schemas.apply(
+            'manufacturing_products',
+            self.__execute_query_in_sf(query='queries/manufacturing_products.sql', column_types=self.__schemas.get_arrow_types('manufacturing_products'))
         )
         
         return products
     
-    def __execute_query_in_sf(self, query:str, rename_output:dir={}) -> pd.DataFrame:
+    def __execute_query_in_sf(self, query:str, column_types:dict=None) -> pd.DataFrame:
         '''
-        Esta función ejecuta un query en salesforce y regresa los resultados en un dataframe.
+        Esta función ejecuta un query en salesforce (o lo lee del cache compartido) y regresa los resultados en un dataframe.
         '''
-        original_query = query
-        try:
-            with open(query, 'r') as f:
-                query = f.read()
-        except:
-            query = original_query
-
-        sf_data = (
-            self
-            .__sfc
-            .extract_data(query)
-            .rename(rename_output, axis=1)
-        )
-        
-        return sf_data
+        return self.__executor.query_sf(query, is_path=os.path.isfile(query), column_types=column_types)
 
     def add_new_entry(self, rfq_id:int, categories:pd.DataFrame):
         
         new_entry = (
             self
-            .__items
-            .query(f'rfq_id == {rfq_id}')
+            .__get_items(rfq_id)
             .merge(categories.dropna(), on='item_id') # No queremos guardarlos si no tienen tanto categoría como subcategoría
             .dropna(subset=['unit_price'])
             .query('unit_price != 0')
@@ -79,7 +78,7 @@ class ItemManager:
             'rfq_info':pd.DataFrame
         }
         '''
-        items = self.__items
+        items = self.__get_items(rfq_id)
 
         if rfq_id not in items.rfq_id.values: return None
 
@@ -98,8 +97,7 @@ class ItemManager:
         '''
         answer = (
             self
-            .__items
-            .query('rfq_id == @rfq_id')
+            .__get_items(rfq_id)
             .pivot_table(index='item_id', columns='mp_name', values='unit_price', aggfunc='first')
             .replace({0.0:None, np.NaN:None})
             .dropna(how='all', axis=0)
@@ -117,8 +115,7 @@ class ItemManager:
         '''
         answer = (
             self
-            .__items
-            .query('rfq_id == @rfq_id')
+            .__get_items(rfq_id)
             [['rfq_name', 'customer_name', 'main_process', 'pod', 'rfq_id']]
             .drop_duplicates()
             .set_index('rfq_id')
@@ -166,13 +163,11 @@ class ItemManager:
         :param rfq_id: id del rfq que se busca
         :return: pd.DataFrame
         '''
-        items = self.__items
+        items = self.__get_items(rfq_id)
         if rfq_id not in items.rfq_id.values: return None
 
         answer = (
-            self
-            .__items
-            .query('rfq_id == @rfq_id')
+            items
             [['item_id']]
             .drop_duplicates()
             .assign(
@@ -183,50 +178,37 @@ class ItemManager:
         )
         return answer
 
-    def get_items(self) -> pd.DataFrame:
-        return self.__items
-
-    def __load_items(self) -> pd.DataFrame:
+    def get_items(self, rfq_id:int=None) -> pd.DataFrame:
         '''
-        Esta función saca los items de los RFQs que están en Metabase
+        Regresa los items del rfq especificado, o los de todos los RFQs si rfq_id es None
         '''
-        items = (
-            self
-            .__execute_query_in_mb(
-                query='queries/items_quotations.sql',
-                id_col='item_quote_id'
-            )
-        )
-        return items
+        if rfq_id is None:
+            return self.__load_items()
+        return self.__get_items(rfq_id)
 
-    def __execute_query_in_mb(self, query:str, id_col:str=None) -> pd.DataFrame:
+    def __get_items(self, rfq_id:int) -> pd.DataFrame:
         '''
-        Esta función ejectua un query en metabase y regresa los resultados en un dataframe.
-
-        :param query: el query a ejecutar, puede ser el path a un sql file.
-        :param id_col: id_col es necesario cuando se extraen más de 2,000 registros de MB porque es por el que se ordenan para poder sacarlos todos.
+        Regresa los items de un rfq. Se guardan los de los últimos RFQs consultados en la sesión para no volver a pedirlos.
         '''
-        original_query = query
-        try:
-            with open(original_query, 'r') as f:
-                query = f.read()
-        except FileNotFoundError:
-            query = original_query
+        rfq_id = int(rfq_id)
+        return self.__rfq_items.get_or_compute((rfq_id,), 0, lambda: self.__load_items(rfq_id))
 
-        try:
-            mb_data = (
-                self
-                .__mbc
-                .query_data(query, database_id=self.__DATABASE_ID)
-            )
-        except UserWarning:
-            if id_col is None:
-                raise('Es necesario especificar id_col')
-            
-            mb_data = (
-                self
-                .__mbc
-                .query_more_data(query, database_id=self.__DATABASE_ID, id_col=id_col)
-            )
+    def __load_items(self, rfq_id:int=None) -> pd.DataFrame:
+        '''
+        Esta función saca los items de los RFQs que están en Metabase.
+        Si se especifica rfq_id el filtro se hace en Metabase y solo llegan los items de ese rfq.
+        '''
+        if rfq_id is not None:
+            items = self.__executor.query_mb(self.__ITEMS_QUERY, is_path=True, filters=[('rfq_id', '=', rfq_id)], id_col='item_quote_id')
+            return self.__schemas.apply(self.__ITEMS_QUERY, items)
 
-        return mb_data
\ No newline at end of file
+        # Todos los items son muchos más de 2,000 renglones, así que se exportan en un solo CSV o, si no hay exportador,
+        # se piden directo en páginas paralelas sin probar primero con query_data
+        items = self.__executor.query_mb(
+            self.__ITEMS_QUERY,
+            is_path=True,
+            id_col='item_quote_id',
+            export=True,
+            column_types=self.__schemas.get_arrow_types(self.__ITEMS_QUERY)
+        )
+        return self.__schemas.apply(self.__ITEMS_QUERY, items)
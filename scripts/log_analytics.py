@@ -0,0 +1,323 @@
+import os
+import glob
+import json
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+class LogAnalytics:
+    '''
+    Esta clase arma tablas de análisis a partir de los logs de logins y búsquedas, y responde las preguntas más comunes sobre ellas.
+
+    Las columnas con listas (products, mps, chosen_mps) se explotan a un renglón por elemento y los textos se guardan
+    con dictionary encoding. Las tablas se guardan en parquet particionado por día (logs/analytics/<tabla>/day=YYYY-MM-DD),
+    así que cada consulta solo lee los días y columnas que necesita.
+
+    - searches: un renglón por búsqueda (log, user, date, state)
+    - products: un renglón por producto buscado en raw materials (user, date, state, product)
+    - exposures: un renglón por MP elegido en una búsqueda (log, user, date, state, mp)
+    - logins: un renglón por login (user, date)
+
+    Las tablas incluyen las particiones compactadas, los segmentos de logs/<log>/segments/ que todavía no se compactan y el
+    parquet viejo mientras no se haya migrado. Lo único que no aparece es lo que LogWriter aún tiene en memoria (a lo más
+    flush_interval segundos de registros), y cada tabla refleja los logs al momento del último build().
+    '''
+    def __init__(self, log_dir:str='logs', analytics_dir:str=None) -> None:
+        '''
+        :param log_dir: carpeta donde viven los logs (la misma que usa LogWriter)
+        :param analytics_dir: carpeta donde se guardan las tablas de análisis, por default logs/analytics
+        '''
+        self.__log_dir = log_dir
+        self.__analytics_dir = analytics_dir if analytics_dir is not None else os.path.join(log_dir, 'analytics')
+        self.__manifest_path = os.path.join(self.__analytics_dir, '_manifest.json')
+
+        text = pa.dictionary(pa.int32(), pa.string())
+        self.__SCHEMAS = {
+            'searches':pa.schema([('log', text), ('user', text), ('date', pa.timestamp('us')), ('state', text)]),
+            'products':pa.schema([('user', text), ('date', pa.timestamp('us')), ('state', text), ('product', text)]),
+            'exposures':pa.schema([('log', text), ('user', text), ('date', pa.timestamp('us')), ('state', text), ('mp', text)]),
+            'logins':pa.schema([('user', text), ('date', pa.timestamp('us'))])
+        }
+        # Nombre del log -> (nombre corto en las tablas, columna de productos, columna de MPs elegidos)
+        self.__SEARCH_LOGS = {
+            'rm_search_log':('raw_materials', 'products', 'mps'),
+            'mps_search_log':('manufacturing', None, 'chosen_mps')
+        }
+        self.__LOGIN_LOG = 'login_log'
+        self.__PARTITIONING = ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive')
+
+    def build(self) -> int:
+        '''
+        Actualiza las tablas de análisis. Solo se recalculan los días cuyos archivos de log cambiaron desde la última vez.
+
+        :return: número de días que se recalcularon
+        '''
+        manifest = self.__read_manifest()
+        rebuilt = 0
+
+        for log_name in [*self.__SEARCH_LOGS, self.__LOGIN_LOG]:
+            sources, shared = self.__find_sources(log_name)
+            for day, (files, signature) in sources.items():
+                key = f'{log_name}/{day}'
+                if manifest.get(key) == signature: continue
+
+                entries = self.__read_sources(files, day, shared)
+                if log_name == self.__LOGIN_LOG:
+                    log_label = 'login'
+                    tables = self.__explode_logins(entries)
+                else:
+                    log_label, products_column, mps_column = self.__SEARCH_LOGS[log_name]
+                    tables = self.__explode(entries, log_label, products_column, mps_column)
+
+                for table_name, table in tables.items():
+                    self.__write_partition(table_name, log_label, day, table)
+
+                manifest[key] = signature
+                rebuilt += 1
+
+        self.__write_manifest(manifest)
+        return rebuilt
+
+    def searches_per_user_per_day(self, start_date:str=None, end_date:str=None, log:str=None) -> pd.DataFrame:
+        '''
+        Cuenta las búsquedas de cada usuario por día.
+
+        :param start_date: primer día a considerar (YYYY-MM-DD), None para no limitar
+        :param end_date: último día a considerar (YYYY-MM-DD), None para no limitar
+        :param log: 'raw_materials' o 'manufacturing', None para contar ambas
+
+        :return: pd.DataFrame con columnas day, user, searches
+        '''
+        table = self.__scan('searches', ['user', 'log'], start_date, end_date, log)
+        return (
+            table
+            .groupby(['day', 'user'], observed=True)
+            .size()
+            .rename('searches')
+            .reset_index()
+            .sort_values(['day', 'searches'], ascending=[True, False], ignore_index=True)
+        )
+
+    def logins_per_user_per_day(self, start_date:str=None, end_date:str=None) -> pd.DataFrame:
+        '''
+        Cuenta los logins de cada usuario por día.
+
+        :param start_date: primer día a considerar (YYYY-MM-DD), None para no limitar
+        :param end_date: último día a considerar (YYYY-MM-DD), None para no limitar
+
+        :return: pd.DataFrame con columnas day, user, logins
+        '''
+        table = self.__scan('logins', ['user'], start_date, end_date)
+        return (
+            table
+            .groupby(['day', 'user'], observed=True)
+            .size()
+            .rename('logins')
+            .reset_index()
+            .sort_values(['day', 'logins'], ascending=[True, False], ignore_index=True)
+        )
+
+    def top_products_by_state(self, start_date:str=None, end_date:str=None, state:str=None, top_n:int=10) -> pd.DataFrame:
+        '''
+        Regresa los productos más buscados en cada estado.
+
+        :param start_date: primer día a considerar (YYYY-MM-DD), None para no limitar
+        :param end_date: último día a considerar (YYYY-MM-DD), None para no limitar
+        :param state: estado que interesa, None para todos
+        :param top_n: número de productos por estado
+
+        :return: pd.DataFrame con columnas state, product, searches
+        '''
+        table = self.__scan('products', ['state', 'product'], start_date, end_date)
+        if state is not None:
+            table = table[table.state == state]
+
+        return (
+            table
+            .groupby(['state', 'product'], observed=True)
+            .size()
+            .rename('searches')
+            .reset_index()
+            .sort_values(['state', 'searches'], ascending=[True, False])
+            .groupby('state', observed=True)
+            .head(top_n)
+            .reset_index(drop=True)
+        )
+
+    def mp_exposure(self, start_date:str=None, end_date:str=None, log:str=None, top_n:int=None) -> pd.DataFrame:
+        '''
+        Cuenta cuántas veces se ha elegido a cada MP en las búsquedas.
+
+        :param start_date: primer día a considerar (YYYY-MM-DD), None para no limitar
+        :param end_date: último día a considerar (YYYY-MM-DD), None para no limitar
+        :param log: 'raw_materials' o 'manufacturing', None para contar ambas
+        :param top_n: número de MPs a regresar, None para todos
+
+        :return: pd.DataFrame con columnas mp, exposures, users
+        '''
+        table = self.__scan('exposures', ['mp', 'user', 'log'], start_date, end_date, log)
+        exposures = (
+            table
+            .groupby('mp', observed=True)
+            .agg(exposures=pd.NamedAgg('user', 'size'), users=pd.NamedAgg('user', 'nunique'))
+            .reset_index()
+            .sort_values('exposures', ascending=False, ignore_index=True)
+        )
+        return exposures if top_n is None else exposures.head(top_n)
+
+    def __scan(self, table_name:str, columns:list, start_date:str, end_date:str, log:str=None) -> pd.DataFrame:
+        '''
+        Lee solo las columnas y los días (particiones) que se piden de una tabla de análisis.
+        '''
+        table_dir = os.path.join(self.__analytics_dir, table_name)
+        files = glob.glob(os.path.join(table_dir, 'day=*', '*.parquet'))
+        if len(files) == 0:
+            empty = self.__SCHEMAS[table_name].empty_table().select(columns).to_pandas()
+            return empty.assign(day=pd.Series(dtype=object))
+
+        schema = self.__SCHEMAS[table_name].append(pa.field('day', pa.string()))
+        dataset = ds.dataset(files, format='parquet', schema=schema, partitioning=self.__PARTITIONING, partition_base_dir=table_dir)
+        dataset_filter = pc.scalar(True)
+        if start_date is not None: dataset_filter &= ds.field('day') >= str(start_date)
+        if end_date is not None: dataset_filter &= ds.field('day') <= str(end_date)
+        if log is not None: dataset_filter &= ds.field('log') == log
+
+        return dataset.to_table(columns=columns + ['day'], filter=dataset_filter).to_pandas()
+
+    def __find_sources(self, log_name:str) -> tuple:
+        '''
+        Busca los archivos de cada día del log: las particiones que escribe LogWriter, los segmentos que todavía no se compactan
+        y el parquet viejo (logs/<log>.parquet) si aún no se migra a particiones.
+
+        Los segmentos y el parquet viejo pueden traer varios días, así que se leen una sola vez y se separan por día aquí mismo.
+
+        :return: (diccionario día -> (lista de archivos, firma con el tamaño y fecha de modificación de los archivos),
+                  diccionario archivo -> {día: pd.DataFrame} con los archivos que traen varios días)
+        '''
+        log_path = os.path.join(self.__log_dir, log_name)
+        sources = {}
+        for path in glob.glob(os.path.join(log_path, 'day=*', '*.parquet')):
+            day = os.path.basename(os.path.dirname(path)).split('=', 1)[1]
+            sources.setdefault(day, []).append(path)
+
+        shared = {}
+        for path in glob.glob(os.path.join(log_path, 'segments', '*.arrow')):
+            try:
+                with pa.memory_map(path, 'r') as source:
+                    shared[path] = pa.ipc.open_file(source).read_all().to_pandas()
+            except FileNotFoundError:
+                # LogWriter lo compactó mientras tanto, sus renglones ya están en las particiones
+                continue
+
+        legacy_path = os.path.join(self.__log_dir, f'{log_name}.parquet')
+        legacy_migrated = len(glob.glob(os.path.join(log_path, 'day=*', 'part-legacy.parquet'))) > 0
+        if os.path.exists(legacy_path) and not legacy_migrated:
+            shared[legacy_path] = pd.read_parquet(legacy_path)
+
+        for path, data in shared.items():
+            shared[path] = {day: frame for day, frame in data.groupby(data.date.dt.strftime('%Y-%m-%d'))}
+            for day in shared[path]:
+                sources.setdefault(day, []).append(path)
+
+        signatures = {}
+        for day, files in sources.items():
+            files = sorted(files)
+            signatures[day] = (files, '|'.join([f'{file}:{os.path.getsize(file)}:{os.path.getmtime(file)}' for file in files if os.path.exists(file)]))
+
+        return signatures, shared
+
+    def __read_sources(self, files:list, day:str, shared:dict) -> pd.DataFrame:
+        '''
+        Lee los registros de un día. Los archivos con varios días ya vienen leídos y separados por día en shared.
+        '''
+        entries = []
+        for file in files:
+            data = shared[file][day] if file in shared else pd.read_parquet(file)
+            if data.size > 0:
+                entries.append(data)
+
+        if len(entries) == 0: return pd.DataFrame()
+        return pd.concat(entries, ignore_index=True) if len(entries) > 1 else entries[0]
+
+    def __explode_logins(self, logins:pd.DataFrame) -> dict:
+        '''
+        Convierte los logins de un día en la tabla de análisis (un renglón por login)
+        '''
+        if logins.size == 0:
+            return {'logins': self.__SCHEMAS['logins'].empty_table()}
+        return {'logins': self.__to_table(logins[['user', 'date']], 'logins')}
+
+    def __explode(self, searches:pd.DataFrame, log_label:str, products_column:str, mps_column:str) -> dict:
+        '''
+        Convierte las búsquedas de un día en las tablas de análisis (un renglón por búsqueda, producto y MP elegido).
+        '''
+        tables = {}
+        if searches.size == 0:
+            return {table_name: self.__SCHEMAS[table_name].empty_table() for table_name in ['searches', 'products', 'exposures']}
+
+        base = searches[['user', 'date', 'state']].assign(log=log_label)
+        tables['searches'] = self.__to_table(base, 'searches')
+
+        if products_column is not None:
+            products = (
+                searches[['user', 'date', 'state', products_column]]
+                .explode(products_column)
+                .rename({products_column:'product'}, axis=1)
+                .dropna(subset=['product'])
+            )
+            tables['products'] = self.__to_table(products, 'products')
+
+        exposures = (
+            searches[['user', 'date', 'state', mps_column]]
+            .explode(mps_column)
+            .rename({mps_column:'mp'}, axis=1)
+            .dropna(subset=['mp'])
+            .assign(log=log_label)
+        )
+        tables['exposures'] = self.__to_table(exposures, 'exposures')
+        return tables
+
+    def __to_table(self, data:pd.DataFrame, table_name:str) -> pa.Table:
+        '''
+        Convierte el dataframe al esquema de la tabla, con los textos en dictionary encoding
+        '''
+        schema = self.__SCHEMAS[table_name]
+        arrays = []
+        for field in schema:
+            if pa.types.is_dictionary(field.type):
+                values = data[field.name].astype(object).where(data[field.name].notna(), None).tolist()
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pc.cast(pa.array(data[field.name]), field.type, safe=False))
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+    def __write_partition(self, table_name:str, log_label:str, day:str, table:pa.Table) -> None:
+        '''
+        Reemplaza el archivo de la tabla para el log y día especificados
+        '''
+        day_dir = os.path.join(self.__analytics_dir, table_name, f'day={day}')
+        path = os.path.join(day_dir, f'{log_label}.parquet')
+
+        if table.num_rows == 0:
+            if os.path.exists(path): os.remove(path)
+            return
+
+        os.makedirs(day_dir, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    def __read_manifest(self) -> dict:
+        if not os.path.exists(self.__manifest_path): return {}
+        with open(self.__manifest_path, 'r') as f:
+            return json.load(f)
+
+    def __write_manifest(self, manifest:dict) -> None:
+        os.makedirs(self.__analytics_dir, exist_ok=True)
+        tmp_path = f'{self.__manifest_path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.__manifest_path)
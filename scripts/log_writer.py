@@ -0,0 +1,389 @@
+import os
+import glob
+import time
+import uuid
+import atexit
+import logging
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+class LogWriter:
+    '''
+    Esta clase escribe los logs de la plataforma (logins y búsquedas) sin reescribir nunca un archivo.
+
+    - write solo valida y encola la entrada, no toca el disco
+    - Un hilo en segundo plano junta lo encolado y lo escribe como un segmento nuevo (Arrow IPC) en logs/<log>/segments/.
+      Cada proceso escribe sus propios archivos, así que varios workers de streamlit pueden escribir al mismo tiempo sin perder entradas
+    - Cada cierto tiempo los segmentos se compactan en parquet particionado por día: logs/<log>/day=YYYY-MM-DD/part-*.parquet.
+      Solo un proceso compacta a la vez (lock con O_EXCL). Un lock cuyo proceso ya no existe o que es muy viejo se borra
+    - Los logs del formato anterior (logs/<log>.parquet) se pasan a las particiones por día en la primera compactación
+      con entradas nuevas y el archivo se renombra a <log>.parquet.migrated
+
+    Si escribir falla (eg. disco lleno) las entradas se vuelven a encolar (hasta max_queue) y el error se manda a logging
+    la primera vez que aparece; get_status regresa el último error y cuántas vueltas seguidas han fallado.
+    '''
+    def __init__(self, log_dir:str='logs', flush_interval:float=5.0, max_batch:int=500, compact_interval:float=3600.0, max_queue:int=100000) -> None:
+        '''
+        :param log_dir: carpeta donde viven los logs
+        :param flush_interval: cada cuántos segundos se escriben las entradas encoladas
+        :param max_batch: número de entradas encoladas con las que se escribe sin esperar al intervalo
+        :param compact_interval: cada cuántos segundos se compactan los segmentos en parquet
+        :param max_queue: máximo de entradas que se guardan en memoria si no se puede escribir (se tiran las más viejas)
+        '''
+        self.__LOCK_TIMEOUT = 600 # segundos después de los cuales un lock de compactación se considera abandonado
+
+        self.__log_dir = log_dir
+        self.__flush_interval = flush_interval
+        self.__max_batch = max_batch
+        self.__compact_interval = compact_interval
+        self.__max_queue = max_queue
+
+        self.__columns = {}
+        self.__partition_columns = {}
+        self.__queue = []
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__wake_up = threading.Event()
+        self.__worker = None
+        self.__last_compaction = time.monotonic()
+
+        self.__last_error = None
+        self.__last_error_at = None
+        self.__failures = 0 # vueltas seguidas del hilo que han fallado
+        self.__dropped = 0
+
+        atexit.register(self.flush)
+
+    def add_log(self, name:str, template:str, partition_column:str='date') -> None:
+        '''
+        Registra un log. Las columnas se toman del template y todas las entradas deben traer exactamente esas columnas.
+        Registrar otra vez el mismo log no hace nada.
+
+        :param name: nombre del log (eg. 'login_log')
+        :param template: ubicación del archivo excel o csv con el formato del log
+        :param partition_column: columna con la fecha de cada entrada, con la que se particiona por día
+        '''
+        with self.__lock:
+            if name in self.__columns: return
+
+        template_extension = template.split('.')[-1]
+        if template_extension == 'xlsx':
+            columns = pd.read_excel(template).columns.tolist()
+        elif template_extension == 'csv':
+            columns = pd.read_csv(template).columns.tolist()
+        else:
+            raise Exception(f'Unsupported format for template: {template_extension}')
+
+        if partition_column not in columns:
+            raise Exception(f'Partition column {partition_column} not found in template: {template}')
+
+        with self.__lock:
+            self.__columns[name] = columns
+            self.__partition_columns[name] = partition_column
+
+    def write(self, name:str, entry_dict:dict) -> None:
+        '''
+        Encola una entrada en el log. No bloquea: la escritura a disco se hace en segundo plano.
+
+        :param name: nombre del log
+        :param entry_dict: diccionario con los datos de la nueva entrada. Se verifica que las columnas coincidan
+        '''
+        if name not in self.__columns:
+            raise Exception(f'Unknown log: {name}')
+
+        # Verificamos que las columnas coincidan con las del log
+        columns = self.__columns[name]
+        if set(columns) != set(entry_dict.keys()):
+            missing_cols = set(columns) - set(entry_dict.keys())
+            raise Exception(f'Missing columns in new entry: {missing_cols}')
+
+        entry = {column: self.__normalize(entry_dict[column]) for column in columns}
+        with self.__lock:
+            self.__queue.append((name, entry))
+            queue_size = len(self.__queue)
+            self.__start_worker()
+
+        if queue_size >= self.__max_batch:
+            self.__wake_up.set()
+
+    def flush(self) -> None:
+        '''
+        Escribe a disco lo que esté encolado (un segmento por log)
+        '''
+        with self.__flush_lock:
+            with self.__lock:
+                queue, self.__queue = self.__queue, []
+            if len(queue) == 0: return
+
+            entries = {}
+            for name, entry in queue:
+                entries.setdefault(name, []).append(entry)
+
+            items = list(entries.items())
+            for position, (name, rows) in enumerate(items):
+                try:
+                    self.__write_segment(name, rows)
+                except Exception:
+                    # Lo que no se escribió se vuelve a encolar antes de lo que llegó mientras tanto
+                    self.__requeue([(log_name, entry) for log_name, log_rows in items[position:] for entry in log_rows])
+                    raise
+
+    def compact(self, name:str=None) -> bool:
+        '''
+        Compacta los segmentos del log (o de todos) en archivos parquet particionados por día.
+        Si otro proceso ya está compactando no se hace nada.
+
+        :param name: nombre del log, None para compactarlos todos
+        :return: booleano indicando si se compactó
+        '''
+        names = list(self.__columns) if name is None else [name]
+        compacted = False
+        for log_name in names:
+            lock_path = os.path.join(self.__log_dir, log_name, '.compact.lock')
+            if not self.__acquire_lock(lock_path): continue
+            try:
+                self.__compact_segments(log_name)
+                compacted = True
+            finally:
+                os.remove(lock_path)
+        return compacted
+
+    def read(self, name:str) -> pd.DataFrame:
+        '''
+        Lee un log completo: las particiones por día, los segmentos que todavía no se compactan y el archivo
+        del formato anterior si aún no se migra. No incluye lo que sigue encolado en memoria.
+
+        :param name: nombre del log
+        :return: pd.DataFrame ordenado por la columna de fecha (si existe)
+        '''
+        log_path = self.get_log_path(name)
+        tables = [pq.read_table(path) for path in sorted(glob.glob(os.path.join(log_path, 'day=*', '*.parquet')))]
+        for path in sorted(glob.glob(os.path.join(log_path, 'segments', '*.arrow'))):
+            try:
+                with pa.memory_map(path, 'r') as source:
+                    tables.append(pa.ipc.open_file(source).read_all())
+            except FileNotFoundError:
+                continue # se compactó mientras lo leíamos, ya está en las particiones
+        # Si la migración se interrumpió antes de renombrar el archivo anterior, sus entradas ya están en las particiones
+        legacy_path = os.path.join(self.__log_dir, f'{name}.parquet')
+        if os.path.exists(legacy_path) and len(glob.glob(os.path.join(log_path, 'day=*', 'part-legacy.parquet'))) == 0:
+            tables.append(pq.read_table(legacy_path))
+
+        if len(tables) == 0: return pd.DataFrame()
+        data = pa.concat_tables(tables, promote_options='permissive').to_pandas()
+        partition_column = self.__partition_columns.get(name, 'date')
+        if partition_column in data.columns:
+            data = data.sort_values(partition_column, ignore_index=True)
+        return data
+
+    def get_status(self) -> dict:
+        '''
+        Regresa el estado del escritor en segundo plano
+
+        :return: diccionario con queued, dropped (entradas tiradas por max_queue), failures (vueltas seguidas con error),
+            last_error y last_error_at
+        '''
+        with self.__lock:
+            return {
+                'queued':len(self.__queue),
+                'dropped':self.__dropped,
+                'failures':self.__failures,
+                'last_error':self.__last_error,
+                'last_error_at':self.__last_error_at
+            }
+
+    def get_log_path(self, name:str) -> str:
+        '''
+        Regresa la carpeta donde se guarda el log
+        '''
+        return os.path.join(self.__log_dir, name)
+
+    def __start_worker(self) -> None:
+        '''
+        Arranca el hilo que escribe en segundo plano. Solo llamar con el lock tomado.
+        '''
+        if self.__worker is not None: return
+        self.__worker = threading.Thread(target=self.__run_worker, name='log-writer', daemon=True)
+        self.__worker.start()
+
+    def __run_worker(self) -> None:
+        '''
+        Escribe lo encolado cada flush_interval segundos (o antes si se llenó el lote) y compacta cada compact_interval
+        '''
+        while True:
+            self.__wake_up.wait(self.__flush_interval)
+            self.__wake_up.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self.__last_compaction >= self.__compact_interval:
+                    self.__last_compaction = time.monotonic()
+                    self.compact()
+            except Exception as e:
+                # Un error escribiendo logs nunca debe tirar la aplicación, lo intentamos en la siguiente vuelta
+                self.__record_error(e)
+            else:
+                with self.__lock:
+                    self.__failures = 0
+
+    def __record_error(self, error:Exception) -> None:
+        '''
+        Guarda el error para get_status. Solo se manda a logging (con traceback) cuando cambia, para no repetir
+        el mismo mensaje en cada vuelta si el problema persiste.
+        '''
+        message = f'{type(error).__name__}: {error}'
+        with self.__lock:
+            is_new = message != self.__last_error
+            self.__last_error = message
+            self.__last_error_at = datetime.now(timezone.utc)
+            self.__failures += 1
+            failures = self.__failures
+
+        if is_new:
+            logger.exception('Error writing logs to %s', self.__log_dir)
+        elif failures % 100 == 0:
+            logger.error('Still failing to write logs to %s after %d attempts: %s', self.__log_dir, failures, message)
+
+    def __requeue(self, entries:list) -> None:
+        '''
+        Regresa al inicio de la cola las entradas que no se pudieron escribir, sin pasar de max_queue
+        '''
+        with self.__lock:
+            self.__queue = entries + self.__queue
+            overflow = len(self.__queue) - self.__max_queue
+            if overflow > 0:
+                self.__queue = self.__queue[overflow:]
+                self.__dropped += overflow
+
+    def __write_segment(self, name:str, rows:list) -> None:
+        '''
+        Escribe las entradas como un segmento Arrow IPC nuevo. Se escribe a un archivo temporal y luego se renombra,
+        así nadie lee un segmento a medias. El nombre incluye el pid para que los procesos no choquen entre sí.
+        '''
+        segments_dir = os.path.join(self.__log_dir, name, 'segments')
+        os.makedirs(segments_dir, exist_ok=True)
+
+        table = pa.Table.from_pylist(rows)
+        path = os.path.join(segments_dir, f'{time.time_ns()}-{os.getpid()}-{uuid.uuid4().hex[:8]}.arrow')
+
+        with pa.OSFile(f'{path}.tmp', 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(f'{path}.tmp', path)
+
+    def __compact_segments(self, name:str) -> None:
+        '''
+        Junta los segmentos del log, los escribe como parquet por día y borra los segmentos.
+        Solo se borran los segmentos que se leyeron; los que lleguen mientras tanto se compactan la siguiente vez.
+        '''
+        segments_dir = os.path.join(self.__log_dir, name, 'segments')
+        if not os.path.exists(segments_dir): return
+
+        segments = sorted([file for file in os.listdir(segments_dir) if file.endswith('.arrow')])
+        if len(segments) == 0: return
+
+        tables = []
+        for segment in segments:
+            with pa.memory_map(os.path.join(segments_dir, segment), 'r') as source:
+                tables.append(pa.ipc.open_file(source).read_all())
+
+        # Los tipos pueden variar entre segmentos (eg. una columna que solo trae nulos), se promueven al tipo común
+        table = pa.concat_tables(tables, promote_options='permissive')
+        table = self.__migrate_legacy(name, table)
+        self.__write_days(name, table, f'part-{time.time_ns()}-{os.getpid()}-{uuid.uuid4().hex[:8]}.parquet')
+
+        for segment in segments:
+            os.remove(os.path.join(segments_dir, segment))
+
+    def __migrate_legacy(self, name:str, table:pa.Table) -> pa.Table:
+        '''
+        Pasa el archivo del formato anterior (logs/<log>.parquet, un solo archivo que se reescribía completo) a las
+        particiones por día, con los mismos tipos que los segmentos nuevos para que todas las partes tengan el mismo esquema.
+        El nombre de las partes es fijo, así que si el proceso muere a la mitad la siguiente compactación las vuelve
+        a escribir en lugar de duplicarlas.
+
+        :param table: segmentos que se están compactando
+        :return: los segmentos con los tipos promovidos
+        '''
+        legacy_path = os.path.join(self.__log_dir, f'{name}.parquet')
+        if not os.path.exists(legacy_path): return table
+
+        legacy = pq.read_table(legacy_path)
+        combined = pa.concat_tables([legacy, table], promote_options='permissive')
+        self.__write_days(name, combined.slice(0, legacy.num_rows), 'part-legacy.parquet')
+        os.replace(legacy_path, f'{legacy_path}.migrated')
+        return combined.slice(legacy.num_rows)
+
+    def __write_days(self, name:str, table:pa.Table, part_name:str) -> None:
+        '''
+        Escribe la tabla como un archivo parquet por día en logs/<log>/day=YYYY-MM-DD/<part_name>
+        '''
+        partition_column = self.__partition_columns[name]
+        days = pc.cast(table[partition_column], pa.date32())
+
+        for day in pc.unique(days).to_pylist():
+            day_table = table.filter(pc.equal(days, pa.scalar(day, pa.date32())))
+            day_dir = os.path.join(self.__log_dir, name, f'day={day.isoformat()}')
+            os.makedirs(day_dir, exist_ok=True)
+
+            day_path = os.path.join(day_dir, part_name)
+            suffix = f'{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+            pq.write_table(day_table, f'{day_path}.{suffix}')
+            os.replace(f'{day_path}.{suffix}', day_path)
+
+    def __acquire_lock(self, lock_path:str) -> bool:
+        '''
+        Crea el archivo de lock de forma exclusiva. Si existe pero es muy viejo o el proceso que lo tenía ya no existe
+        (murió a la mitad de una compactación) se reemplaza.
+        '''
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        try:
+            if os.path.exists(lock_path) and self.__lock_is_stale(lock_path):
+                logger.warning('Removing stale log compaction lock %s', lock_path)
+                os.remove(lock_path)
+            descriptor = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except (FileExistsError, FileNotFoundError):
+            return False
+
+        os.write(descriptor, str(os.getpid()).encode())
+        os.close(descriptor)
+        return True
+
+    def __lock_is_stale(self, lock_path:str) -> bool:
+        '''
+        Un lock es viejo si pasó LOCK_TIMEOUT o si el pid que tiene ya no corre en esta máquina
+        '''
+        if time.time() - os.path.getmtime(lock_path) > self.__LOCK_TIMEOUT:
+            return True
+        try:
+            with open(lock_path, 'r') as f:
+                pid = int(f.read().strip())
+        except ValueError:
+            return False # todavía no escribe el pid
+        if pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False # existe, pero es de otro usuario
+        return False
+
+    def __normalize(self, value):
+        '''
+        Convierte los valores de las entradas a tipos que arrow entiende (eg. arreglos de numpy a listas)
+        '''
+        if isinstance(value, (np.ndarray, pd.Index, pd.Series, tuple, set)):
+            return [self.__normalize(item) for item in value]
+        if isinstance(value, list):
+            return [self.__normalize(item) for item in value]
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
@@ -0,0 +1,107 @@
+import json
+import requests
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+
+class MetabaseExporter:
+    '''
+    Esta clase ejecuta queries nativos con el endpoint de exportación de Metabase (/api/dataset/csv), que regresa el resultado
+    completo en un solo CSV en lugar de páginas de 2,000 renglones en JSON.
+
+    La respuesta se lee conforme va llegando con el lector de CSV de pyarrow, con los tipos de las columnas declarados
+    (no se adivinan), así que se puede procesar por bloques sin tener el CSV completo en memoria.
+    Se manda format_rows = false para que los números y fechas vengan sin formato (eg. sin separadores de miles).
+    '''
+    def __init__(self, domain:str, session_id:str=None, api_key:str=None, database_id:int=6, timeout:int=600, session:requests.Session=None) -> None:
+        '''
+        :param domain: url de Metabase, eg. https://prima.metabaseapp.com
+        :param session_id: token de sesión de Metabase
+        :param api_key: api key de Metabase (se usa si no hay session_id)
+        :param database_id: id de la base de datos de Metabase
+        :param timeout: segundos máximos de espera por la respuesta
+        :param session: requests.Session a usar, si no se especifica se crea una nueva
+        '''
+        if session_id is None and api_key is None:
+            raise Exception('Either session_id or api_key must be specified')
+
+        self.__BLOCK_SIZE = 1 << 22 # bytes que se leen por bloque
+
+        self.__url = domain.rstrip('/') + '/api/dataset/csv'
+        self.__headers = {'X-Metabase-Session':session_id} if session_id is not None else {'x-api-key':api_key}
+        self.__database_id = database_id
+        self.__timeout = timeout
+        self.__session = session or requests.Session()
+
+    @classmethod
+    def from_credentials(cls, credentials, session_id:str=None, database_id:int=6) -> 'MetabaseExporter':
+        '''
+        Construye el exportador con las mismas credenciales que MetabaseConnection.
+
+        :param credentials: diccionario o path a un json con metabase_domain y api_key o current-token
+        :param session_id: token de sesión ya autenticado (tiene prioridad sobre el de las credenciales)
+
+        :return: MetabaseExporter, o None si las credenciales no traen el dominio o una forma de autenticarse
+        '''
+        if isinstance(credentials, str):
+            with open(credentials, 'r') as f:
+                credentials = json.load(f)
+
+        domain = credentials.get('metabase_domain')
+        session_id = session_id or credentials.get('current-token')
+        api_key = credentials.get('api_key')
+        if domain is None or (session_id is None and api_key is None):
+            return None
+        return cls(domain, session_id=session_id, api_key=api_key, database_id=database_id)
+
+    def iter_batches(self, query:str, column_types:dict=None):
+        '''
+        Ejecuta el query y regresa el resultado por bloques conforme se va descargando.
+
+        :param query: query nativo (SQL)
+        :param column_types: diccionario columna -> tipo de pyarrow. Las columnas que no vengan se infieren
+        :return: generador de pa.RecordBatch
+        '''
+        payload = {
+            'query':json.dumps({'database':self.__database_id, 'type':'native', 'native':{'query':query}}),
+            'format_rows':'false'
+        }
+        with self.__session.post(self.__url, data=payload, headers=self.__headers, stream=True, timeout=self.__timeout) as response:
+            if response.status_code >= 300:
+                raise Exception(f'Metabase export failed with {response.status_code}: {response.text[:500]}')
+            # Si el query falla Metabase responde con un json en lugar del CSV
+            if 'json' in response.headers.get('Content-Type', ''):
+                raise Exception(f'Metabase export failed: {response.text[:500]}')
+
+            response.raw.decode_content = True
+            reader = pv.open_csv(
+                response.raw,
+                read_options=pv.ReadOptions(block_size=self.__BLOCK_SIZE),
+                convert_options=pv.ConvertOptions(column_types=column_types or {}, strings_can_be_null=True)
+            )
+            empty = True
+            for batch in reader:
+                empty = False
+                yield batch
+            # Si no hay renglones se regresa un bloque vacío para no perder las columnas
+            if empty:
+                yield pa.RecordBatch.from_pylist([], schema=reader.schema)
+
+    def export(self, query:str, column_types:dict=None) -> pa.Table:
+        '''
+        Ejecuta el query y regresa el resultado completo como tabla de arrow
+        '''
+        return pa.Table.from_batches(list(self.iter_batches(query, column_types)))
+
+    def iter_frames(self, query:str, column_types:dict=None):
+        '''
+        Igual que iter_batches pero cada bloque se regresa como pd.DataFrame
+        '''
+        for batch in self.iter_batches(query, column_types):
+            yield batch.to_pandas()
+
+    def query_data(self, query:str, column_types:dict=None) -> pd.DataFrame:
+        '''
+        Ejecuta el query y regresa el resultado completo como pd.DataFrame
+        '''
+        return self.export(query, column_types).to_pandas()
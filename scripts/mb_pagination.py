@@ -0,0 +1,128 @@
+import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from scripts.query_templates import QueryTemplates
+
+if TYPE_CHECKING:
+    from my_apis.mb_connection import MetabaseConnection
+
+class ParallelPaginator:
+    '''
+    Esta clase saca de Metabase los resultados de más de 2,000 renglones en páginas que se piden en paralelo.
+
+    1. Se pide una sola vez el límite inferior de cada página: el query se envuelve en una subconsulta y se numeran los renglones
+       ordenados por id_col (row_number), así cada página tiene a lo más page_size renglones
+    2. Cada página es el query original con el rango [límite, siguiente límite) insertado en los marcadores
+       --insert_where_clause_here y --insert_order_by_clause_here
+    3. Las páginas se piden en paralelo y se regresan en orden de id_col como un generador, así el que llama puede ir procesando
+       cada página sin tener todo el resultado en memoria
+
+    Los renglones con id_col vacío se piden en una página aparte.
+    '''
+    def __init__(self, mbc:'MetabaseConnection', database_id:int=6, page_size:int=1500, max_workers:int=4) -> None:
+        '''
+        :param mbc: conexión a Metabase
+        :param database_id: id de la base de datos de Metabase
+        :param page_size: renglones por página. Se deja abajo de 2,000 porque los ids repetidos en el límite de una página caen en la siguiente
+        :param max_workers: número máximo de páginas que se piden al mismo tiempo
+        '''
+        if not 0 < page_size <= 2000:
+            raise Exception(f'Invalid page size: {page_size}. Metabase returns at most 2000 rows per query')
+
+        self.__WHERE_MARKER = '--insert_where_clause_here'
+        self.__ORDER_BY_MARKER = '--insert_order_by_clause_here'
+
+        self.__mbc = mbc
+        self.__templates = QueryTemplates()
+        self.__database_id = database_id
+        self.__page_size = page_size
+        self.__max_workers = max_workers
+
+    def iter_pages(self, query:str, id_col:str):
+        '''
+        Regresa las páginas del query en orden de id_col.
+
+        :param query: query con los marcadores --insert_where_clause_here y --insert_order_by_clause_here al final
+        :param id_col: columna del resultado por la que se parte el query, idealmente única
+
+        :return: generador de pd.DataFrame, uno por página
+        '''
+        if self.__WHERE_MARKER not in query or self.__ORDER_BY_MARKER not in query:
+            raise Exception(f'Query must include {self.__WHERE_MARKER} and {self.__ORDER_BY_MARKER} to be paginated')
+
+        pages = self.__get_pages(query, id_col)
+        executor = ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix='metabase')
+        try:
+            # Solo se piden por adelantado unas cuantas páginas para no juntar todo en memoria si el que llama es lento
+            pending = deque()
+            for page_query in pages:
+                pending.append(executor.submit(self.__query_page, page_query))
+                if len(pending) >= 2 * self.__max_workers:
+                    yield pending.popleft().result()
+            while len(pending) > 0:
+                yield pending.popleft().result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def query_all(self, query:str, id_col:str) -> pd.DataFrame:
+        '''
+        Regresa el resultado completo del query (todas las páginas juntas)
+        '''
+        pages = [page for page in self.iter_pages(query, id_col) if page.size > 0]
+        if len(pages) == 0:
+            return self.__query_page(self.__page_query(query, 'where 1 = 0', id_col))
+        return pd.concat(pages, ignore_index=True) if len(pages) > 1 else pages[0]
+
+    def __get_pages(self, query:str, id_col:str) -> list:
+        '''
+        Pide los límites de las páginas y arma el query de cada una
+        '''
+        boundaries = self.__query_page(
+            f'''
+            select min(page_id) as lower_bound, count(*) - count(page_id) as nulls
+            from (
+                select {id_col} as page_id, (row_number() over (order by {id_col}) - 1) / {self.__page_size} as page_number
+                from (
+                    {self.__strip(query)}
+                ) as paginated_query
+            ) as pages
+            group by page_number
+            order by page_number
+            '''
+        )
+
+        lower_bounds = sorted(boundaries.lower_bound.dropna().unique().tolist())
+        pages = []
+        for i, lower_bound in enumerate(lower_bounds):
+            where = f'where {id_col} >= {self.__templates.to_literal(lower_bound)}'
+            if i + 1 < len(lower_bounds):
+                where += f' and {id_col} < {self.__templates.to_literal(lower_bounds[i + 1])}'
+            pages.append(self.__page_query(query, where, id_col))
+
+        if boundaries.nulls.sum() > 0:
+            pages.append(self.__page_query(query, f'where {id_col} is null', id_col))
+        return pages
+
+    def __page_query(self, query:str, where:str, id_col:str) -> str:
+        return (
+            query
+            .replace(self.__WHERE_MARKER, where, 1)
+            .replace(self.__ORDER_BY_MARKER, f'order by {id_col}', 1)
+        )
+
+    def __query_page(self, query:str) -> pd.DataFrame:
+        '''
+        Ejecuta una página. Si aun así pasa de 2,000 renglones (muchos ids repetidos) no se puede partir más
+        '''
+        try:
+            return self.__mbc.query_data(query, database_id=self.__database_id)
+        except UserWarning:
+            raise Exception('A page returned more than 2000 rows. Use a more unique id_col or a smaller page_size')
+
+    def __strip(self, query:str) -> str:
+        '''
+        Quita los marcadores y el ; final para poder usar el query como subconsulta
+        '''
+        query = query.replace(self.__WHERE_MARKER, '').replace(self.__ORDER_BY_MARKER, '').strip()
+        return query.rstrip(';').strip() + '\n'
@@ -1,89 +1,44 @@
-import os
+import io
 import warnings
-import numpy as np
 import pandas as pd
 import geopandas as gpd
-from datetime import datetime, timezone
+from datetime import datetime
 import matplotlib.pyplot as plt
-from my_apis.sf_connection import SalesforceConnection
-from my_apis.mb_connection import MetabaseConnection
 from matplotlib.colors import LinearSegmentedColormap
+from scripts.reference_data import ReferenceDataManager, ReferenceSnapshot
+from scripts.result_cache import ResultCache
+from scripts.log_writer import LogWriter
 
 class MPsFinder:
     '''
-    Esta clase tiene toda la funcionalidad necesaria para busar MPs con base en productos y estados seleccionados
+    Esta clase tiene toda la funcionalidad necesaria para busar MPs con base en productos y estados seleccionados.
+    Los datos de referencia viven en un ReferenceDataManager compartido por todas las sesiones; aquí solo se guarda
+    la identidad del usuario y el registro de sus búsquedas.
+
+    Los logins y búsquedas se encolan en un LogWriter (también compartido), que los escribe a disco en segundo plano.
     '''
-    def __init__(self, sfc:SalesforceConnection, mbc:MetabaseConnection, user:str) -> None:
+    def __init__(self, data:ReferenceDataManager, user:str, logs:LogWriter, cache_size:int=128) -> None:
         warnings.filterwarnings('error') # Para poder cachar warnings como exceptions.
 
-        self.__DATABASE_ID = 6
         self.__RM_SEARCH_LOG_TEMPLATE = 'templates/rm_search_log_template.xlsx'
         self.__LOGIN_LOG_TEMPLATE = 'templates/login_log_template.xlsx'
         self.__MPS_SEARCH_LOG_TEMPLATE = 'templates/mps_search_log_template.xlsx'
-        self.__MEXICO_SHAPEFILE = 'templates/mexico-shapefile.shp'
 
-        self.__RM_SEARCH_LOG = 'logs/rm_search_log.parquet'
-        self.__MPS_SEARCH_LOG = 'logs/mps_search_log.parquet'
-        self.__LOGIN_LOG = 'logs/login_log.parquet'
+        self.__RM_SEARCH_LOG = 'rm_search_log'
+        self.__MPS_SEARCH_LOG = 'mps_search_log'
+        self.__LOGIN_LOG = 'login_log'
     
-        self.__sfc = sfc
-        self.__mbc = mbc
+        self.__data = data
         self.__user = user
-        self.__catalogue = self.__load_catalogue()
-        self.__states = self.__load_states()
-        self.__addresses = self.__load_addresses()
-        self.__mps = self.__load_mps()
-        self.__rm_mps = self.__load_rm_mps(interval_days=30)
-        self.__rm_mps_db = self.__load_rm_mps_db()
-        self.__mexico_shapefile = gpd.read_parquet(self.__MEXICO_SHAPEFILE)
-
-        self.__start_search_log(self.__RM_SEARCH_LOG_TEMPLATE, self.__RM_SEARCH_LOG)
-        self.__start_search_log(self.__LOGIN_LOG_TEMPLATE, self.__LOGIN_LOG)
-        self.__start_search_log(self.__MPS_SEARCH_LOG_TEMPLATE, self.__MPS_SEARCH_LOG)
-
-        self.__register_login()
+        self.__logs = logs
+        self.__results = ResultCache(max_entries=cache_size)
 
-    def __load_addresses(self) -> pd.DataFrame:
-        '''
-        Esta función carga las direcciones de los MPs
-        '''
-        direcciones = self.__execute_query_in_sf(
-            query='queries/addresses.sql',
-            is_path=True,
-            rename_output={'Account__c':'mp_id', 'location__StateCode__s':'state_code'}
-        )
-        return direcciones
-        
-    def __load_mps(self) -> pd.DataFrame:
-        '''
-        Esta función carga los MPs de manufactura para poder filtrarlos como se desee.
-        '''
-        rename_dict = {
-            'Account_Status__c':'status',
-            'Completed_Work_Orders__c':'wos',
-            'Number_of_RFQs_MP_has_quoted__c':'quotes', 
-            'NDA_status__c':'nda',
-            'truora_test__c':'truora',
-            'syntage_test__c':'syntage',
-            'Id':'mp_id'
-        }
+        self.__logs.add_log(self.__RM_SEARCH_LOG, self.__RM_SEARCH_LOG_TEMPLATE)
+        self.__logs.add_log(self.__LOGIN_LOG, self.__LOGIN_LOG_TEMPLATE)
+        self.__logs.add_log(self.__MPS_SEARCH_LOG, self.__MPS_SEARCH_LOG_TEMPLATE)
 
-        mps = self.__execute_query_in_sf(
-            query='queries/mps_manufacturing.sql',
-            is_path=True,
-            rename_output=rename_dict
-        )
+        self.__register_login()
 
-        capabilities = (
-            mps
-            .rename(lambda x: x.replace('_capability__c', ''), axis=1)
-            .rename(lambda x: x.replace('__c', ''), axis=1)
-            .merge(self.__addresses, on='mp_id', how='inner')
-            .merge(self.__states, on='state_code')
-            .query('main_process != "Material Sourcing"') # Quitamos a los MPs de raw materials
-        )
-        return capabilities
-    
     def get_picklists_lists(self) -> tuple:
         '''
         Esta función regresa las opciones disponibles de filtrado y de display para las columnas que se usan en los MPs de manufactura.
@@ -91,7 +46,7 @@ class MPsFinder:
 
         :return: (list of filter columns, list of display columns, list of main processes)
         '''
-        main_processes = self.__mps.main_process.dropna().unique().tolist()
+        main_processes = self.__data.get_snapshot().mps.main_process.dropna().unique().tolist()
         
         filter_columns = [
             'machining',
@@ -122,33 +77,43 @@ class MPsFinder:
     def filter_mps_manufacturing(self, chosen_processes:list, chosen_state:str, show_columns:list, only_active:bool, only_developing:bool, search_region:bool, main_process:str) -> pd.DataFrame:
         '''
         Esta función busca a los MPs que hagan match con los filtros que se quieran aplicar.
+        Los resultados se guardan en el cache, lo que se regresa es una copia (la selección de columnas) que sí se puede modificar.
         '''
-        mps_db = self.__mps
+        data = self.__data.get_snapshot()
+        processes = sorted(set(chosen_processes))
+        show_columns = tuple(column for column in show_columns if column != 'Name')
+
+        key = ('manufacturing', tuple(processes), chosen_state, show_columns, bool(only_active), bool(only_developing), bool(search_region), main_process)
+        result = self.__results.get_or_compute(
+            key,
+            data.version,
+            lambda: self.__filter_mps_manufacturing(data, processes, chosen_state, list(show_columns), only_active, only_developing, search_region, main_process)
+        )
+
+        # El cache se guarda con los procesos ordenados, aquí regresamos las columnas en el orden en que se pidieron
+        other_columns = [column for column in result.columns if column not in processes]
+        return result[other_columns + list(dict.fromkeys(chosen_processes))].copy()
+
+    def __filter_mps_manufacturing(self, data:ReferenceSnapshot, chosen_processes:list, chosen_state:str, show_columns:list, only_active:bool, only_developing:bool, search_region:bool, main_process:str) -> pd.DataFrame:
+        '''
+        Esta función hace la búsqueda de MPs de manufactura sobre el índice de capabilities de la foto especificada.
+        '''
+        index = data.mps_index
         # 1. Encontramos las columnas por las cuales vamos a ordenar
-        sort_columns = ['total_processes']
         available_sort_columns = ['wos', 'quotes', 'global_score'] # Estas son las que están disponibles para ordenar dentro de las opciones
-        sort_columns.extend(list(set(available_sort_columns).intersection(set(show_columns))))
-        show_columns.append('Name')
+        sort_columns = [column for column in available_sort_columns if column in show_columns]
 
 
         # 2. Filtramos ubicaciones dependiendo de lo que quieran
+        chosen_region = None
         if search_region:
-            chosen_region = self.__states.query('state == @chosen_state').region.values[0]
-            location_filter = mps_db.query('region == @chosen_region')
+            chosen_region = index.get_region(chosen_state)
+            chosen_state = None
             show_columns.append('state')
-        else: 
-            location_filter = mps_db.query('state == @chosen_state')
 
 
         # 3. Filtramos el status deseado (o ninguno)
-        if only_active and only_developing: 
-            status_filter = location_filter.query('wos > 0 or quotes > 0')
-        elif only_active: 
-            status_filter = location_filter.query('wos > 0')
-        elif only_developing: 
-            status_filter = location_filter.query('status == "Developing MP (Quoted)"')
-        else: 
-            status_filter = location_filter
+        developing_status = 'Developing MP (Quoted)' if only_developing and not only_active else None
 
 
         # 4. Filtramos solo aquellos del main process deseado
@@ -164,283 +129,73 @@ class MPsFinder:
             'light_fab':'Light Fabrication',
             'other':'Other'
         }
-        process_filter = status_filter
         if main_process is not None: 
             main_process = process_name_match[main_process]
-            process_filter = status_filter.query('main_process == @main_process')
 
 
+        # 5. Buscamos en el índice (los procesos que se quieren) y ordenamos
+        rows = index.search(
+            capabilities=chosen_processes,
+            state=chosen_state,
+            region=chosen_region,
+            min_wos=only_active,
+            min_quotes=only_active and only_developing,
+            status=developing_status,
+            main_process=main_process
+        )
+        rows = index.sort(rows, capabilities=chosen_processes, sort_columns=sort_columns)
+
         filtered_values = (
-            process_filter
-            .query(' or '.join(chosen_processes)) # filtramos los procesos que se quiere
-            .drop_duplicates(subset=['Name'])
-            .set_index(show_columns)
-            [chosen_processes]
-            .astype(int)
-            .assign(total_processes=lambda x: x.sum(axis=1))
-            .sort_values(sort_columns, ascending=False)
-            .drop(['total_processes'], axis=1)
-            .astype(bool)
-            .reset_index()
+            pd.concat(
+                (index.get_rows(rows, show_columns + ['Name']).reset_index(drop=True), index.get_capabilities(rows, chosen_processes)),
+                axis=1
+            )
             .set_index('Name')
         )
         return filtered_values
         
-    def __start_search_log(self, log_template:str, log_path:str) -> bool:
-        '''
-        Esta función inicia un nuevo search log. Literal lo único que hace es leer el template
-        de excel y lo pasa a un parquet
-
-        :param log_template: ubicación del archivo excel con el formato del log
-        :param log_path: dónde se quiere guardar el nuevo archivo
-
-        :return: booleano indicando si el archivo se creó (True) o si no se creó pues ya existía (False)
-
-        Eg. start_search_log('../templates/raw_materials_search_log.xlsx', '../rm_search_log.parquet')
+    def get_cache_stats(self) -> dict:
         '''
-        search_log_extension = log_path.split('.')[-1]
-        template_extension = log_template.split('.')[-1]
-        
-        if search_log_extension != 'parquet':
-            raise Exception('Search log file must be parquet type')
-
-        # Revisamos que el search log no exista, porque sino lo sobreescribiríamos
-        if os.path.exists(log_path): 
-            return False
-            
-        if template_extension == 'xlsx':
-            template = pd.read_excel(log_template)
-        elif template_extension == 'csv':
-            template = pd.read_csv(log_template)
-        else:
-            raise Exception(f'Unsupported format for template: {template_extension}')
-
-        template.to_parquet(log_path, index=False)
-        return True
-    
-    def __add_search_log_entry(self, search_log_path:str, entry_dict:dict) -> None:
+        Regresa los contadores del cache de búsquedas de la sesión (hits, misses, evictions, invalidations, entries)
         '''
-        Esta función se encarga de registrar una búsqueda en el log de búsquedas.
-        La ventaja es que funciona para cualquier tipo de log, sin importar si las columnas son diferentes.
-        Esto es útil si las búsquedas tienen diferentes parámetros que se quieren guardar.
-
-        :param search_log_path: ubicación del archivo parquet del log que se está usando
-        :param entry_dict: diccionario con los datos de la nueva entrada. Se verifica que las columnas coincidan
-        '''
-        # Convertimos el diccionario a dataframe
-        search_log_extension = search_log_path.split('.')[-1]
-        
-        if search_log_extension != 'parquet':
-            raise Exception(f'Unsupported format for search log: {search_log_extension}')
-
-        try:
-            search_log = pd.read_parquet(search_log_path)
-        except FileNotFoundError:
-            self.__start_search_log(self.__RM_SEARCH_LOG_TEMPLATE, self.__RM_SEARCH_LOG)
-            search_log = pd.read_parquet(search_log_path)
-        new_entry = pd.DataFrame({key: [value] for key, value in entry_dict.items()})
-        
-        # Verificamos que las columnas coincidan con las del search log
-        cols_are_equal = set(search_log.columns) == set(new_entry.columns)
-        
-        if not cols_are_equal: 
-            missing_cols = set(search_log.columns) - set(new_entry.columns)
-            raise Exception(f'Missing columns in new entry: {missing_cols}')
-            
-        # Juntamos los dataframes y los guardamos
-        # Nos aseguramos de que no esté vacío el log actual, porque sino es mamona la chingadera esta
-        if search_log.size > 0:
-            pd.concat((search_log, new_entry), ignore_index=True).to_parquet(search_log_path, index=False)
-        else:
-            new_entry.to_parquet(search_log_path, index=False)
+        return self.__results.get_stats()
 
     def get_product_catalgue(self) -> pd.DataFrame:
-        return self.__catalogue
+        return self.__data.get_snapshot().catalogue
     
     def get_mps_db(self) -> pd.DataFrame:
-        return self.__rm_mps_db
+        return self.__data.get_snapshot().rm_mps_db
     
     def get_states(self) -> pd.DataFrame:
-        return self.__states
+        return self.__data.get_snapshot().states
     
     def get_mps(self) -> pd.DataFrame:
-        return self.__rm_mps
-
-    def __execute_query_in_sf(self, query:str, is_path:bool=False, rename_output:dir={}) -> pd.DataFrame:
-        '''
-        Esta función ejecuta un query en salesforce y regresa los resultados en un dataframe.
-        '''
-        if is_path:
-            with open(query, 'r') as f:
-                query = f.read()
-
-        sf_data = (
-            self
-            .__sfc
-            .extract_data(query)
-            .rename(rename_output, axis=1)
-        )
-        
-        return sf_data
-    
-    def __execute_query_in_mb(self, query:str, is_path:bool=False, id_col:str=None) -> pd.DataFrame:
-        '''
-        Esta función ejectua un query en metabase y regresa los resultados en un dataframe.
-
-        :param query: el query a ejecutar, puede ser el path a un sql file.
-        :param is_path: wether or not to load the query from the specified file 
-        :param id_col: id_col es necesario cuando se extraen más de 2,000 registros de MB porque es por el que se ordenan para poder sacarlos todos.
-        '''
-        if is_path:
-            with open(query, 'r') as f:
-                query = f.read()
-
-        try:
-            mb_data = (
-                self
-                .__mbc
-                .query_data(query, database_id=self.__DATABASE_ID)
-            )
-        except UserWarning:
-            assert id_col is not None, "Es necesario especificar id_col"
-            mb_data = (
-                self
-                .__mbc
-                .query_more_data(query, database_id=self.__DATABASE_ID, id_col=id_col)
-            )
-
-        return mb_data
-
-    def __load_catalogue(self) -> pd.DataFrame:
-        '''
-        Esta función saca el catálogo de productos de raw materials de Salesforce.
-
-        :return: catálogo en df
-        '''
-        catalogue = self.__execute_query_in_sf(
-            query='queries/products_catalogue.sql', 
-            is_path=True, 
-            rename_output={'Id':'product_id', 'Name':'product_name', 'Family':'product_family', 'rm_material__c':'material'}
-        )
-        return catalogue
-    
-    def __load_rm_mps(self, interval_days:int=30) -> pd.DataFrame:
-        '''
-        Esta función carga la lista de MPs y sus nombres.
-
-        :param interval_days: el número de días a considerar para buscar los quotes y wos que los MPs han hecho.
-        '''
-        mps = self.__execute_query_in_sf(
-            query='queries/mps_names.sql',
-            is_path=True,
-            rename_output={'Id':'mp_id', 'Name':'mp_name', 'Account_Status__c':'status', 'supply_chain_category__c':'mp_type', 'global_score__c':'score'}
-        )
-
-        docs_on_interval = self.__load_docs_on_interval(interval_days=interval_days)
-
-        mps = (
-            mps
-            .merge(docs_on_interval, on='mp_id', how='left')
-            .fillna({'quotes':0, 'wos':0})
-            .astype({'quotes':int, 'wos':int})
-        )
-
-        return mps
-    
-    def __date_on_interval(self, date:pd.DatetimeIndex, n_days:int=30) -> bool:
-        '''
-        Esta función verifica si la fecha dada está en el intervalo de días especificado a partir del día de hoy.
-
-        :param date: fecha a evaluar
-        :param n_days: número de días en el intervalo a considerar
-
-        :return: booleano si la fecha está o no en ese intervalo
-        '''
-        fecha_actual = datetime.now(timezone.utc)
-        diferencia = (fecha_actual - date).days
-        return abs(diferencia) <= n_days
-    
-    def __load_docs_on_interval(self, interval_days:int=30) -> pd.DataFrame:
-        '''
-        Esta función carga el número de quotes y working orders que los MPs han tenido en el intervalo de tiempo especificado.
-
-        :param interval_days: número de días hacia atrás a partir de hoy a considerar.
-
-        :return: dataframe con columnas mp_id (sf id for accounts), qutoes, wos correspondiente al número de documentos en el intervalo
-        '''
-        docs_data = self.__execute_query_in_mb(
-            query='queries/docs_on_interval.sql',
-            is_path=True,
-            id_col='doc_id'
-        )
+        return self.__data.get_snapshot().rm_mps
 
-        docs_on_interval = (
-            docs_data
-            .assign(
-                doc_date=lambda x: pd.to_datetime(x.doc_date, format='ISO8601'),
-                on_interval=lambda df: df.doc_date.apply(lambda x: self.__date_on_interval(x, interval_days))
-            )
-            .query('on_interval')
-            .pivot_table(
-                index='mp_id',
-                columns='tipo',
-                values='doc_id',
-                aggfunc='count',
-                fill_value=0
-            )
-            .reset_index()
-        )
-        return docs_on_interval
-
-    def __load_states(self) -> pd.DataFrame:
+    def filter_mps_raw_materials(self, products:list, state:str, show_region_mps:bool, show_quotes:bool, show_wos:bool, show_status:bool, show_type:bool, show_score:bool, interval_days:int=30) -> pd.DataFrame:
         '''
-        Esta función carga los estados y sus códigos
+        Esta función busca los mps que hagan match con los filtros especificados.
 
-        :return: pd.DataFrame con los estados y sus códigos
-        '''
-        state_codes = (
-            self
-            .__execute_query_in_sf(
-                query='queries/states.sql',
-                is_path=True,
-                rename_output={'States__c':'state', 'state_code__c':'state_code', 'Region__c':'region'}
-            )
-            .replace({'Ciudad de México':'Mexico City'})
-        )
-        return state_codes 
-    
-    def __load_rm_mps_db(self) -> pd.DataFrame:
-        '''
-        Esta función se encarga de crear un dataframe con los MPs, sus respectivas ubicaciones y productos
+        :param products: lista con los nombres de los productos
+        :param state: string con el nombre del estado que se desea buscar
+        :param interval_days: número de días hacia atrás con los que se cuentan los quotes y wos
 
-        :return: pd.DataFrame
+        :return: dataframe formateado para el display (copia del que se guarda en el cache, se puede modificar)
         '''
-        existing_products = self.__execute_query_in_sf(
-            query='queries/mps_products.sql',
-            is_path=True,
-            rename_output={'product__c':'product_id', 'account__c':'mp_id'}
-        )
+        data = self.__data.get_snapshot()
+        flags = tuple(bool(flag) for flag in (show_region_mps, show_quotes, show_wos, show_status, show_type, show_score))
 
-        direcciones = self.__addresses
-
-        db = (
-            direcciones
-            .merge(self.__rm_mps, on='mp_id', how='left')
-            .merge(self.__states, on='state_code')
-            .merge(existing_products, on='mp_id')
-            .merge(self.__catalogue, on='product_id')
+        key = ('raw_materials', tuple(sorted(set(products))), state, flags, int(interval_days))
+        result = self.__results.get_or_compute(
+            key,
+            data.version,
+            lambda: self.__filter_mps_raw_materials(data, products, state, *flags, interval_days=interval_days)
         )
+        return result.copy()
 
-        return db
-
-    def filter_mps_raw_materials(self, products:list, state:str, show_region_mps:bool, show_quotes:bool, show_wos:bool, show_status:bool, show_type:bool, show_score:bool) -> pd.DataFrame:
+    def __filter_mps_raw_materials(self, data:ReferenceSnapshot, products:list, state:str, show_region_mps:bool, show_quotes:bool, show_wos:bool, show_status:bool, show_type:bool, show_score:bool, interval_days:int) -> pd.DataFrame:
         '''
-        Esta función busca los mps que hagan match con los filtros especificados.
-
-        :param products: lista con los nombres de los productos
-        :param state: string con el nombre del estado que se desea buscar
-
-        :return: dataframe formateado para el display
+        Esta función hace la búsqueda de MPs de raw materials sobre el índice de productos de la foto especificada.
         '''
         pivot_index = ['mp_name']
         if show_quotes: pivot_index.append('quotes')
@@ -448,41 +203,44 @@ class MPsFinder:
         if show_status: pivot_index.append('status')
         if show_type: pivot_index.append('mp_type')
         if show_score: pivot_index.append('score')
-    
+
+        index = data.rm_index
+
         if not show_region_mps:
-            search_result = (
-                self
-                .__rm_mps_db
-                .query('product_name in @products')
-                .query('state == @state')
-                .drop_duplicates(subset=['mp_id', 'product_id'])
-                .pivot(index=pivot_index, columns='product_name', values='state')
-                .fillna(0)
-                .astype(bool)
-                .assign(total_products=lambda x: x.sum(axis=1))
-                .sort_values('total_products', ascending=False)
-                .reset_index()
-                .set_index('mp_name')
-            )
+            rows = index.search(products, state=state)
+            sort_columns = []
         else:
-            state_region = self.__states.query('state == @state').region.values[0]
+            state_region = index.get_region(state)
             pivot_index.append('state')
-            search_result = (
-                self
-                .__rm_mps_db
-                .query('product_name in @products')
-                .query('region == @state_region')
-                .drop_duplicates(subset=['mp_id', 'product_id'])
-                .pivot(index=pivot_index, columns='product_name', values='state')
-                .fillna(0)
-                .astype(bool)
-                .assign(total_products=lambda x: x.sum(axis=1))
-                .sort_values(['total_products', 'state'], ascending=False)
-                .reset_index()
-                .set_index('mp_name')
-                .rename({'state':state_region}, axis=1)
-            )
-        return search_result.drop(['total_products'], axis=1)
+            rows = index.search(products, region=state_region)
+            sort_columns = ['state']
+
+        search_result = (
+            index
+            .get_rows(rows, ['mp_id', 'product_name', 'quotes', 'wos'] + [column for column in pivot_index if column not in ('quotes', 'wos')])
+            .pipe(self.__set_activity_window, data=data, interval_days=interval_days)
+            .pipe(index.get_product_matrix, index_columns=pivot_index, sort_columns=sort_columns)
+            .set_index('mp_name')
+        )
+        if show_region_mps:
+            search_result = search_result.rename({'state':state_region}, axis=1)
+        return search_result
+
+    def __set_activity_window(self, db:pd.DataFrame, data, interval_days:int) -> pd.DataFrame:
+        '''
+        Esta función reemplaza los quotes y wos de los MPs encontrados por los de la ventana especificada.
+        Los conteos salen del índice de actividad diaria, así que cambiar la ventana no hace queries nuevos.
+        Todas las ventanas (incluida la de 30 días con la que se arma rm_mps_db) se calculan igual, con el índice de la misma foto.
+        '''
+        window = data.activity.window_counts(interval_days)
+        db = (
+            db
+            .drop(['quotes', 'wos'], axis=1)
+            .merge(window, on='mp_id', how='left')
+            .fillna({'quotes':0, 'wos':0})
+            .astype({'quotes':int, 'wos':int})
+        )
+        return db
     
     def register_raw_materials_search(self, products:list, state:str, chosen_mps:list, show_region_mps:bool, show_quotes:bool, show_wos:bool, show_status:bool, show_type:bool, show_score:bool) -> None:
         '''
@@ -503,7 +261,7 @@ class MPsFinder:
             'score':show_score
         }
 
-        self.__add_search_log_entry(search_log_path=self.__RM_SEARCH_LOG, entry_dict=entry_dict)
+        self.__logs.write(self.__RM_SEARCH_LOG, entry_dict)
 
     def register_mps_search(self, processes:list, state:str, display_columns:list, show_active:bool, show_developing:bool, search_region:bool, main_process, chosen_mps:list):
         '''
@@ -522,7 +280,7 @@ class MPsFinder:
             'chosen_mps':chosen_mps
         }
 
-        self.__add_search_log_entry(self.__MPS_SEARCH_LOG, entry_dict)
+        self.__logs.write(self.__MPS_SEARCH_LOG, entry_dict)
 
     def __register_login(self) -> None:
         '''
@@ -533,7 +291,7 @@ class MPsFinder:
             'user':self.__user
         }
 
-        self.__add_search_log_entry(search_log_path=self.__LOGIN_LOG, entry_dict=entry_dict)
+        self.__logs.write(self.__LOGIN_LOG, entry_dict)
     
     def get_contact_info(self, mps:list) -> pd.DataFrame:
         '''
@@ -543,24 +301,19 @@ class MPsFinder:
 
         :return: pd.DataFrame con los contactos, regresa None si no hay contactos relacionados
         '''
-        chosen_mps_ids = self.__rm_mps.query('mp_name in @mps').mp_id.values.tolist()
+        # Solo necesitamos los nombres, así no se cargan los quotes y wos de Metabase
+        mps_names = self.__data.get_snapshot().mps_names
+        chosen_mps_ids = mps_names.query('mp_name in @mps').mp_id.values.tolist()
         if len(chosen_mps_ids) == 0: return None
 
-        query = f'''
-        select AccountId, LastName, FirstName, Phone, MobilePhone, Email, Title
-        from Contact
-        where {' or '.join([f"AccountId = '{mp_id}'" for mp_id in chosen_mps_ids])}
-        '''
+        aux_contacts = self.__data.get_contacts_cache().get(chosen_mps_ids)
+        if aux_contacts.size == 0: return None
 
-        try:
-            aux_contacts = self.__execute_query_in_sf(query)
-        except KeyError:
-            return None
         mps_contacts = (
             aux_contacts
             .dropna(subset=['Phone', 'MobilePhone', 'Email', 'Title'], how='all')
             .rename({'AccountId':'mp_id'}, axis=1)
-            .merge(self.__rm_mps[['mp_id', 'mp_name']], on='mp_id')
+            .merge(mps_names[['mp_id', 'mp_name']], on='mp_id')
             .set_index('mp_name')
             .drop(['mp_id'], axis=1)
             .dropna(axis=1, how='all')
@@ -568,27 +321,47 @@ class MPsFinder:
 
         return mps_contacts
     
+    def prefetch_contacts(self, mps:list, top_n:int=20) -> None:
+        '''
+        Carga en segundo plano los contactos de los primeros MPs de una búsqueda, para que ya estén listos cuando el usuario los elija.
+
+        :param mps: lista con los nombres de los MPs en el orden en que se muestran
+        :param top_n: número de MPs a precargar
+        '''
+        mps = list(mps)[:top_n]
+        if len(mps) == 0: return
+
+        mps_names = self.__data.get_snapshot().mps_names
+        mps_ids = mps_names.query('mp_name in @mps').mp_id.values.tolist()
+        self.__data.get_contacts_cache().prefetch(mps_ids)
+    
     def __query_product_for_plot(self, product:str) -> gpd.GeoDataFrame:
         '''
         Esta función busca los lugares donde el producto está disponible y regresa el conteo con los nombres de los MPs que hay
 
         :param product: nombre del producto
 
-        :return: dataframe con columnas state, geometry, total y mps (lista de nombres)
+        :return: dataframe con columnas state, geometry, total y mps (lista de nombres), copia del que se guarda en el cache
+        '''
+        data = self.__data.get_snapshot()
+        result = self.__results.get_or_compute(
+            ('product_plot', product),
+            data.version,
+            lambda: self.__count_product_by_state(data, product)
+        )
+        return result.copy()
+
+    def __count_product_by_state(self, data:ReferenceSnapshot, product:str) -> gpd.GeoDataFrame:
+        '''
+        Esta función cuenta en cuántos MPs de cada estado está disponible el producto.
+        Los conteos ya vienen precalculados para todos los productos, aquí solo se pegan al mapa.
         '''
-        # Filtramos los datos
         result = (
-            self
-            .__rm_mps_db
-            .query('product_name == @product')
-            .groupby('state')
-            .agg(
-                total=pd.NamedAgg('state', 'count'),
-                mps=pd.NamedAgg('mp_name', lambda x: np.unique(x))
-            )
-            .reset_index()
+            data
+            .product_states
+            .get_counts(product)
             .pipe(
-                lambda df: self.__mexico_shapefile.merge(df, on='state', how='left')
+                lambda df: data.mexico_shapefile.merge(df, on='state', how='left')
             )
         )
         return result
@@ -603,15 +376,66 @@ class MPsFinder:
         :return: Figure con el mapa hecho, data to display
         '''
         plot_data = self.__query_product_for_plot(product=product)
+        fig = self.__draw_product_map(plot_data, quantiles)
+        return fig, plot_data
 
-        fig, ax = plt.subplots(figsize=(6,5))
-        ax.axis('off')
+    def render_product_availability(self, product:str, quantiles:bool=False, fmt:str='png') -> tuple:
+        '''
+        Esta función regresa el mapa de disponibilidad del producto ya renderizado.
+        Las imágenes se guardan en un cache compartido por todas las sesiones, así que los productos
+        que se consultan seguido no se vuelven a dibujar hasta que cambien los datos.
+
+        :param product: nombre del producto que se busca
+        :param quantiles: si se quiere mostrar por cuantiles o los números totales
+        :param fmt: formato de la imagen (png o svg)
+
+        :return: bytes de la imagen, data to display
+        '''
+        if fmt not in ('png', 'svg'):
+            raise Exception(f'Unsupported image format: {fmt}')
+
+        data = self.__data.get_snapshot()
+        plot_data = self.__query_product_for_plot(product=product)
+
+        render_cache = self.__data.get_render_cache()
+        key = ('product_availability', product, bool(quantiles), fmt, data.version)
+        image = render_cache.get(key)
+        if image is None:
+            fig = self.__draw_product_map(plot_data, quantiles)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format=fmt, dpi=200, bbox_inches='tight')
+            image = buffer.getvalue()
+            render_cache.put(key, image)
+
+        return image, plot_data
+
+    def map_product_availability(self, product:str, quantiles:bool=False) -> tuple:
+        '''
+        Esta función arma el mapa interactivo (pydeck) de disponibilidad del producto.
+        La geometría ya viene simplificada y el navegador es el que dibuja el mapa, así que aquí solo se calculan los colores.
 
+        :param product: nombre del producto que se busca
+        :param quantiles: si se quiere mostrar por cuantiles o los números totales
+
+        :return: pdk.Deck con el mapa, data to display
+        '''
+        data = self.__data.get_snapshot()
+        plot_data = self.__query_product_for_plot(product=product)
+        deck = data.mexico_map.build_deck(plot_data[['state', 'total']], quantiles=quantiles)
+        return deck, plot_data
+
+    def __draw_product_map(self, plot_data:gpd.GeoDataFrame, quantiles:bool) -> plt.Figure:
+        '''
+        Esta función dibuja el mapa de disponibilidad. Si no se pueden usar cuantiles (eg. hay muy pocos valores distintos)
+        se dibujan los números totales en una figura nueva.
+        '''
         color_inicio = '#ede0d4'
         color_fin = '#1b263b'
         linear_cmap = self.__create_linear_colormap(color_inicio, color_fin)
 
         if quantiles:
+            fig, ax = plt.subplots(figsize=(6,5))
+            ax.axis('off')
             try:
                 plot_data.plot(
                     ax=ax, # especificamos el axis que usará
@@ -624,27 +448,32 @@ class MPsFinder:
                     },
                     scheme='quantiles'
                 )
+                fig.tight_layout()
+                plt.close(fig)
+                return fig
             except UserWarning:
-                # Si hay un error por haber intentado usar cuantiles, mandamos la otra forma y ya
-                return self.plot_product_availability(product, False)
-        else:
-            plot_data.plot(
-                ax=ax, # especificamos el axis que usará
-                column='total', # columna que se usará para el color de los distintos estados
-                legend=False,
-                legend_kwds={
-                    "label": "Area", 
-                    "orientation": "horizontal"
-                },
-                cmap=linear_cmap,
-                missing_kwds={
-                    "color": "#e5e5e5",
-                    "label": "Missing values",
-                }
-            )
+                # Si no se pudieron usar cuantiles tiramos esta figura y dibujamos los totales
+                plt.close(fig)
+
+        fig, ax = plt.subplots(figsize=(6,5))
+        ax.axis('off')
+        plot_data.plot(
+            ax=ax, # especificamos el axis que usará
+            column='total', # columna que se usará para el color de los distintos estados
+            legend=False,
+            legend_kwds={
+                "label": "Area", 
+                "orientation": "horizontal"
+            },
+            cmap=linear_cmap,
+            missing_kwds={
+                "color": "#e5e5e5",
+                "label": "Missing values",
+            }
+        )
         fig.tight_layout()
-        plt.close()
-        return fig, plot_data 
+        plt.close(fig)
+        return fig
         
     def __hex_to_rgb(self, hex_color):
         """
@@ -0,0 +1,257 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import pandas as pd
+from scripts.single_flight import SingleFlight
+
+class QueryCache:
+    '''
+    Esta clase guarda en disco (cache/queries) los resultados de los queries de Metabase y Salesforce como parquet,
+    para que el mismo query que se repite en pocos minutos (en otra sesión, en otra página o en otro proceso) se lea local.
+
+    Cada entrada tiene un parquet con el resultado y un json con su origen, su ttl y los objetos que consulta
+    (las tablas o sObjects que aparecen en from/join). Así, después de escribir en Salesforce se pueden borrar solo
+    los resultados que leen ese objeto (invalidate).
+
+    El tamaño total está acotado: cuando se pasa de max_bytes se borran primero las entradas caducadas y luego las que
+    se usaron hace más tiempo (cada lectura actualiza la fecha de modificación del archivo).
+    Los archivos se escriben a un temporal y luego se reemplazan, así que nadie lee un resultado a medias.
+
+    get_or_fetch además junta las llamadas simultáneas con la misma llave (SingleFlight), así que todas las sesiones
+    del proceso que comparten este cache hacen una sola consulta aunque pidan lo mismo al mismo tiempo.
+
+    Los resultados se regresan como dataframes nuevos en cada lectura, pero los que se acaban de pedir a la fuente
+    se regresan tal cual (y se comparten entre las llamadas que esperaron), así que NO se deben modificar.
+    '''
+    def __init__(self, cache_dir:str='cache/queries', max_bytes:int=256 * 1024 * 1024) -> None:
+        '''
+        :param cache_dir: carpeta donde se guardan los resultados
+        :param max_bytes: tamaño máximo en disco de todos los parquet juntos
+        '''
+        self.__OBJECTS = re.compile(r'\b(?:from|join)\s+([A-Za-z_][\w.]*)', flags=re.IGNORECASE)
+
+        self.__cache_dir = cache_dir
+        self.__max_bytes = max_bytes
+        self.__lock = threading.Lock()
+        self.__flights = SingleFlight()
+        self.__generation = 0 # aumenta con cada invalidate
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__expirations = 0
+        self.__evictions = 0
+        self.__invalidations = 0
+
+    def make_key(self, source:str, database_id, query:str) -> str:
+        '''
+        Regresa la llave de un query: hash del origen, la base de datos y el texto del query normalizado
+        (sin espacios al inicio o al final de cada renglón, sin renglones vacíos ni ; final).
+        Los parámetros ya vienen dentro del query porque se renderean antes con QueryTemplates.
+        '''
+        lines = [line.strip() for line in query.strip().rstrip(';').splitlines()]
+        normalized = '\n'.join(line for line in lines if len(line) > 0)
+        payload = json.dumps([source, database_id, normalized])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key:str) -> pd.DataFrame:
+        '''
+        Regresa el resultado guardado para la llave, o None si no existe o ya caducó
+        '''
+        data_path, metadata_path = self.__paths(key)
+        try:
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+
+            if time.time() - metadata['created_at'] > metadata['ttl']:
+                self.__remove(key)
+                with self.__lock:
+                    self.__expirations += 1
+                    self.__misses += 1
+                return None
+
+            data = pd.read_parquet(data_path)
+            os.utime(data_path) # Para el orden de LRU
+        except (OSError, ValueError, KeyError):
+            # No existe, se borró mientras lo leíamos o quedó corrupto
+            with self.__lock:
+                self.__misses += 1
+            return None
+
+        with self.__lock:
+            self.__hits += 1
+        return data
+
+    def put(self, key:str, data:pd.DataFrame, query:str, ttl:float, source:str, name:str=None) -> bool:
+        '''
+        Guarda el resultado de un query.
+
+        :param key: llave de make_key
+        :param data: resultado del query
+        :param query: texto del query, se usa para saber qué objetos consulta
+        :param ttl: segundos que es válido el resultado
+        :param source: 'metabase' o 'salesforce'
+        :param name: nombre del query (el archivo sin .sql), solo informativo
+
+        :return: False si el resultado no se pudo guardar como parquet (eg. columnas con diccionarios)
+        '''
+        os.makedirs(self.__cache_dir, exist_ok=True)
+        data_path, metadata_path = self.__paths(key)
+        metadata = {
+            'source':source,
+            'name':name,
+            'created_at':time.time(),
+            'ttl':ttl,
+            'objects':sorted({table.lower() for table in self.__OBJECTS.findall(query)})
+        }
+
+        # Cada escritor usa sus propios temporales por si dos hilos o procesos guardan la misma llave
+        suffix = f'{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            data.to_parquet(f'{data_path}.{suffix}', index=False)
+        except (ValueError, TypeError, NotImplementedError):
+            if os.path.exists(f'{data_path}.{suffix}'): os.remove(f'{data_path}.{suffix}')
+            return False
+
+        with open(f'{metadata_path}.{suffix}', 'w') as f:
+            json.dump(metadata, f)
+        os.replace(f'{data_path}.{suffix}', data_path)
+        os.replace(f'{metadata_path}.{suffix}', metadata_path)
+
+        self.__evict()
+        return True
+
+    def get_or_fetch(self, key:str, fetch, query:str, ttl:float, source:str, name:str=None) -> pd.DataFrame:
+        '''
+        Regresa el resultado guardado o lo pide con fetch y lo guarda. Si otro hilo ya está pidiendo la misma llave,
+        espera a que termine y regresa su resultado.
+
+        :param key: llave de make_key
+        :param fetch: función sin argumentos que ejecuta el query
+        :param ttl: segundos que es válido el resultado, con ttl <= 0 no se lee ni se guarda (pero sí se juntan las llamadas)
+        (query, source y name como en put)
+        '''
+        if ttl > 0:
+            data = self.get(key)
+            if data is not None: return data
+
+        # Las llamadas que llegan después de un invalidate no se juntan con las que empezaron antes,
+        # y lo que se pidió antes del invalidate no se guarda
+        with self.__lock:
+            generation = self.__generation
+
+        def load() -> pd.DataFrame:
+            data = fetch()
+            with self.__lock:
+                is_current = generation == self.__generation
+            if ttl > 0 and is_current:
+                self.put(key, data, query=query, ttl=ttl, source=source, name=name)
+            return data
+
+        return self.__flights.do((key, generation), load)
+
+    def invalidate(self, objects:list=None) -> int:
+        '''
+        Borra los resultados que consultan alguno de los objetos especificados (eg. ['Account'] después de actualizar Accounts).
+
+        :param objects: nombres de tablas o sObjects (sin importar mayúsculas), None para borrar todo
+        :return: número de entradas borradas
+        '''
+        objects = None if objects is None else {name.lower() for name in objects}
+        with self.__lock:
+            self.__generation += 1
+
+        removed = 0
+        for key, metadata in self.__entries():
+            if objects is None or len(objects.intersection(metadata.get('objects', []))) > 0:
+                self.__remove(key)
+                removed += 1
+
+        with self.__lock:
+            self.__invalidations += removed
+        return removed
+
+    def get_stats(self) -> dict:
+        '''
+        Regresa los contadores del cache (de este proceso) y lo que hay en disco
+
+        :return: diccionario con hits, misses, expirations, evictions, invalidations, coalesced, entries y bytes
+        '''
+        sizes = [size for _, size, _ in self.__files()]
+        coalesced = self.__flights.get_stats()['coalesced']
+        with self.__lock:
+            return {
+                'hits':self.__hits,
+                'misses':self.__misses,
+                'expirations':self.__expirations,
+                'evictions':self.__evictions,
+                'invalidations':self.__invalidations,
+                'coalesced':coalesced,
+                'entries':len(sizes),
+                'bytes':sum(sizes)
+            }
+
+    def __evict(self) -> None:
+        '''
+        Si el cache pasa de max_bytes borra las entradas caducadas y luego las menos usadas
+        '''
+        files = self.__files()
+        total = sum(size for _, size, _ in files)
+        if total <= self.__max_bytes: return
+
+        expired = {key for key, metadata in self.__entries() if time.time() - metadata['created_at'] > metadata['ttl']}
+        # Primero las caducadas y después de la menos reciente a la más reciente
+        files.sort(key=lambda file: (file[0] not in expired, file[2]))
+
+        evicted = 0
+        for key, size, _ in files:
+            if total <= self.__max_bytes: break
+            self.__remove(key)
+            total -= size
+            evicted += 1
+
+        with self.__lock:
+            self.__evictions += evicted
+
+    def __files(self) -> list:
+        '''
+        Regresa (llave, bytes, fecha de último uso) de cada parquet del cache
+        '''
+        if not os.path.exists(self.__cache_dir): return []
+
+        files = []
+        for file in os.listdir(self.__cache_dir):
+            if not file.endswith('.parquet'): continue
+            try:
+                stat = os.stat(os.path.join(self.__cache_dir, file))
+            except OSError:
+                continue
+            files.append((file[:-len('.parquet')], stat.st_size, stat.st_mtime))
+        return files
+
+    def __entries(self):
+        '''
+        Regresa (llave, metadata) de cada entrada del cache
+        '''
+        if not os.path.exists(self.__cache_dir): return
+
+        for file in os.listdir(self.__cache_dir):
+            if not file.endswith('.json'): continue
+            try:
+                with open(os.path.join(self.__cache_dir, file), 'r') as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                continue
+            yield file[:-len('.json')], metadata
+
+    def __remove(self, key:str) -> None:
+        for path in self.__paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def __paths(self, key:str) -> tuple:
+        return os.path.join(self.__cache_dir, f'{key}.parquet'), os.path.join(self.__cache_dir, f'{key}.json')
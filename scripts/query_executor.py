@@ -0,0 +1,151 @@
+import os
+import logging
+import pandas as pd
+from my_apis.mb_connection import MetabaseConnection
+from my_apis.sf_connection import SalesforceConnection
+from scripts.sf_rest import SalesforceRest
+from scripts.sf_stream import SalesforceStreamer
+from scripts.mb_pagination import ParallelPaginator
+from scripts.mb_export import MetabaseExporter
+from scripts.query_templates import QueryTemplates
+from scripts.query_cache import QueryCache
+
+logger = logging.getLogger(__name__)
+
+class QueryExecutor:
+    '''
+    Esta clase ejecuta los queries de Metabase y Salesforce que usan Automations, ReferenceDataManager e ItemManager
+    pasando por el QueryCache compartido.
+
+    - Los queries de archivo se renderean con QueryTemplates (parámetros y filtros) antes de calcular la llave
+    - Cada query tiene su ttl (ver __TTLS, por nombre de archivo); ttl = 0 significa que no se guarda
+    - Las llamadas simultáneas al mismo query (de cualquier sesión que use el mismo QueryCache) esperan a una sola consulta
+    - Metabase: si el resultado pasa de 2,000 renglones se pide en páginas paralelas por id_col.
+      Los queries que se sabe que son grandes (export=True) se descargan en un solo CSV si hay exportador
+      (y en páginas si la exportación falla)
+    - Salesforce: se lee página por página con el REST API si hay sesión (y con extract_data si el REST API falla),
+      si no con extract_data. Cuando no hay registros se regresa un dataframe vacío (extract_data truena con KeyError)
+
+    Después de escribir en Salesforce hay que llamar a invalidate con los objetos modificados.
+    '''
+    def __init__(self, mbc:MetabaseConnection, sfc:SalesforceConnection, cache:QueryCache=None, database_id:int=6, exporter:MetabaseExporter=None, sf_rest:SalesforceRest=None) -> None:
+        '''
+        :param mbc: conexión a Metabase
+        :param sfc: conexión a Salesforce
+        :param cache: cache compartido, si es None se usa uno nuevo sobre cache/queries
+        :param database_id: id de la base de datos de Metabase
+        :param exporter: exportador de Metabase para los queries grandes, si es None se piden en páginas
+        :param sf_rest: cliente del REST API de Salesforce para leer los queries página por página, si es None se usa extract_data
+        '''
+        self.__DEFAULT_TTL = 300
+        self.__TTLS = {
+            # Insumos de las sincronizaciones de Automations: se invalidan al escribir, pero del lado de Metabase solo caducan
+            'wos_quotes_mb':120,
+            'otif_mb':120,
+            'status_mb':120,
+            'last_wo_date_mb':120,
+            'process_count_mb':120,
+            # Lo que ya tiene Salesforce de esos mismos campos: se invalida al escribir, pero también lo cambian otros usuarios
+            'wos_quotes_sf':60,
+            'otif_sf':60,
+            'last_wo_date_sf':60,
+            'main_process_sf':60,
+            'capabilities_sf':60,
+            # Items de los RFQs que se consultan en Pricing
+            'items_quotations':900,
+            # Catálogos que casi no cambian
+            'manufacturing_products':3600
+        }
+
+        self.__mbc = mbc
+        self.__sfc = sfc
+        self.__cache = cache or QueryCache()
+        self.__database_id = database_id
+        self.__exporter = exporter
+        self.__sf_streamer = SalesforceStreamer.from_rest(sf_rest)
+        self.__templates = QueryTemplates()
+
+    def set_database_id(self, database_id:int) -> None:
+        self.__database_id = database_id
+
+    def get_cache(self) -> QueryCache:
+        return self.__cache
+
+    def query_mb(self, query:str, is_path:bool=False, params:dict=None, filters:list=None, id_col:str=None, ttl:float=None, export:bool=False, column_types:dict=None) -> pd.DataFrame:
+        '''
+        Ejecuta un query en Metabase o regresa el resultado guardado.
+
+        :param query: el query a ejecutar, o el path a un sql file si is_path
+        :param params: parámetros del query (ver QueryTemplates)
+        :param filters: filtros que se agregan en el marcador --insert_where_clause_here (ver QueryTemplates)
+        :param id_col: es necesario cuando se extraen más de 2,000 registros porque es por el que se parte el query
+        :param ttl: segundos que es válido el resultado, si es None se usa el del query
+        :param export: si se sabe que el resultado es grande, se exporta en un solo CSV (o en páginas sin probar primero con query_data)
+        :param column_types: tipos de arrow de las columnas para el CSV exportado
+        '''
+        name, text = self.__render(query, is_path, params, filters, 'postgres')
+
+        def fetch():
+            if export and self.__exporter is not None:
+                try:
+                    return self.__exporter.query_data(text, column_types=column_types)
+                except Exception:
+                    # eg. la sesión caducó o el endpoint de exportación está deshabilitado: se piden en páginas
+                    assert id_col is not None, "Es necesario especificar id_col"
+                    return ParallelPaginator(self.__mbc, database_id=self.__database_id).query_all(text, id_col=id_col)
+            if export:
+                assert id_col is not None, "Es necesario especificar id_col"
+                return ParallelPaginator(self.__mbc, database_id=self.__database_id).query_all(text, id_col=id_col)
+            try:
+                return self.__mbc.query_data(text, database_id=self.__database_id)
+            except UserWarning:
+                assert id_col is not None, "Es necesario especificar id_col"
+                return ParallelPaginator(self.__mbc, database_id=self.__database_id).query_all(text, id_col=id_col)
+
+        return self.__cached('metabase', self.__database_id, name, text, ttl, fetch)
+
+    def query_sf(self, query:str, is_path:bool=False, params:dict=None, filters:list=None, ttl:float=None, column_types:dict=None) -> pd.DataFrame:
+        '''
+        Ejecuta un query de SOQL o regresa el resultado guardado.
+
+        :param column_types: tipos de arrow de los campos (ver QuerySchemas.get_arrow_types) para leer las páginas del REST API
+        :return: pd.DataFrame, vacío si no hay registros
+        '''
+        name, text = self.__render(query, is_path, params, filters, 'soql')
+
+        def fetch():
+            if self.__sf_streamer is not None:
+                try:
+                    return self.__sf_streamer.query_data(text, column_types=column_types)
+                except Exception:
+                    # eg. la sesión no se pudo renovar o el REST API no responde: se lee con la conexión de siempre
+                    logger.warning('Salesforce REST query failed, falling back to extract_data', exc_info=True)
+            try:
+                return self.__sfc.extract_data(text)
+            except KeyError:
+                return pd.DataFrame()
+
+        return self.__cached('salesforce', None, name, text, ttl, fetch)
+
+    def invalidate(self, objects:list=None) -> int:
+        '''
+        Borra los resultados guardados que consultan los objetos especificados (todos si es None)
+        '''
+        return self.__cache.invalidate(objects)
+
+    def get_stats(self) -> dict:
+        return self.__cache.get_stats()
+
+    def __render(self, query:str, is_path:bool, params:dict, filters:list, dialect:str) -> tuple:
+        '''
+        Regresa el nombre del query (None si no viene de un archivo) y su texto listo para ejecutarse
+        '''
+        name = os.path.splitext(os.path.basename(query))[0] if is_path else None
+        if not is_path and params is None and filters is None:
+            return name, query
+        return name, self.__templates.render(query, params=params, filters=filters, dialect=dialect, is_path=is_path)
+
+    def __cached(self, source:str, database_id, name:str, text:str, ttl:float, fetch) -> pd.DataFrame:
+        ttl = ttl if ttl is not None else self.__TTLS.get(name, self.__DEFAULT_TTL)
+        key = self.__cache.make_key(source, database_id, text)
+        return self.__cache.get_or_fetch(key, fetch, query=text, ttl=ttl, source=source, name=name)
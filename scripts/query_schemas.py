@@ -0,0 +1,261 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+class QuerySchemas:
+    '''
+    Esta clase guarda el esquema de cada query de queries/ (el nombre del archivo sin .sql) y lo aplica una sola vez
+    cuando llegan los datos, para que el resto del código ya no tenga que renombrar ni convertir columnas.
+
+    Cada esquema tiene:
+    - rename: columnas de Salesforce o Metabase -> nombre que usamos en el código
+    - types: tipo de cada columna (con el nombre ya renombrado)
+
+    Tipos disponibles:
+    - text: texto, los vacíos quedan como None
+    - category: pd.Categorical, para columnas con pocos valores distintos (status, main process, región, etc.)
+    - Int64: entero que admite vacíos
+    - int32: entero donde vacío cuenta como 0 (conteos)
+    - float: número con decimales
+    - bool: booleano donde vacío cuenta como False (checkboxes de Salesforce)
+    - boolean: booleano que admite vacíos
+    - timestamp: fecha y hora en UTC
+    - date: fecha sin hora ni zona horaria
+
+    Todas las conversiones son vectorizadas (pd.to_numeric, pd.to_datetime, astype). Las columnas que no están en types
+    se dejan como vienen. Si el resultado viene vacío se regresa un dataframe con todas las columnas del esquema.
+
+    Las columnas de id y las llaves de los merges se dejan como text o Int64, nunca como category, para que los merges
+    entre tablas no dependan de que ambas tengan las mismas categorías.
+    '''
+    def __init__(self) -> None:
+        capabilities = ['machining', 'logistics', 'formation', 'tooling', 'heavy_fab', 'laboratory', 'finishing', 'joining_welding', 'light_fab', 'other']
+
+        self.__TRUE_VALUES = {'true':True, 't':True, '1':True, 'false':False, 'f':False, '0':False}
+        self.__ARROW_TYPES = {
+            'text':pa.string(),
+            'category':pa.string(),
+            'Int64':pa.int64(),
+            'int32':pa.int32(),
+            'float':pa.float64(),
+            'bool':pa.bool_(),
+            'boolean':pa.bool_()
+        }
+        self.__SCHEMAS = {
+            # Salesforce
+            'addresses':{
+                'rename':{'Account__c':'mp_id', 'location__StateCode__s':'state_code'},
+                'types':{'mp_id':'text', 'state_code':'text'}
+            },
+            'mps_manufacturing':{
+                'rename':{
+                    'Id':'mp_id',
+                    'Account_Status__c':'status',
+                    'Completed_Work_Orders__c':'wos',
+                    'Number_of_RFQs_MP_has_quoted__c':'quotes',
+                    'NDA_status__c':'nda',
+                    'truora_test__c':'truora',
+                    'syntage_test__c':'syntage',
+                    'last_wo_date__c':'last_wo_date',
+                    'global_score__c':'global_score',
+                    'main_process__c':'main_process',
+                    **{f'{capability}_capability__c': capability for capability in capabilities}
+                },
+                'types':{
+                    'mp_id':'text',
+                    'Name':'text',
+                    'status':'category',
+                    'wos':'float',
+                    'quotes':'float',
+                    'nda':'category',
+                    'truora':'category',
+                    'syntage':'category',
+                    # Se queda como el texto YYYY-MM-DD de Salesforce, que es como se muestra en MPs Finder
+                    'last_wo_date':'text',
+                    'global_score':'float',
+                    'main_process':'category',
+                    **{capability: 'bool' for capability in capabilities}
+                }
+            },
+            'mps_names':{
+                'rename':{'Id':'mp_id', 'Name':'mp_name', 'Account_Status__c':'status', 'supply_chain_category__c':'mp_type', 'global_score__c':'score'},
+                'types':{'mp_id':'text', 'mp_name':'text', 'status':'category', 'mp_type':'category', 'score':'float'}
+            },
+            'mps_products':{
+                'rename':{'product__c':'product_id', 'account__c':'mp_id'},
+                'types':{'product_id':'text', 'mp_id':'text'}
+            },
+            'products_catalogue':{
+                'rename':{'Id':'product_id', 'Name':'product_name', 'Family':'product_family', 'rm_material__c':'material'},
+                'types':{'product_id':'text', 'product_name':'text', 'product_family':'category', 'material':'category'}
+            },
+            'states':{
+                'rename':{'States__c':'state', 'state_code__c':'state_code', 'Region__c':'region'},
+                'types':{'state':'text', 'state_code':'text', 'region':'category'}
+            },
+            'manufacturing_products':{
+                'rename':{'Name':'subcategory', 'manufacturing_product_category__c':'category'},
+                'types':{'Id':'text', 'subcategory':'text', 'category':'category'}
+            },
+            'quoted_items_names':{
+                'rename':{'Name':'name'},
+                'types':{'name':'Int64'}
+            },
+            # Metabase
+            'daily_activity':{
+                'rename':{},
+                'types':{'activity_id':'text', 'mp_id':'text', 'doc_day':'date', 'quotes':'int32', 'wos':'int32'}
+            },
+            'items_quotations':{
+                'rename':{},
+                'types':{
+                    'customer_id':'Int64',
+                    'rfq_id':'Int64',
+                    'quote_id':'Int64',
+                    'mp_id':'Int64',
+                    'item_quote_id':'Int64',
+                    'mp_sf_id':'text',
+                    'mp_name':'text',
+                    'rfq_name':'text',
+                    'customer_name':'text',
+                    'main_process':'category',
+                    'pod':'category',
+                    'item_id':'text',
+                    'unit_code':'category',
+                    'unit_price':'float'
+                }
+            },
+            # Se sube tal cual a Salesforce, por eso no lleva categorías
+            'quoted_items':{
+                'rename':{},
+                'types':{
+                    'name':'Int64',
+                    'rfq_id__c':'Int64',
+                    'mp_account__c':'text',
+                    'rfq_name__c':'text',
+                    'customer_name__c':'text',
+                    'main_process__c':'text',
+                    'pod__c':'text',
+                    'item_name__c':'text',
+                    'quote_currency__c':'text',
+                    'quote_price__c':'float',
+                    'target_currency__c':'text',
+                    'target_price__c':'float'
+                }
+            },
+            'wos_delta':{
+                'rename':{},
+                'types':{'id':'Int64', 'mp_id':'Int64', 'purchase_order_id':'Int64', 'created_at':'timestamp', 'cancelled_at':'timestamp', 'updated_at':'timestamp'}
+            },
+            'quotations_delta':{
+                'rename':{},
+                'types':{'id':'Int64', 'mp_id':'Int64', 'created_at':'timestamp', 'deleted_at':'timestamp', 'updated_at':'timestamp'}
+            },
+            'companies_delta':{
+                'rename':{},
+                'types':{'id':'Int64', 'salesforce_id':'text', 'updated_at':'timestamp'}
+            },
+            'deliveries_delta':{
+                'rename':{},
+                'types':{'id':'Int64', 'purchase_order_id':'Int64', 'status':'text', 'in_full':'boolean', 'on_time':'boolean', 'updated_at':'timestamp'}
+            }
+        }
+
+    def get_name(self, query:str) -> str:
+        '''
+        Regresa el nombre del esquema de un query: el nombre del archivo sin extensión (eg. queries/states.sql -> states)
+        '''
+        return os.path.splitext(os.path.basename(query))[0]
+
+    def get_schema(self, query:str) -> dict:
+        '''
+        :param query: nombre del esquema o path al archivo del query
+        :return: diccionario con rename y types
+        '''
+        name = self.get_name(query)
+        if name not in self.__SCHEMAS:
+            raise Exception(f'Query {name} has no schema. Available schemas: {list(self.__SCHEMAS)}')
+        return self.__SCHEMAS[name]
+
+    def get_schemas(self) -> list:
+        return list(self.__SCHEMAS)
+
+    def get_arrow_types(self, query:str) -> dict:
+        '''
+        Regresa los tipos de arrow de las columnas (con el nombre original, antes de renombrar) para que el lector
+        de CSV no tenga que adivinarlos. Las fechas no se incluyen porque se parsean en apply.
+
+        :return: diccionario columna -> tipo de pyarrow
+        '''
+        schema = self.get_schema(query)
+        original_names = {new: old for old, new in schema['rename'].items()}
+        return {
+            original_names.get(column, column): self.__ARROW_TYPES[column_type]
+            for column, column_type in schema['types'].items()
+            if column_type in self.__ARROW_TYPES
+        }
+
+    def apply(self, query:str, data:pd.DataFrame) -> pd.DataFrame:
+        '''
+        Renombra y convierte las columnas del resultado de un query según su esquema.
+
+        :param query: nombre del esquema o path al archivo del query
+        :param data: resultado del query tal cual viene de Salesforce o Metabase
+        :return: pd.DataFrame con las columnas renombradas y con sus tipos
+        '''
+        schema = self.get_schema(query)
+        data = data.rename(schema['rename'], axis=1)
+
+        # Si no hubo resultados, Salesforce regresa un dataframe sin columnas
+        if data.shape[0] == 0:
+            missing = [column for column in schema['types'] if column not in data.columns]
+            data = data.assign(**{column: pd.Series(dtype=object) for column in missing})
+
+        return data.assign(**{
+            column: self.__convert(data[column], column_type)
+            for column, column_type in schema['types'].items()
+            if column in data.columns
+        })
+
+    def __convert(self, values:pd.Series, column_type:str) -> pd.Series:
+        '''
+        Convierte una columna al tipo especificado
+        '''
+        if column_type == 'text':
+            return values.astype(str).where(values.notna(), None).astype(object)
+        if column_type == 'category':
+            return values.astype('category')
+        if column_type == 'Int64':
+            return pd.to_numeric(values, errors='coerce').astype('Int64')
+        if column_type == 'int32':
+            return pd.to_numeric(values, errors='coerce').fillna(0).astype(np.int32)
+        if column_type == 'float':
+            return pd.to_numeric(values, errors='coerce').astype(float)
+        if column_type == 'bool':
+            return self.__to_boolean(values).fillna(False).astype(bool)
+        if column_type == 'boolean':
+            return self.__to_boolean(values)
+        if column_type == 'timestamp':
+            return pd.to_datetime(values, utc=True, format='ISO8601')
+        if column_type == 'date':
+            dates = pd.to_datetime(values, format='ISO8601')
+            if dates.dt.tz is not None:
+                dates = dates.dt.tz_localize(None)
+            return dates.dt.normalize()
+        raise Exception(f'Unknown column type: {column_type}')
+
+    def __to_boolean(self, values:pd.Series) -> pd.Series:
+        '''
+        Convierte a booleano con vacíos. Metabase regresa booleanos, pero en el CSV de exportación vienen como texto
+        '''
+        if pd.api.types.is_bool_dtype(values):
+            return values.astype('boolean')
+        return (
+            values
+            .astype('string')
+            .str.strip()
+            .str.lower()
+            .map(self.__TRUE_VALUES)
+            .astype('boolean')
+        )
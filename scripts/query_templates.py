@@ -0,0 +1,186 @@
+import os
+import re
+import math
+import threading
+import numpy as np
+import pandas as pd
+from datetime import date, datetime, timezone
+
+class QueryTemplates:
+    '''
+    Esta clase carga los queries de queries/ una sola vez y los convierte en texto listo para ejecutarse con parámetros tipados,
+    para que ningún valor se pegue a mano con f-strings.
+
+    - Parámetros: {nombre} dentro del query. Cada valor se convierte a literal según su tipo de python (texto, número, fecha,
+      fecha y hora, booleano, None o lista) y el dialecto ('postgres' para Metabase, 'soql' para Salesforce).
+    - Filtros: lista de (columna, operador, valor) que se agregan al query para filtrar en la base de datos y no en pandas.
+      En postgres se insertan en el marcador --insert_where_clause_here y el resultado se envuelve en una subconsulta que
+      vuelve a tener los marcadores, así que se puede seguir paginando con ParallelPaginator.
+      En SOQL se agregan al where del query (o se crea uno).
+
+    Los templates se guardan ya parseados y solo se vuelven a leer si el archivo cambió.
+    '''
+    def __init__(self) -> None:
+        self.__WHERE_MARKER = '--insert_where_clause_here'
+        self.__ORDER_BY_MARKER = '--insert_order_by_clause_here'
+        self.__BIND = re.compile(r'\{(\w+)\}')
+        self.__COLUMN = re.compile(r'^[A-Za-z_][\w.]*$')
+        self.__OPERATORS = ['=', '!=', '<', '<=', '>', '>=', 'in', 'not in']
+        self.__DIALECTS = ['postgres', 'soql']
+
+        self.__templates = {} # path -> (mtime del archivo, template parseado)
+        self.__lock = threading.Lock()
+
+    def load(self, path:str) -> dict:
+        '''
+        Regresa el template del archivo, leyéndolo solo la primera vez o si cambió desde la última lectura.
+
+        :param path: path al archivo .sql
+        :return: diccionario con text, binds (nombres de los parámetros) y markers (si tiene los marcadores de paginación)
+        '''
+        mtime = os.path.getmtime(path)
+        with self.__lock:
+            cached = self.__templates.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+        with open(path, 'r') as f:
+            template = self.__parse(f.read())
+
+        with self.__lock:
+            self.__templates[path] = (mtime, template)
+        return template
+
+    def render(self, query:str, params:dict=None, filters:list=None, dialect:str='postgres', is_path:bool=True) -> str:
+        '''
+        Regresa el query con los parámetros y filtros convertidos a literales.
+
+        :param query: path al archivo del query (o el query si is_path es False)
+        :param params: diccionario nombre -> valor para los {nombre} del query
+        :param filters: lista de (columna, operador, valor). Operadores: =, !=, <, <=, >, >=, in, not in
+        :param dialect: 'postgres' o 'soql'
+        :param is_path: si query es un path o el texto del query
+
+        :return: str con el query listo para ejecutarse
+        '''
+        if dialect not in self.__DIALECTS:
+            raise Exception(f'Invalid dialect: {dialect}. Available dialects: {self.__DIALECTS}')
+
+        template = self.load(query) if is_path else self.__parse(query)
+        params = params or {}
+
+        missing = [name for name in template['binds'] if name not in params]
+        unknown = [name for name in params if name not in template['binds']]
+        if len(missing) > 0 or len(unknown) > 0:
+            raise Exception(f'Bind parameters do not match the query. Missing: {missing}, unknown: {unknown}')
+
+        text = self.__BIND.sub(lambda match: self.to_literal(params[match.group(1)], dialect), template['text'])
+        if filters is None or len(filters) == 0:
+            return text
+
+        conditions = ' and '.join(self.__condition(column, operator, value, dialect) for column, operator, value in filters)
+        if dialect == 'soql':
+            return self.__add_soql_where(text, conditions)
+        return self.__add_postgres_where(text, template, conditions)
+
+    def to_literal(self, value, dialect:str='postgres') -> str:
+        '''
+        Convierte un valor de python a literal de SQL o SOQL
+
+        :param value: str, int, float, bool, date, datetime, None o lista de esos valores
+        :param dialect: 'postgres' o 'soql'
+        '''
+        if isinstance(value, (list, tuple, set, np.ndarray, pd.Series, pd.Index)):
+            values = list(value)
+            if len(values) == 0:
+                raise Exception('Cannot bind an empty list')
+            return '(' + ', '.join(self.to_literal(item, dialect) for item in values) + ')'
+
+        if isinstance(value, np.datetime64):
+            value = pd.Timestamp(value)
+        elif isinstance(value, np.generic):
+            value = value.item()
+
+        if value is None or value is pd.NaT or (isinstance(value, float) and math.isnan(value)):
+            return 'null'
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        if isinstance(value, (int, float)):
+            if not math.isfinite(value):
+                raise Exception(f'Cannot bind a non finite number: {value}')
+            return repr(value)
+        if isinstance(value, datetime):
+            # Las fechas con zona horaria se pasan a UTC; las que no tienen se toman como UTC
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc).replace(tzinfo=None)
+            if dialect == 'soql':
+                return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+            return f"timestamp '{value.isoformat(sep=' ')}'"
+        if isinstance(value, date):
+            return value.isoformat() if dialect == 'soql' else f"date '{value.isoformat()}'"
+        if isinstance(value, str):
+            return self.__quote(value, dialect)
+        raise Exception(f'Unsupported bind parameter type: {type(value).__name__}')
+
+    def __parse(self, text:str) -> dict:
+        return {
+            'text':text,
+            'binds':list(dict.fromkeys(self.__BIND.findall(text))),
+            'markers':self.__WHERE_MARKER in text and self.__ORDER_BY_MARKER in text
+        }
+
+    def __quote(self, value:str, dialect:str) -> str:
+        '''
+        Escapa el texto. En postgres basta con duplicar las comillas; SOQL usa diagonales invertidas
+        '''
+        if dialect == 'soql':
+            for character, escaped in (('\\', '\\\\'), ("'", "\\'"), ('\n', '\\n'), ('\r', '\\r'), ('\t', '\\t')):
+                value = value.replace(character, escaped)
+            return f"'{value}'"
+        return "'" + value.replace("'", "''") + "'"
+
+    def __condition(self, column:str, operator:str, value, dialect:str) -> str:
+        '''
+        Arma una condición del filtro validando la columna y el operador (nunca se pegan tal cual vienen)
+        '''
+        operator = operator.lower()
+        if not self.__COLUMN.match(column):
+            raise Exception(f'Invalid column name in filter: {column}')
+        if operator not in self.__OPERATORS:
+            raise Exception(f'Invalid operator in filter: {operator}. Available operators: {self.__OPERATORS}')
+
+        is_list = isinstance(value, (list, tuple, set, np.ndarray, pd.Series, pd.Index))
+        if operator in ('in', 'not in') and not is_list:
+            raise Exception(f'Operator {operator} needs a list of values')
+        if operator not in ('in', 'not in') and is_list:
+            raise Exception(f'Operator {operator} needs a single value')
+
+        return f'{column} {operator} {self.to_literal(value, dialect)}'
+
+    def __add_postgres_where(self, text:str, template:dict, conditions:str) -> str:
+        '''
+        Inserta el filtro en el marcador y envuelve el query para que vuelva a tener los marcadores de paginación
+        '''
+        if not template['markers']:
+            raise Exception(f'Query must include {self.__WHERE_MARKER} and {self.__ORDER_BY_MARKER} to be filtered')
+
+        inner = (
+            text
+            .replace(self.__WHERE_MARKER, f'where {conditions}', 1)
+            .replace(self.__ORDER_BY_MARKER, '', 1)
+            .strip()
+            .rstrip(';')
+        )
+        return f'select *\nfrom (\n{inner}\n) as filtered_query\n{self.__WHERE_MARKER}\n{self.__ORDER_BY_MARKER}\n'
+
+    def __add_soql_where(self, text:str, conditions:str) -> str:
+        '''
+        Agrega el filtro al where del query de SOQL, o crea el where si no tiene
+        '''
+        if re.search(r'\b(order\s+by|group\s+by|limit|offset)\b', text, flags=re.IGNORECASE):
+            raise Exception('SOQL queries with order by, group by, limit or offset cannot be filtered')
+
+        parts = re.split(r'\bwhere\b', text, maxsplit=1, flags=re.IGNORECASE)
+        if len(parts) == 1:
+            return f'{text.rstrip()}\nwhere {conditions}'
+        return f'{parts[0]}where ({parts[1].strip()}) and {conditions}'
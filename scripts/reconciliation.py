@@ -0,0 +1,195 @@
+import numpy as np
+import pandas as pd
+
+class Reconciler:
+    '''
+    Esta clase compara los valores que calculamos en Metabase contra los que tiene Salesforce y regresa solo los que cambiaron.
+
+    Cada sincronización se describe con un job (ver __JOBS): los queries de cada lado, las columnas de id y un mapeo de campos.
+    Cada campo tiene un tipo que define cómo se normalizan los valores antes de compararlos:
+
+    - count: número entero donde 0 y vacío significan lo mismo (se guarda vacío)
+    - number: número con decimales, opcionalmente redondeado a 'decimals' y comparado con 'tolerance'
+    - date: fecha (sin hora) en formato YYYY-MM-DD
+    - text: texto sin espacios al inicio o al final, '' cuenta como vacío
+
+    Si el job no tiene sf_query se considera que el query de Metabase ya regresa solo lo que hay que cambiar, así que se
+    mandan todos sus renglones (los vacíos también, para vaciar el campo).
+    Con how = 'outer' los registros que tienen valor en Salesforce pero no vienen en Metabase se vacían.
+
+    Para sincronizar un KPI nuevo basta con agregar su job.
+    '''
+    def __init__(self) -> None:
+        self.__JOBS = {
+            'wos_quotes':{
+                'mb_query':'queries/wos_quotes_mb.sql',
+                'sf_query':'queries/wos_quotes_sf.sql',
+                'mb_id':'salesforce_id',
+                'sf_id':'Id',
+                'object_type':'Account',
+                'how':'left',
+                'fields':[
+                    {'mb':'mb_wos', 'sf':'Completed_Work_Orders__c', 'type':'count'},
+                    {'mb':'mb_quotes', 'sf':'Number_of_RFQs_MP_has_quoted__c', 'type':'count'}
+                ]
+            },
+            'otif':{
+                'mb_query':'queries/otif_mb.sql',
+                'sf_query':'queries/otif_sf.sql',
+                'mb_id':'salesforce_id',
+                'sf_id':'Id',
+                'object_type':'Account',
+                'how':'outer',
+                'fields':[
+                    {'mb':'otif', 'sf':'OTIF__c', 'type':'number'}
+                ]
+            },
+            'last_wo_date':{
+                'mb_query':'queries/last_wo_date_mb.sql',
+                'sf_query':'queries/last_wo_date_sf.sql',
+                'mb_id':'sf_id',
+                'sf_id':'Id',
+                'object_type':'Account',
+                'how':'left',
+                'fields':[
+                    {'mb':'date_last_wo', 'sf':'last_wo_date__c', 'type':'date'}
+                ]
+            },
+            'status':{
+                'mb_query':'queries/status_mb.sql',
+                'sf_query':None,
+                'mb_id':'salesforce_id',
+                'sf_id':'Id',
+                'object_type':'Account',
+                'how':'left',
+                'fields':[
+                    {'mb':'mb_status', 'sf':'Account_Status__c', 'type':'text'}
+                ]
+            }
+        }
+        self.__NORMALIZERS = {
+            'count':self.__normalize_count,
+            'number':self.__normalize_number,
+            'date':self.__normalize_date,
+            'text':self.__normalize_text
+        }
+
+    def get_job(self, name:str) -> dict:
+        '''
+        Regresa la configuración del job especificado
+        '''
+        if name not in self.__JOBS:
+            raise Exception(f'Unknown sync job: {name}. Available jobs: {list(self.__JOBS)}')
+        return self.__JOBS[name]
+
+    def get_jobs(self) -> list:
+        return list(self.__JOBS)
+
+    def add_job(self, name:str, job:dict) -> None:
+        '''
+        Registra un job nuevo (o reemplaza uno existente)
+
+        :param name: nombre del job
+        :param job: diccionario con el mismo formato que los jobs de __JOBS
+        '''
+        for key in ['mb_query', 'mb_id', 'sf_id', 'object_type', 'fields']:
+            if key not in job:
+                raise Exception(f'Missing key in sync job {name}: {key}')
+        for field in job['fields']:
+            if field.get('type') not in self.__NORMALIZERS:
+                raise Exception(f"Unsupported field type in sync job {name}: {field.get('type')}")
+        self.__JOBS[name] = {'sf_query':None, 'how':'left', **job}
+
+    def diff(self, name:str, mb_data:pd.DataFrame, sf_data:pd.DataFrame=None) -> pd.DataFrame:
+        '''
+        Compara los datos de Metabase y Salesforce del job especificado.
+
+        :param name: nombre del job
+        :param mb_data: resultado del query de Metabase
+        :param sf_data: resultado del query de Salesforce (None si el job no tiene sf_query)
+
+        :return: pd.DataFrame con un renglón por valor a cambiar, columnas: id, field, old, new.
+            new ya viene listo para mandarse a Salesforce (None para vaciar el campo)
+        '''
+        job = self.get_job(name)
+        fields = job['fields']
+
+        mb_values = self.__index_by(mb_data, job['mb_id'])[[field['mb'] for field in fields]]
+        compare = job['sf_query'] is not None and sf_data is not None
+        if not compare:
+            sf_values = pd.DataFrame(index=mb_values.index, columns=[field['sf'] for field in fields], dtype=object)
+        else:
+            sf_values = self.__index_by(sf_data, job['sf_id']).reindex(columns=[field['sf'] for field in fields])
+
+        index = mb_values.index if job['how'] == 'left' else mb_values.index.union(sf_values.index)
+        mb_values = mb_values.reindex(index)
+        sf_values = sf_values.reindex(index)
+
+        changes = []
+        for field in fields:
+            normalize = self.__NORMALIZERS[field['type']]
+            new = normalize(mb_values[field['mb']], field)
+            old = normalize(sf_values[field['sf']], field)
+
+            changed = self.__find_changes(new, old, field) if compare else np.ones(len(index), dtype=bool)
+            if not changed.any(): continue
+
+            changes.append(
+                pd.DataFrame({
+                    'id':index[changed],
+                    'field':field['sf'],
+                    'old':pd.Series(self.__to_python(old[changed]), dtype=object),
+                    'new':pd.Series(self.__to_python(new[changed]), dtype=object)
+                })
+            )
+
+        if len(changes) == 0:
+            return pd.DataFrame({'id':pd.Series(dtype=object), 'field':pd.Series(dtype=object), 'old':pd.Series(dtype=object), 'new':pd.Series(dtype=object)})
+        return pd.concat(changes, ignore_index=True)
+
+    def __index_by(self, data:pd.DataFrame, id_col:str) -> pd.DataFrame:
+        '''
+        Pone el id como índice, quitando los renglones sin id y los ids repetidos (se queda el primero)
+        '''
+        data = data[data[id_col].notna()].set_index(id_col)
+        return data[~data.index.duplicated(keep='first')]
+
+    def __find_changes(self, new:pd.Series, old:pd.Series, field:dict) -> np.ndarray:
+        '''
+        Regresa un arreglo booleano con los valores que cambiaron. Dos vacíos son iguales y un vacío contra un valor es un cambio.
+        '''
+        new_na, old_na = new.isna().to_numpy(), old.isna().to_numpy()
+        both = ~new_na & ~old_na
+
+        equal = np.zeros(len(new), dtype=bool)
+        if field['type'] in ['count', 'number']:
+            tolerance = field.get('tolerance', 0)
+            equal[both] = np.abs(new.to_numpy(dtype=float, na_value=np.nan)[both] - old.to_numpy(dtype=float, na_value=np.nan)[both]) <= tolerance
+        else:
+            equal[both] = new.to_numpy()[both] == old.to_numpy()[both]
+
+        return ~((new_na & old_na) | equal)
+
+    def __to_python(self, values:pd.Series) -> list:
+        '''
+        Convierte los valores a tipos de python, con None en lugar de NaN
+        '''
+        return [None if pd.isna(value) else (value.item() if isinstance(value, np.generic) else value) for value in values.to_numpy(dtype=object)]
+
+    def __normalize_count(self, values:pd.Series, field:dict) -> pd.Series:
+        numbers = pd.to_numeric(values, errors='coerce').astype('Float64').round(0)
+        return numbers.mask(numbers == 0).astype('Int64')
+
+    def __normalize_number(self, values:pd.Series, field:dict) -> pd.Series:
+        numbers = pd.to_numeric(values, errors='coerce').astype('Float64')
+        if 'decimals' in field:
+            numbers = numbers.round(field['decimals'])
+        return numbers
+
+    def __normalize_date(self, values:pd.Series, field:dict) -> pd.Series:
+        dates = pd.to_datetime(values, utc=True, errors='coerce', format='ISO8601')
+        return dates.dt.strftime('%Y-%m-%d').astype(object).where(dates.notna(), None)
+
+    def __normalize_text(self, values:pd.Series, field:dict) -> pd.Series:
+        texts = values.astype(object).where(values.notna(), None).map(lambda value: value if value is None else str(value).strip())
+        return texts.where(texts != '', None)
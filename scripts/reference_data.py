@@ -0,0 +1,521 @@
+import time
+import logging
+import warnings
+import threading
+import pandas as pd
+import geopandas as gpd
+from datetime import datetime, timezone, timedelta
+from scripts.data_loader import DataLoader
+from scripts.sf_cache import SalesforceTableCache
+from scripts.sf_rest import SalesforceRest
+from scripts.sf_stream import SalesforceStreamer
+from scripts.activity_index import ActivityIndex
+from scripts.search_index import CapabilityIndex, RawMaterialsIndex, ProductStateIndex
+from scripts.result_cache import BytesCache
+from scripts.state_map import StateMap
+from scripts.contacts_cache import ContactsCache
+from scripts.query_schemas import QuerySchemas
+from scripts.query_cache import QueryCache
+from scripts.query_executor import QueryExecutor
+from my_apis.sf_connection import SalesforceConnection
+from my_apis.mb_connection import MetabaseConnection
+
+logger = logging.getLogger(__name__)
+
+class ReferenceSnapshot:
+    '''
+    Esta clase guarda una foto inmutable de los datos de referencia que usan los buscadores de MPs.
+    Todas las sesiones comparten la misma foto, por lo que NINGÚN dataframe que regrese se debe modificar.
+
+    Cada dataset se carga hasta la primera vez que alguien lo pide (y una sola vez aunque lo pidan varios hilos),
+    así que una sesión que solo busca MPs de manufactura nunca paga por los raw materials ni por el mapa.
+    '''
+    def __init__(self, version:int, loader:DataLoader) -> None:
+        self.__version = version
+        self.__loader = loader
+        self.__loaded_at = datetime.now(timezone.utc)
+
+    def preload(self, sources:list=None) -> None:
+        '''
+        Carga de una vez las fuentes especificadas (todas si es None)
+        '''
+        self.__loader.load(sources)
+
+    def get_loaded(self) -> list:
+        '''
+        Regresa los nombres de las fuentes que ya se materializaron en esta foto
+        '''
+        return self.__loader.get_loaded()
+
+    @property
+    def timings(self) -> pd.DataFrame:
+        '''
+        Cuánto tardó en cargarse cada fuente de esta foto (source, seconds)
+        '''
+        return self.__loader.get_timings()
+
+    @property
+    def version(self) -> int:
+        return self.__version
+
+    @property
+    def loaded_at(self) -> datetime:
+        return self.__loaded_at
+
+    @property
+    def catalogue(self) -> pd.DataFrame:
+        return self.__loader.get('catalogue')
+
+    @property
+    def states(self) -> pd.DataFrame:
+        return self.__loader.get('states')
+
+    @property
+    def addresses(self) -> pd.DataFrame:
+        return self.__loader.get('addresses')
+
+    @property
+    def mps(self) -> pd.DataFrame:
+        return self.__loader.get('mps')
+
+    @property
+    def mps_index(self) -> CapabilityIndex:
+        return self.__loader.get('mps_index')
+
+    @property
+    def mps_names(self) -> pd.DataFrame:
+        return self.__loader.get('mps_names')
+
+    @property
+    def activity(self) -> ActivityIndex:
+        return self.__loader.get('activity')
+
+    @property
+    def rm_mps(self) -> pd.DataFrame:
+        return self.__loader.get('rm_mps')
+
+    @property
+    def rm_mps_db(self) -> pd.DataFrame:
+        return self.__loader.get('rm_mps_db')
+
+    @property
+    def rm_index(self) -> RawMaterialsIndex:
+        return self.__loader.get('rm_index')
+
+    @property
+    def product_states(self) -> ProductStateIndex:
+        return self.__loader.get('product_states')
+
+    @property
+    def mexico_shapefile(self) -> gpd.GeoDataFrame:
+        return self.__loader.get('mexico_shapefile')
+
+    @property
+    def mexico_map(self) -> StateMap:
+        return self.__loader.get('mexico_map')
+
+
+class ReferenceDataManager:
+    '''
+    Esta clase carga una sola vez por proceso los datos de referencia (catálogo, estados, direcciones, MPs, etc.)
+    y los comparte entre todas las sesiones de streamlit.
+
+    La foto activa se refresca en segundo plano cuando caduca (ttl). La nueva foto se construye aparte
+    y se intercambia de forma atómica, así que las sesiones nunca ven datos a medio cargar.
+    Si un refresh falla se sigue usando la foto anterior, el error se manda a logging y el siguiente intento espera
+    cada vez más (desde retry_seconds hasta ttl_seconds); get_status regresa el último error para mostrarlo.
+
+    Como es compartido por todo el proceso, se debe construir con credenciales de servicio y no con las de un usuario.
+
+    Las tablas de Salesforce se guardan en SalesforceTableCache (que ya pide solo el delta); los queries de Metabase
+    y los de Salesforce que no vienen de un archivo pasan por el QueryCache compartido.
+    '''
+    def __init__(self, sfc:SalesforceConnection, mbc:MetabaseConnection, ttl_seconds:int=3600, cache_dir:str='cache/salesforce', render_cache_bytes:int=64 * 1024 * 1024, query_cache:QueryCache=None, sf_rest:SalesforceRest=None, retry_seconds:int=60) -> None:
+        warnings.filterwarnings('error') # Para poder cachar warnings como exceptions.
+
+        self.__DATABASE_ID = 6
+        self.__MEXICO_SHAPEFILE = 'templates/mexico-shapefile.shp'
+        self.__MAP_TOLERANCE = 0.01 # grados, para simplificar la geometría de los mapas interactivos
+        self.__INTERVAL_DAYS = 30
+        self.__HISTORY_DAYS = 365
+        self.__ACTIVITY_REFRESH_DAYS = 30 # días que se vuelven a pedir en cada refresh
+        self.__ACTIVITY_FULL_RELOAD_HOURS = 24 # cada cuánto se vuelven a pedir los HISTORY_DAYS completos
+        self.__CAPABILITIES = ['machining', 'logistics', 'formation', 'tooling', 'heavy_fab', 'laboratory', 'finishing', 'joining_welding', 'light_fab', 'other']
+        self.__SORT_COLUMNS = ['wos', 'quotes', 'global_score']
+
+        self.__sfc = sfc
+        self.__mbc = mbc
+        self.__sf_cache = SalesforceTableCache(sfc, cache_dir=cache_dir, streamer=SalesforceStreamer.from_rest(sf_rest))
+        self.__schemas = QuerySchemas()
+        self.__executor = QueryExecutor(sfc=sfc, mbc=mbc, cache=query_cache, database_id=self.__DATABASE_ID, sf_rest=sf_rest)
+        self.__ttl_seconds = ttl_seconds
+        self.__retry_seconds = retry_seconds
+        self.__render_cache = BytesCache(max_bytes=render_cache_bytes)
+        self.__contacts = ContactsCache(sfc)
+
+        self.__lock = threading.RLock()
+        self.__snapshot = None
+        self.__version = 0
+        self.__refreshing = False
+        self.__last_refresh_error = None
+        self.__last_refresh_error_at = None
+        self.__refresh_failures = 0 # refresh seguidos que han fallado
+        self.__next_retry = 0 # time.monotonic() a partir del cual se puede volver a intentar
+        self.__activity = None
+        self.__activity_full_loaded_at = None
+
+    def get_snapshot(self) -> ReferenceSnapshot:
+        '''
+        Regresa la foto activa. Si ya caducó, dispara un refresh en segundo plano y mientras tanto
+        se sigue usando la foto actual. Después de un refresh fallido no se vuelve a intentar hasta que pase el backoff.
+
+        :return: ReferenceSnapshot
+        '''
+        snapshot = self.__snapshot
+        if snapshot is None:
+            with self.__lock:
+                # Revisamos otra vez por si otra sesión ya la cargó mientras esperábamos
+                if self.__snapshot is None:
+                    self.__swap(self.__build_snapshot())
+                return self.__snapshot
+
+        age = (datetime.now(timezone.utc) - snapshot.loaded_at).total_seconds()
+        if age > self.__ttl_seconds and time.monotonic() >= self.__next_retry:
+            self.refresh(wait=False)
+        return snapshot
+
+    def refresh(self, wait:bool=False) -> bool:
+        '''
+        Construye una nueva foto y la intercambia por la activa cuando está lista.
+
+        :param wait: si se quiere esperar a que termine el refresh o hacerlo en segundo plano
+        :return: booleano indicando si se inició el refresh (False si ya había uno corriendo)
+        '''
+        with self.__lock:
+            if self.__refreshing: return False
+            self.__refreshing = True
+
+        if wait:
+            self.__refresh_worker()
+        else:
+            threading.Thread(target=self.__refresh_worker, name='reference-data-refresh', daemon=True).start()
+        return True
+
+    def get_last_refresh_error(self) -> Exception:
+        '''
+        Regresa el último error que hubo al refrescar los datos en segundo plano, None si no ha habido errores
+        '''
+        return self.__last_refresh_error
+
+    def get_status(self) -> dict:
+        '''
+        Regresa el estado de la foto activa y de los refresh en segundo plano
+
+        :return: diccionario con version, loaded_at (None si todavía no hay foto), failures (refresh seguidos que han fallado),
+            last_error, last_error_at y next_retry_in (segundos para el siguiente intento, 0 si ya se puede)
+        '''
+        snapshot = self.__snapshot
+        with self.__lock:
+            return {
+                'version':None if snapshot is None else snapshot.version,
+                'loaded_at':None if snapshot is None else snapshot.loaded_at,
+                'failures':self.__refresh_failures,
+                'last_error':None if self.__last_refresh_error is None else f'{type(self.__last_refresh_error).__name__}: {self.__last_refresh_error}',
+                'last_error_at':self.__last_refresh_error_at,
+                'next_retry_in':max(0, self.__next_retry - time.monotonic())
+            }
+
+    def get_salesforce_connection(self) -> SalesforceConnection:
+        return self.__sfc
+
+    def get_contacts_cache(self) -> ContactsCache:
+        '''
+        Regresa el cache de contactos de los MPs que comparten todas las sesiones
+        '''
+        return self.__contacts
+
+    def get_render_cache(self) -> BytesCache:
+        '''
+        Regresa el cache de imágenes renderizadas que comparten todas las sesiones.
+        Las llaves deben incluir la versión de la foto con la que se generó la imagen.
+        '''
+        return self.__render_cache
+
+    def get_load_timings(self) -> pd.DataFrame:
+        '''
+        Regresa los tiempos de carga por fuente de la foto activa, útil para ver qué domina el arranque en frío.
+
+        :return: pd.DataFrame con columnas source, seconds (None si todavía no hay foto)
+        '''
+        snapshot = self.__snapshot
+        return None if snapshot is None else snapshot.timings
+
+    def __refresh_worker(self) -> None:
+        '''
+        Esta función construye la nueva foto fuera del lock. Si falla, se queda la foto anterior
+        y get_snapshot no lo vuelve a intentar hasta que pase el backoff (se duplica con cada falla, hasta ttl_seconds).
+        '''
+        try:
+            snapshot = self.__build_snapshot()
+            # Antes de intercambiarla cargamos lo que ya se estaba usando, para que nadie tenga que esperar
+            previous = self.__snapshot
+            snapshot.preload(previous.get_loaded() if previous is not None else None)
+            with self.__lock:
+                self.__swap(snapshot)
+                self.__last_refresh_error = None
+                self.__last_refresh_error_at = None
+                self.__refresh_failures = 0
+                self.__next_retry = 0
+        except Exception as e:
+            with self.__lock:
+                self.__last_refresh_error = e
+                self.__last_refresh_error_at = datetime.now(timezone.utc)
+                self.__refresh_failures += 1
+                delay = min(self.__ttl_seconds, self.__retry_seconds * 2 ** (self.__refresh_failures - 1))
+                self.__next_retry = time.monotonic() + delay
+                failures = self.__refresh_failures
+            logger.exception('Error refreshing reference data (%d failures in a row), retrying in %d seconds', failures, delay)
+        finally:
+            with self.__lock:
+                self.__refreshing = False
+
+    def __swap(self, snapshot:ReferenceSnapshot) -> None:
+        '''
+        Intercambia la foto activa. Solo llamar con el lock tomado.
+        '''
+        self.__snapshot = snapshot
+
+    def __build_snapshot(self) -> ReferenceSnapshot:
+        '''
+        Arma una nueva foto con la siguiente versión. Las fuentes se cargan hasta que se piden.
+        '''
+        loader = self.__create_loader()
+
+        with self.__lock:
+            self.__version += 1
+            version = self.__version
+        return ReferenceSnapshot(version=version, loader=loader)
+
+    def __create_loader(self) -> DataLoader:
+        '''
+        Declara las fuentes de datos y las dependencias entre ellas.
+        Los queries a Salesforce y Metabase no dependen entre sí, así que corren en paralelo;
+        los merges solo arrancan cuando sus insumos están listos.
+        '''
+        loader = DataLoader(max_workers=6)
+
+        # Fuentes (queries y archivos)
+        loader.add_source('catalogue', self.__load_catalogue)
+        loader.add_source('states', self.__load_states)
+        loader.add_source('addresses', self.__load_addresses)
+        loader.add_source('mps_manufacturing', self.__load_mps_manufacturing)
+        loader.add_source('mps_names', self.__load_mps_names)
+        loader.add_source('activity', self.__load_activity)
+        loader.add_source('mps_products', self.__load_mps_products)
+        loader.add_source('mexico_shapefile', lambda: gpd.read_parquet(self.__MEXICO_SHAPEFILE))
+
+        # Merges
+        loader.add_source('mps', self.__load_mps, depends_on=['mps_manufacturing', 'addresses', 'states'])
+        loader.add_source('mps_index', self.__load_mps_index, depends_on=['mps', 'states'])
+        loader.add_source('rm_mps', self.__load_rm_mps, depends_on=['mps_names', 'activity'])
+        loader.add_source('rm_mps_db', self.__load_rm_mps_db, depends_on=['addresses', 'rm_mps', 'states', 'mps_products', 'catalogue'])
+        loader.add_source('rm_index', self.__load_rm_index, depends_on=['rm_mps_db', 'states'])
+        loader.add_source('product_states', self.__load_product_states, depends_on=['rm_mps_db'])
+        loader.add_source('mexico_map', self.__load_mexico_map, depends_on=['mexico_shapefile'])
+
+        return loader
+
+    def __load_addresses(self) -> pd.DataFrame:
+        '''
+        Esta función carga las direcciones de los MPs
+        '''
+        direcciones = self.__execute_query_in_sf(
+            query='queries/addresses.sql',
+            is_path=True
+        )
+        return direcciones
+
+    def __load_mps_manufacturing(self) -> pd.DataFrame:
+        '''
+        Esta función carga los MPs de manufactura con sus capabilities (ya renombradas por el esquema del query).
+        '''
+        mps = self.__execute_query_in_sf(
+            query='queries/mps_manufacturing.sql',
+            is_path=True
+        )
+        return mps
+
+    def __load_mps(self, mps_manufacturing:pd.DataFrame, addresses:pd.DataFrame, states:pd.DataFrame) -> pd.DataFrame:
+        '''
+        Esta función junta los MPs de manufactura con sus ubicaciones para poder filtrarlos como se desee.
+        '''
+        capabilities = (
+            mps_manufacturing
+            .merge(addresses, on='mp_id', how='inner')
+            .merge(states, on='state_code')
+            .query('main_process != "Material Sourcing"') # Quitamos a los MPs de raw materials
+        )
+        return capabilities
+
+    def __load_mps_index(self, mps:pd.DataFrame, states:pd.DataFrame) -> CapabilityIndex:
+        '''
+        Esta función precompila los MPs de manufactura para poder filtrarlos sin queries de pandas.
+        '''
+        return CapabilityIndex(mps, states, capabilities=self.__CAPABILITIES, sort_columns=self.__SORT_COLUMNS)
+
+    def __load_catalogue(self) -> pd.DataFrame:
+        '''
+        Esta función saca el catálogo de productos de raw materials de Salesforce.
+
+        :return: catálogo en df
+        '''
+        catalogue = self.__execute_query_in_sf(
+            query='queries/products_catalogue.sql',
+            is_path=True
+        )
+        return catalogue
+
+    def __load_mps_names(self) -> pd.DataFrame:
+        '''
+        Esta función carga la lista de MPs y sus nombres.
+        '''
+        mps = self.__execute_query_in_sf(
+            query='queries/mps_names.sql',
+            is_path=True
+        )
+        return mps
+
+    def __load_rm_mps(self, mps_names:pd.DataFrame, activity:ActivityIndex) -> pd.DataFrame:
+        '''
+        Esta función junta la lista de MPs con el número de quotes y wos que han hecho en el intervalo.
+        '''
+        mps = (
+            mps_names
+            .merge(activity.window_counts(self.__INTERVAL_DAYS), on='mp_id', how='left')
+            .fillna({'quotes':0, 'wos':0})
+            .astype({'quotes':int, 'wos':int})
+        )
+
+        return mps
+
+    def __load_activity(self) -> ActivityIndex:
+        '''
+        Esta función carga el número de quotes y working orders que cada MP ha tenido por día.
+        La primera vez (y cada ACTIVITY_FULL_RELOAD_HOURS horas) se piden los últimos HISTORY_DAYS días. En los demás refresh
+        se vuelven a pedir los últimos ACTIVITY_REFRESH_DAYS días (o desde el último día del índice anterior, si es antes)
+        y se extiende el índice, para que los quotes borrados y los wos cancelados después de creados dejen de contar.
+        Los que se borran o cancelan en días más viejos se corrigen en la siguiente carga completa.
+
+        :return: ActivityIndex con la actividad diaria de los MPs
+        '''
+        now = datetime.now(timezone.utc)
+        today = now.date()
+        previous = self.__activity
+
+        full = previous is None or now - self.__activity_full_loaded_at > timedelta(hours=self.__ACTIVITY_FULL_RELOAD_HOURS)
+        if full:
+            start_date = today - timedelta(days=self.__HISTORY_DAYS)
+        else:
+            start_date = min(previous.end_date, today - timedelta(days=self.__ACTIVITY_REFRESH_DAYS))
+
+        daily_activity = self.__schemas.apply(
+            'daily_activity',
+            self.__execute_query_in_mb(query='queries/daily_activity.sql', is_path=True, params={'start_date':start_date}, id_col='activity_id')
+        )
+
+        if full:
+            activity = ActivityIndex(daily_activity, start_date=start_date, end_date=today)
+            self.__activity_full_loaded_at = now
+        else:
+            activity = previous.extend(daily_activity, start_date=start_date, end_date=today, history_days=self.__HISTORY_DAYS)
+
+        self.__activity = activity
+        return activity
+
+    def __load_states(self) -> pd.DataFrame:
+        '''
+        Esta función carga los estados y sus códigos
+
+        :return: pd.DataFrame con los estados y sus códigos
+        '''
+        state_codes = (
+            self
+            .__execute_query_in_sf(
+                query='queries/states.sql',
+                is_path=True
+            )
+            .assign(state=lambda x: x.state.replace({'Ciudad de México':'Mexico City'}))
+        )
+        return state_codes
+
+    def __load_mps_products(self) -> pd.DataFrame:
+        '''
+        Esta función carga los productos de raw materials que maneja cada MP
+        '''
+        existing_products = self.__execute_query_in_sf(
+            query='queries/mps_products.sql',
+            is_path=True
+        )
+        return existing_products
+
+    def __load_rm_mps_db(self, addresses:pd.DataFrame, rm_mps:pd.DataFrame, states:pd.DataFrame, mps_products:pd.DataFrame, catalogue:pd.DataFrame) -> pd.DataFrame:
+        '''
+        Esta función se encarga de crear un dataframe con los MPs, sus respectivas ubicaciones y productos
+
+        :return: pd.DataFrame
+        '''
+        db = (
+            addresses
+            .merge(rm_mps, on='mp_id', how='left')
+            .merge(states, on='state_code')
+            .merge(mps_products, on='mp_id')
+            .merge(catalogue, on='product_id')
+        )
+
+        return db
+
+    def __load_rm_index(self, rm_mps_db:pd.DataFrame, states:pd.DataFrame) -> RawMaterialsIndex:
+        '''
+        Esta función arma las listas invertidas de productos y ubicaciones para buscar MPs de raw materials.
+        '''
+        return RawMaterialsIndex(rm_mps_db, states)
+
+    def __load_product_states(self, rm_mps_db:pd.DataFrame) -> ProductStateIndex:
+        '''
+        Esta función precalcula en qué estados está disponible cada producto (para los mapas del Geo Finder).
+        '''
+        return ProductStateIndex(rm_mps_db)
+
+    def __load_mexico_map(self, mexico_shapefile:gpd.GeoDataFrame) -> StateMap:
+        '''
+        Esta función simplifica una sola vez la geometría de los estados para los mapas interactivos.
+        '''
+        return StateMap(mexico_shapefile, tolerance=self.__MAP_TOLERANCE)
+
+    def __execute_query_in_sf(self, query:str, is_path:bool=False) -> pd.DataFrame:
+        '''
+        Esta función ejecuta un query en salesforce y regresa los resultados en un dataframe.
+        Los queries que vienen de un archivo se guardan en el cache local, solo se pide el delta a Salesforce
+        y al resultado se le aplica el esquema del query (nombres y tipos de las columnas).
+        '''
+        if is_path:
+            schema_name = self.__schemas.get_name(query)
+            with open(query, 'r') as f:
+                sf_query = f.read()
+            sf_data = self.__sf_cache.load(schema_name, sf_query, column_types=self.__schemas.get_arrow_types(schema_name))
+            return self.__schemas.apply(schema_name, sf_data)
+
+        sf_data = self.__executor.query_sf(query)
+        if sf_data.size == 0: raise KeyError('records') # igual que extract_data cuando no hay registros
+        return sf_data
+
+    def __execute_query_in_mb(self, query:str, is_path:bool=False, params:dict=None, id_col:str=None) -> pd.DataFrame:
+        '''
+        Esta función ejectua un query en metabase (o lo lee del cache compartido) y regresa los resultados en un dataframe.
+
+        :param query: el query a ejecutar, puede ser el path a un sql file.
+        :param is_path: wether or not to load the query from the specified file
+        :param params: parámetros del query (ver QueryTemplates)
+        :param id_col: id_col es necesario cuando se extraen más de 2,000 registros de MB porque es por el que se ordenan para poder sacarlos todos.
+        '''
+        return self.__executor.query_mb(query, is_path=is_path, params=params, id_col=id_col)
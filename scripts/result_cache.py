@@ -0,0 +1,153 @@
+import threading
+from collections import OrderedDict
+
+class ResultCache:
+    '''
+    Esta clase es un cache LRU acotado para los resultados de las búsquedas.
+    Cada entrada se guarda junto con la versión de los datos con la que se calculó: en cuanto llega
+    una versión nueva se borran todas las entradas viejas, así que nunca se regresan resultados de una foto anterior.
+
+    Los resultados se comparten entre llamadas, por lo que NO se deben modificar.
+    '''
+    def __init__(self, max_entries:int=128) -> None:
+        self.__max_entries = max_entries
+        self.__entries = OrderedDict()
+        self.__version = None
+        self.__lock = threading.Lock()
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__invalidations = 0
+
+    def get_or_compute(self, key:tuple, version:int, function):
+        '''
+        Regresa el resultado guardado para la llave o lo calcula y lo guarda.
+
+        :param key: tupla (hashable) con los argumentos ya normalizados
+        :param version: versión de los datos con los que se calcula el resultado
+        :param function: función sin argumentos que calcula el resultado si no está en el cache
+
+        :return: el resultado de function
+        '''
+        with self.__lock:
+            # Si es una búsqueda sobre una foto más vieja que la que ya vimos, no se busca ni se guarda
+            is_current = self.__check_version(version)
+            if is_current and key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.__hits += 1
+                return self.__entries[key]
+            self.__misses += 1
+
+        # Calculamos fuera del lock para no bloquear otras búsquedas
+        value = function()
+
+        with self.__lock:
+            # Si mientras calculábamos cambió la versión, no guardamos un resultado viejo
+            if not is_current or version != self.__version: return value
+
+            self.__entries[key] = value
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_entries:
+                self.__entries.popitem(last=False)
+                self.__evictions += 1
+        return value
+
+    def clear(self) -> None:
+        '''
+        Borra todas las entradas (los contadores se conservan)
+        '''
+        with self.__lock:
+            self.__invalidations += len(self.__entries)
+            self.__entries.clear()
+
+    def get_stats(self) -> dict:
+        '''
+        Regresa los contadores del cache
+
+        :return: diccionario con hits, misses, evictions, invalidations y entries
+        '''
+        with self.__lock:
+            return {
+                'hits':self.__hits,
+                'misses':self.__misses,
+                'evictions':self.__evictions,
+                'invalidations':self.__invalidations,
+                'entries':len(self.__entries)
+            }
+
+    def __check_version(self, version:int) -> bool:
+        '''
+        Si llegó una versión nueva de los datos, tira todas las entradas. Solo llamar con el lock tomado.
+
+        :return: False si la versión es más vieja que la actual (el resultado no se debe guardar)
+        '''
+        if version == self.__version: return True
+        if self.__version is not None and version < self.__version: return False
+
+        self.__invalidations += len(self.__entries)
+        self.__entries.clear()
+        self.__version = version
+        return True
+
+
+class BytesCache:
+    '''
+    Esta clase es un cache LRU de bytes (eg. imágenes ya renderizadas) acotado por el tamaño total que ocupa.
+    Se comparte entre sesiones, por lo que las llaves deben incluir todo lo que cambia el resultado (incluida la versión de los datos).
+    '''
+    def __init__(self, max_bytes:int=64 * 1024 * 1024) -> None:
+        self.__max_bytes = max_bytes
+        self.__entries = OrderedDict()
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    def get(self, key:tuple) -> bytes:
+        '''
+        Regresa los bytes guardados para la llave, None si no están en el cache
+        '''
+        with self.__lock:
+            value = self.__entries.get(key)
+            if value is None:
+                self.__misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return value
+
+    def put(self, key:tuple, value:bytes) -> None:
+        '''
+        Guarda los bytes y saca los menos usados hasta que el cache quepa en max_bytes.
+        Los valores más grandes que el cache completo no se guardan.
+        '''
+        if len(value) > self.__max_bytes: return
+
+        with self.__lock:
+            if key in self.__entries:
+                self.__size -= len(self.__entries.pop(key))
+            self.__entries[key] = value
+            self.__size += len(value)
+
+            while self.__size > self.__max_bytes:
+                _, evicted = self.__entries.popitem(last=False)
+                self.__size -= len(evicted)
+                self.__evictions += 1
+
+    def get_stats(self) -> dict:
+        '''
+        Regresa los contadores del cache
+
+        :return: diccionario con hits, misses, evictions, entries y bytes
+        '''
+        with self.__lock:
+            return {
+                'hits':self.__hits,
+                'misses':self.__misses,
+                'evictions':self.__evictions,
+                'entries':len(self.__entries),
+                'bytes':self.__size
+            }
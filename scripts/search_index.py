@@ -0,0 +1,307 @@
+import numpy as np
+import pandas as pd
+
+class CapabilityIndex:
+    '''
+    Esta clase precompila la tabla de MPs de manufactura en arreglos de numpy para poder buscarlos sin
+    evaluar queries de pandas en cada rerun de streamlit.
+
+    - Las capabilities se guardan en una matriz booleana (MPs x capabilities)
+    - Estado, región, status, main process y nombre se guardan como códigos enteros
+    - Las columnas por las que se ordena se guardan como arreglos numéricos
+
+    Una búsqueda es un par de operaciones bit a bit más un lexsort sobre los renglones que quedaron.
+    '''
+    def __init__(self, mps:pd.DataFrame, states:pd.DataFrame, capabilities:list, sort_columns:list) -> None:
+        '''
+        :param mps: dataframe de MPs de manufactura con sus ubicaciones (el de ReferenceSnapshot.mps)
+        :param states: dataframe con los estados y sus regiones
+        :param capabilities: nombres de las columnas de capabilities
+        :param sort_columns: columnas numéricas por las que se puede ordenar el resultado
+        '''
+        self.__mps = mps.reset_index(drop=True)
+        self.__capabilities = {capability: i for i, capability in enumerate(capabilities)}
+
+        self.__matrix = (
+            self.__mps
+            [capabilities]
+            .fillna(False)
+            .astype(bool)
+            .to_numpy()
+        )
+
+        self.__codes = {}
+        self.__categories = {}
+        for column in ['state', 'region', 'status', 'main_process', 'Name']:
+            codes, categories = pd.factorize(self.__mps[column])
+            self.__codes[column] = codes
+            self.__categories[column] = {category: code for code, category in enumerate(categories)}
+
+        self.__numeric = {
+            column: pd.to_numeric(self.__mps[column], errors='coerce').to_numpy(dtype=float)
+            for column in sort_columns
+        }
+
+        # Nos quedamos con la primera región de cada estado, igual que cuando se buscaba en el dataframe
+        self.__state_region = (
+            states
+            .drop_duplicates(subset=['state'])
+            .set_index('state')
+            .region
+            .to_dict()
+        )
+
+    def get_region(self, state:str) -> str:
+        '''
+        Regresa la región a la que pertenece el estado
+        '''
+        return self.__state_region[state]
+
+    def search(self, capabilities:list, state:str=None, region:str=None, min_wos:bool=False, min_quotes:bool=False, status:str=None, main_process:str=None) -> np.ndarray:
+        '''
+        Regresa las posiciones de los MPs que cumplen con los filtros, sin repetir nombres (se queda el primero).
+
+        :param capabilities: capabilities que se buscan, el MP debe tener al menos una
+        :param state: estado en el que debe estar el MP (None para no filtrar)
+        :param region: región en la que debe estar el MP (None para no filtrar)
+        :param min_wos: solo MPs con al menos un wo
+        :param min_quotes: solo MPs con al menos un quote. Si también se pide min_wos basta con que cumpla alguno de los dos
+        :param status: status que debe tener el MP (None para no filtrar)
+        :param main_process: main process que debe tener el MP (None para no filtrar)
+
+        :return: arreglo con las posiciones de los renglones encontrados
+        '''
+        columns = [self.__capabilities[capability] for capability in capabilities]
+        mask = self.__matrix[:, columns].any(axis=1)
+
+        if state is not None: mask &= self.__equals('state', state)
+        if region is not None: mask &= self.__equals('region', region)
+        if status is not None: mask &= self.__equals('status', status)
+        if main_process is not None: mask &= self.__equals('main_process', main_process)
+
+        if min_wos and min_quotes:
+            mask &= (self.__numeric['wos'] > 0) | (self.__numeric['quotes'] > 0)
+        elif min_wos:
+            mask &= self.__numeric['wos'] > 0
+        elif min_quotes:
+            mask &= self.__numeric['quotes'] > 0
+
+        rows = np.flatnonzero(mask)
+        _, first = np.unique(self.__codes['Name'][rows], return_index=True)
+        return rows[np.sort(first)]
+
+    def sort(self, rows:np.ndarray, capabilities:list, sort_columns:list) -> np.ndarray:
+        '''
+        Ordena los renglones de forma descendente por el número de capabilities que cumplen y luego por las columnas especificadas.
+        Los valores nulos se van al final.
+
+        :param rows: posiciones de los renglones a ordenar
+        :param capabilities: capabilities que se buscaron
+        :param sort_columns: columnas numéricas con las que se desempata, en orden de prioridad
+        '''
+        columns = [self.__capabilities[capability] for capability in capabilities]
+        total = self.__matrix[np.ix_(rows, columns)].sum(axis=1)
+
+        # lexsort ordena por la última llave primero y de forma ascendente, por eso se niegan (-nan sigue siendo nan y queda al final)
+        keys = [-self.__numeric[column][rows] for column in reversed(sort_columns)]
+        keys.append(-total)
+        return rows[np.lexsort(keys)]
+
+    def get_rows(self, rows:np.ndarray, columns:list) -> pd.DataFrame:
+        '''
+        Regresa las columnas pedidas de los renglones especificados
+        '''
+        return self.__mps[columns].iloc[rows]
+
+    def get_capabilities(self, rows:np.ndarray, capabilities:list) -> pd.DataFrame:
+        '''
+        Regresa la matriz de capabilities de los renglones especificados como dataframe booleano
+        '''
+        columns = [self.__capabilities[capability] for capability in capabilities]
+        return pd.DataFrame(self.__matrix[np.ix_(rows, columns)], columns=capabilities)
+
+    def __equals(self, column:str, value) -> np.ndarray:
+        '''
+        Compara la columna codificada contra un valor. Si el valor no existe ningún renglón cumple.
+        '''
+        code = self.__categories[column].get(value)
+        if code is None:
+            return np.zeros(self.__codes[column].size, dtype=bool)
+        return self.__codes[column] == code
+
+
+class RawMaterialsIndex:
+    '''
+    Esta clase guarda listas invertidas (postings) de la tabla de MPs de raw materials:
+    para cada producto, estado y región, las posiciones ordenadas de los renglones que les corresponden.
+
+    Una búsqueda es la unión de las listas de los productos pedidos intersectada con la lista de la ubicación,
+    y la matriz de productos por MP se arma directo de los pares (MP, producto) encontrados.
+    '''
+    def __init__(self, db:pd.DataFrame, states:pd.DataFrame) -> None:
+        '''
+        :param db: dataframe con los MPs, sus ubicaciones y productos (el de ReferenceSnapshot.rm_mps_db)
+        :param states: dataframe con los estados y sus regiones
+        '''
+        self.__db = db.reset_index(drop=True)
+
+        product_codes, product_ids = pd.factorize(self.__db.product_id)
+        self.__product_codes = product_codes
+        self.__mp_codes = pd.factorize(self.__db.mp_id)[0]
+        self.__n_products = product_ids.size
+
+        self.__by_product = self.__postings(product_codes)
+        self.__by_state = self.__postings_by_value(self.__db.state)
+        self.__by_region = self.__postings_by_value(self.__db.region)
+
+        # Un nombre de producto puede tener varios ids en el catálogo
+        self.__product_name_codes = (
+            pd.DataFrame({'product_name':self.__db.product_name, 'code':product_codes})
+            .drop_duplicates()
+            .groupby('product_name')
+            .code
+            .apply(np.array)
+            .to_dict()
+        )
+
+        self.__state_region = (
+            states
+            .drop_duplicates(subset=['state'])
+            .set_index('state')
+            .region
+            .to_dict()
+        )
+
+    def get_region(self, state:str) -> str:
+        '''
+        Regresa la región a la que pertenece el estado
+        '''
+        return self.__state_region[state]
+
+    def search(self, products:list, state:str=None, region:str=None) -> np.ndarray:
+        '''
+        Regresa las posiciones de los renglones con alguno de los productos en la ubicación especificada.
+        Solo se regresa el primer renglón de cada par (MP, producto).
+
+        :param products: lista con los nombres de los productos
+        :param state: estado en el que se busca (None para no filtrar)
+        :param region: región en la que se busca (None para no filtrar)
+
+        :return: arreglo ordenado con las posiciones de los renglones
+        '''
+        empty = np.array([], dtype=np.int64)
+        codes = [code for product in products for code in self.__product_name_codes.get(product, [])]
+        rows = np.unique(np.concatenate([self.__by_product[code] for code in codes])) if len(codes) > 0 else empty
+
+        if state is not None:
+            rows = np.intersect1d(rows, self.__by_state.get(state, empty), assume_unique=True)
+        if region is not None:
+            rows = np.intersect1d(rows, self.__by_region.get(region, empty), assume_unique=True)
+
+        pairs = self.__mp_codes[rows].astype(np.int64) * self.__n_products + self.__product_codes[rows]
+        _, first = np.unique(pairs, return_index=True)
+        return rows[np.sort(first)]
+
+    def get_rows(self, rows:np.ndarray, columns:list) -> pd.DataFrame:
+        '''
+        Regresa las columnas pedidas de los renglones especificados
+        '''
+        return self.__db[columns].iloc[rows].reset_index(drop=True)
+
+    def get_product_matrix(self, found:pd.DataFrame, index_columns:list, sort_columns:list) -> pd.DataFrame:
+        '''
+        Arma la matriz booleana de productos por MP a partir de los pares encontrados (un renglón por MP y producto).
+        Los productos van en orden alfabético y los MPs se ordenan de forma descendente por el número de productos
+        que tienen y luego por sort_columns.
+
+        :param found: dataframe con las columnas de index_columns y product_name
+        :param index_columns: columnas que identifican a cada renglón del resultado (eg. mp_name, quotes, wos)
+        :param sort_columns: columnas con las que se desempata después del total de productos
+
+        :return: dataframe con index_columns y una columna booleana por producto
+        '''
+        row_codes = found.groupby(index_columns, sort=True, dropna=False, observed=True).ngroup().to_numpy()
+        product_codes, product_names = pd.factorize(found.product_name, sort=True)
+        _, first = np.unique(row_codes, return_index=True)
+
+        matrix = np.zeros((first.size, product_names.size), dtype=bool)
+        matrix[row_codes, product_codes] = True
+
+        result = pd.concat(
+            (found[index_columns].iloc[first].reset_index(drop=True), pd.DataFrame(matrix, columns=product_names)),
+            axis=1
+        )
+
+        # lexsort ordena por la última llave primero y de forma ascendente, por eso se usan los códigos negados
+        keys = [-pd.factorize(result[column], sort=True)[0] for column in reversed(sort_columns)]
+        keys.append(-matrix.sum(axis=1))
+        return result.iloc[np.lexsort(keys)].reset_index(drop=True)
+
+    def __postings_by_value(self, values:pd.Series) -> dict:
+        '''
+        Regresa un diccionario valor -> posiciones ordenadas de los renglones con ese valor
+        '''
+        codes, uniques = pd.factorize(values)
+        postings = self.__postings(codes)
+        return {uniques[code]: rows for code, rows in postings.items()}
+
+    def __postings(self, codes:np.ndarray) -> dict:
+        '''
+        Regresa un diccionario código -> posiciones ordenadas de los renglones con ese código (se ignoran los nulos, código -1)
+        '''
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        splits = np.flatnonzero(np.diff(sorted_codes)) + 1
+        return {
+            int(group_codes[0]): rows
+            for group_codes, rows in zip(np.split(sorted_codes, splits), np.split(order, splits))
+            if group_codes.size > 0 and group_codes[0] >= 0
+        }
+
+
+class ProductStateIndex:
+    '''
+    Esta clase precalcula, para todos los productos de raw materials, cuántos renglones hay en cada estado
+    (matriz productos x estados) y qué MPs los tienen. Con eso el mapa de un producto es leer un renglón de la matriz.
+    '''
+    def __init__(self, db:pd.DataFrame) -> None:
+        '''
+        :param db: dataframe con los MPs, sus ubicaciones y productos (el de ReferenceSnapshot.rm_mps_db)
+        '''
+        db = db.dropna(subset=['product_name', 'state'])
+        product_codes, products = pd.factorize(db.product_name)
+        state_codes, states = pd.factorize(db.state)
+
+        self.__products = {product: code for code, product in enumerate(products)}
+        self.__states = np.asarray(states, dtype=object)
+
+        self.__counts = np.zeros((products.size, states.size), dtype=np.int64)
+        np.add.at(self.__counts, (product_codes, state_codes), 1)
+
+        self.__mps = (
+            pd.DataFrame({'product':product_codes, 'state':state_codes, 'mp_name':db.mp_name.to_numpy()})
+            .dropna(subset=['mp_name'])
+            .groupby(['product', 'state'])
+            .mp_name
+            .unique()
+            .apply(np.sort)
+            .to_dict()
+        )
+
+    def get_counts(self, product:str) -> pd.DataFrame:
+        '''
+        Regresa los estados donde está disponible el producto
+
+        :param product: nombre del producto
+        :return: dataframe con columnas state, total, mps (arreglo con los nombres de los MPs)
+        '''
+        code = self.__products.get(product)
+        if code is None:
+            return pd.DataFrame({'state':pd.Series(dtype=object), 'total':pd.Series(dtype=np.int64), 'mps':pd.Series(dtype=object)})
+
+        states = np.flatnonzero(self.__counts[code] > 0)
+        return pd.DataFrame({
+            'state':self.__states[states],
+            'total':self.__counts[code, states],
+            'mps':[self.__mps.get((code, state), np.array([], dtype=object)) for state in states]
+        })
@@ -0,0 +1,257 @@
+import os
+import re
+import json
+import uuid
+import logging
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import TYPE_CHECKING
+from scripts.sf_stream import SalesforceStreamer
+
+# Solo para las anotaciones, de la conexión únicamente se usa extract_data
+if TYPE_CHECKING:
+    from my_apis.sf_connection import SalesforceConnection
+
+logger = logging.getLogger(__name__)
+
+class SalesforceTableCache:
+    '''
+    Esta clase guarda en disco (parquet) el resultado de queries sencillos de Salesforce junto con su watermark
+    (el SystemModstamp más reciente que se ha visto). El watermark va en la metadata del mismo parquet, así que la tabla
+    y su watermark siempre se reemplazan juntos.
+
+    En un arranque en caliente se lee el parquet local y solo se piden a Salesforce los registros que cambiaron desde
+    el watermark, más la lista de ids vigentes para poder quitar los que se borraron o ya no cumplen el filtro.
+    '''
+    def __init__(self, sfc:'SalesforceConnection', cache_dir:str='cache/salesforce', streamer:SalesforceStreamer=None) -> None:
+        '''
+        :param sfc: conexión a Salesforce
+        :param cache_dir: carpeta donde se guardan las tablas
+        :param streamer: si se especifica, los queries se leen página por página con él en lugar de extract_data
+        '''
+        self.__METADATA_KEY = b'sf_cache'
+
+        self.__sfc = sfc
+        self.__streamer = streamer
+        self.__cache_dir = cache_dir
+        self.__locks = {}
+        self.__locks_lock = threading.Lock()
+
+    def load(self, name:str, query:str, column_types:dict=None) -> pd.DataFrame:
+        '''
+        Regresa el resultado del query, usando la copia local si existe y pidiendo solo el delta a Salesforce.
+
+        :param name: nombre con el que se guarda la tabla en el cache (eg. 'addresses')
+        :param query: query de SOQL de la forma select campos from objeto [where filtro]
+        :param column_types: tipos de arrow de los campos (ver QuerySchemas.get_arrow_types) para leer con el streamer
+
+        :return: pd.DataFrame con las mismas columnas que regresaría el query original
+        '''
+        fields, sobject, where = self.__parse_query(query)
+
+        with self.__get_lock(name):
+            cached, metadata = self.__read(name)
+
+            if cached is not None and metadata.get('query') == self.__normalize(query):
+                table = self.__load_delta(cached, fields, sobject, where, metadata['watermark'], column_types)
+            else:
+                table = self.__load_full(fields, sobject, where, column_types)
+
+            self.__write(name, table, query)
+
+        return self.__select_fields(table, fields)
+
+    def invalidate(self, name:str=None) -> None:
+        '''
+        Borra del disco la tabla especificada (o todas) para que la siguiente carga sea completa.
+
+        :param name: nombre de la tabla en el cache, None para borrarlas todas
+        '''
+        if not os.path.exists(self.__cache_dir): return
+
+        for file in os.listdir(self.__cache_dir):
+            file_name = file.rsplit('.', 1)[0]
+            if name is None or file_name == name:
+                os.remove(os.path.join(self.__cache_dir, file))
+
+    def __load_full(self, fields:list, sobject:str, where:str, column_types:dict) -> pd.DataFrame:
+        '''
+        Trae la tabla completa desde Salesforce, incluyendo Id y SystemModstamp
+        '''
+        query = f'select {", ".join(self.__tracked_fields(fields))} from {sobject}'
+        if where is not None:
+            query += f' where {where}'
+        return self.__extract(query, column_types)
+
+    def __load_delta(self, cached:pd.DataFrame, fields:list, sobject:str, where:str, watermark:str, column_types:dict) -> pd.DataFrame:
+        '''
+        Actualiza la tabla local con los cambios desde el watermark.
+        1. Pedimos los ids vigentes para quitar los registros borrados o que ya no cumplen el filtro
+        2. Pedimos los registros modificados desde el watermark y los reemplazamos en la tabla local
+        '''
+        ids_query = f'select Id from {sobject}'
+        if where is not None:
+            ids_query += f' where {where}'
+        current_ids = self.__extract(ids_query, column_types)
+
+        # Usamos >= porque el watermark está truncado a segundos; los repetidos se reemplazan por Id
+        delta_filter = f'SystemModstamp >= {watermark}'
+        if where is not None:
+            delta_filter = f'({where}) and {delta_filter}'
+        changes = self.__extract(
+            f'select {", ".join(self.__tracked_fields(fields))} from {sobject} where {delta_filter}',
+            column_types
+        )
+
+        if current_ids.size == 0:
+            return cached.iloc[0:0]
+
+        table = cached[cached.Id.isin(current_ids.Id)]
+        if changes.size > 0:
+            table, changes = self.__align_dtypes(table[~table.Id.isin(changes.Id)], changes[table.columns])
+            table = pd.concat((table, changes), ignore_index=True)
+        return table.reset_index(drop=True)
+
+    def __align_dtypes(self, table:pd.DataFrame, changes:pd.DataFrame) -> tuple:
+        '''
+        Iguala los tipos de las columnas que vienen completamente vacías en alguno de los dos lados
+        (eg. un campo sin valores en el delta) para que pd.concat no tenga que adivinar el tipo.
+        '''
+        for column in table.columns:
+            table_type, changes_type = table[column].dtype, changes[column].dtype
+            if table_type == changes_type: continue
+
+            if changes[column].isna().all() and table_type.kind in 'fOMm':
+                changes = changes.astype({column:table_type})
+            elif table[column].isna().all() and changes_type.kind in 'fOMm':
+                table = table.astype({column:changes_type})
+            else:
+                table = table.astype({column:object})
+                changes = changes.astype({column:object})
+        return table, changes
+
+    def __extract(self, query:str, column_types:dict=None) -> pd.DataFrame:
+        '''
+        Ejecuta el query en Salesforce, con el streamer si hay (y con extract_data si falla).
+        extract_data truena con KeyError cuando no hay registros.
+        '''
+        if self.__streamer is not None:
+            try:
+                return self.__streamer.query_data(query, column_types=column_types)
+            except Exception:
+                # eg. la sesión no se pudo renovar o el REST API no responde: se lee con la conexión de siempre
+                logger.warning('Salesforce REST query failed, falling back to extract_data', exc_info=True)
+        try:
+            return self.__sfc.extract_data(query)
+        except KeyError:
+            return pd.DataFrame()
+
+    def __tracked_fields(self, fields:list) -> list:
+        '''
+        Agrega Id y SystemModstamp a los campos pedidos (sin repetirlos, Salesforce no acepta campos duplicados)
+        '''
+        tracked = ['Id', 'SystemModstamp']
+        return tracked + [field for field in fields if field.lower() not in ('id', 'systemmodstamp')]
+
+    def __select_fields(self, table:pd.DataFrame, fields:list) -> pd.DataFrame:
+        '''
+        Regresa solo las columnas que pidió el query original, en el mismo orden.
+        Salesforce regresa los nombres de los campos con su capitalización oficial, por eso se comparan en minúsculas.
+        '''
+        columns = {column.lower(): column for column in table.columns}
+        return table[[columns[field.lower()] for field in fields if field.lower() in columns]]
+
+    def __parse_query(self, query:str) -> tuple:
+        '''
+        Separa un query de SOQL sencillo en campos, objeto y filtro.
+
+        :return: (lista de campos, objeto, filtro o None)
+        '''
+        match = re.match(
+            r'^\s*select\s+(?P<fields>.+?)\s+from\s+(?P<sobject>\w+)(?:\s+where\s+(?P<where>.+?))?\s*;?\s*$',
+            query,
+            flags=re.IGNORECASE | re.DOTALL
+        )
+        if match is None or re.search(r'\b(group\s+by|order\s+by|limit|offset)\b|\(\s*select', query, flags=re.IGNORECASE):
+            raise Exception(f'Unsupported query for cache: {query}')
+
+        fields = [field.strip() for field in match.group('fields').split(',')]
+        where = match.group('where')
+        return fields, match.group('sobject'), where.strip() if where is not None else None
+
+    def __normalize(self, query:str) -> str:
+        return ' '.join(query.split()).lower()
+
+    def __read(self, name:str) -> tuple:
+        '''
+        Lee la tabla y su metadata del cache
+
+        :return: (pd.DataFrame o None, diccionario con la metadata)
+        '''
+        data_path = self.__path(name)
+        if not os.path.exists(data_path):
+            return None, {}
+
+        table = pq.read_table(data_path)
+        metadata = json.loads((table.schema.metadata or {}).get(self.__METADATA_KEY, b'{}'))
+        if metadata.get('watermark') is None:
+            return None, {}
+        return table.to_pandas(), metadata
+
+    def __write(self, name:str, table:pd.DataFrame, query:str) -> None:
+        '''
+        Guarda la tabla con su watermark en la metadata del parquet. Se escribe a un archivo temporal (único por proceso y
+        escritura) y luego se reemplaza para que otros procesos nunca lean un archivo a medias.
+        '''
+        if table.size == 0: return
+
+        os.makedirs(self.__cache_dir, exist_ok=True)
+        data_path = self.__path(name)
+
+        modstamps = pd.to_datetime(table.SystemModstamp, format='ISO8601', utc=True)
+        metadata = {
+            'query':self.__normalize(query),
+            'watermark':modstamps.max().strftime('%Y-%m-%dT%H:%M:%SZ')
+        }
+
+        try:
+            arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Alguna columna trae tipos mezclados (eg. números y texto): esas se guardan como texto
+            arrow_table = pa.Table.from_pandas(self.__mixed_to_text(name, table), preserve_index=False)
+        arrow_table = arrow_table.replace_schema_metadata({
+            **(arrow_table.schema.metadata or {}),
+            self.__METADATA_KEY:json.dumps(metadata).encode()
+        })
+
+        tmp_path = f'{data_path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+        pq.write_table(arrow_table, tmp_path)
+        os.replace(tmp_path, data_path)
+
+        # Las versiones anteriores guardaban la metadata en un json aparte
+        legacy_metadata_path = os.path.join(self.__cache_dir, f'{name}.json')
+        if os.path.exists(legacy_metadata_path): os.remove(legacy_metadata_path)
+
+    def __mixed_to_text(self, name:str, table:pd.DataFrame) -> pd.DataFrame:
+        '''
+        Convierte a texto las columnas que arrow no puede guardar con un solo tipo (los vacíos se quedan vacíos)
+        '''
+        for column in table.columns[table.dtypes == object]:
+            values = table[column]
+            try:
+                pa.array(values, from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                logger.warning('Column %s of cached Salesforce table %s has mixed types, saving it as text', column, name)
+                table = table.assign(**{column: values.astype(str).where(values.notna(), None)})
+        return table
+
+    def __path(self, name:str) -> str:
+        return os.path.join(self.__cache_dir, f'{name}.parquet')
+
+    def __get_lock(self, name:str) -> threading.Lock:
+        with self.__locks_lock:
+            if name not in self.__locks:
+                self.__locks[name] = threading.Lock()
+            return self.__locks[name]
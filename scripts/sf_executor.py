@@ -0,0 +1,99 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+class TokenBucket:
+    '''
+    Limitador de ritmo: se pueden hacer hasta `capacity` llamadas seguidas y después `rate` llamadas por segundo.
+    Es seguro usarlo desde varios hilos.
+    '''
+    def __init__(self, rate:float, capacity:int=None) -> None:
+        '''
+        :param rate: llamadas por segundo que se recuperan
+        :param capacity: máximo de llamadas que se pueden acumular (ráfaga), por default igual a rate
+        '''
+        if rate <= 0:
+            raise Exception(f'Invalid rate: {rate}')
+
+        self.__rate = float(rate)
+        self.__capacity = float(capacity if capacity is not None else max(1, rate))
+        self.__tokens = self.__capacity
+        self.__updated_at = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self, tokens:float=1) -> None:
+        '''
+        Espera hasta que haya tokens suficientes y los consume
+        '''
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.__capacity, self.__tokens + (now - self.__updated_at) * self.__rate)
+                self.__updated_at = now
+
+                if self.__tokens >= tokens:
+                    self.__tokens -= tokens
+                    return
+                wait_time = (tokens - self.__tokens) / self.__rate
+            time.sleep(wait_time)
+
+
+class SalesforceExecutor:
+    '''
+    Esta clase ejecuta llamadas a Salesforce en paralelo (con un número máximo de hilos) respetando un límite de llamadas por segundo.
+    También calcula las esperas para los reintentos: backoff exponencial con jitter, para que los hilos que fallaron al mismo tiempo
+    no vuelvan a chocar al mismo tiempo.
+    '''
+    def __init__(self, max_workers:int=4, requests_per_second:float=10.0, burst:int=None, max_retries:int=5, base_delay:float=1.0, max_delay:float=60.0) -> None:
+        '''
+        :param max_workers: número máximo de llamadas simultáneas
+        :param requests_per_second: límite de llamadas por segundo
+        :param burst: número de llamadas que se pueden hacer de golpe antes de que aplique el límite
+        :param max_retries: número máximo de reintentos de un registro con error temporal
+        :param base_delay: espera (segundos) del primer reintento, se duplica en cada reintento
+        :param max_delay: espera máxima (segundos) entre reintentos
+        '''
+        self.__max_workers = max_workers
+        self.__bucket = TokenBucket(requests_per_second, burst)
+        self.__max_retries = max_retries
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+
+    def get_max_retries(self) -> int:
+        return self.__max_retries
+
+    def run(self, function, items:list, on_done=None) -> list:
+        '''
+        Ejecuta function sobre cada elemento, en paralelo y respetando el límite de llamadas por segundo.
+
+        :param function: función que recibe un elemento y hace una llamada a Salesforce
+        :param items: lista de elementos
+        :param on_done: función opcional que se llama (desde el hilo principal) cada vez que termina un elemento, recibe cuántos van
+
+        :return: lista con el resultado de cada elemento, en el mismo orden que items
+        '''
+        def limited(item):
+            self.__bucket.acquire()
+            return function(item)
+
+        results = [None] * len(items)
+        with ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix='salesforce') as executor:
+            futures = {executor.submit(limited, item): i for i, item in enumerate(items)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = future.result()
+                if on_done is not None: on_done(done)
+        return results
+
+    def backoff(self, attempt:int, retry_after:float=None) -> None:
+        '''
+        Espera antes de un reintento: base_delay * 2^attempt con jitter completo, sin pasar de max_delay.
+        Si Salesforce mandó Retry-After se espera al menos eso.
+
+        :param attempt: número de reintento (empezando en 0)
+        :param retry_after: segundos que pidió esperar el servidor
+        '''
+        delay = random.uniform(0, min(self.__max_delay, self.__base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        time.sleep(delay)
@@ -0,0 +1,135 @@
+import json
+import threading
+import requests
+from urllib.parse import urljoin
+from simple_salesforce import Salesforce
+
+class SalesforceRest:
+    '''
+    Esta clase hace llamadas directas al REST API de Salesforce (eg. sObject Collections) con la sesión de un cliente
+    de simple_salesforce. El cliente se pasa explícito o se crea con las credenciales (el mismo json que usa
+    SalesforceConnection), porque SalesforceConnection no expone el suyo.
+
+    Con credenciales el login se hace hasta la primera llamada, y si Salesforce responde que la sesión ya no es válida
+    (401 INVALID_SESSION_ID) se hace login otra vez y se repite la llamada una sola vez.
+
+    También se puede construir con cualquier base_url y headers, lo que permite probarla contra un servidor HTTP local.
+    '''
+    def __init__(self, base_url:str=None, headers:dict=None, session:requests.Session=None, client:Salesforce=None, credentials=None, timeout:int=120) -> None:
+        '''
+        :param base_url: url base del REST API, eg. https://<instancia>/services/data/v59.0/
+        :param headers: headers de cada llamada (incluye la autorización)
+        :param session: requests.Session a usar, si no se especifica se usa la del cliente (o una nueva)
+        :param client: instancia de simple_salesforce de la que se toman base_url, headers y session en cada llamada
+        :param credentials: diccionario o path a un json para crear el cliente (ver login) y renovarlo cuando caduque
+        :param timeout: segundos máximos de espera por llamada
+        '''
+        if client is None and base_url is None and credentials is None:
+            raise Exception('Either base_url or client (or credentials) must be specified')
+
+        self.__base_url = base_url
+        self.__headers = headers or {}
+        self.__client = client
+        self.__credentials = credentials
+        self.__session = session if session is not None or client is not None or credentials is not None else requests.Session()
+        self.__timeout = timeout
+        self.__login_lock = threading.Lock()
+
+    @staticmethod
+    def login(credentials) -> Salesforce:
+        '''
+        Abre una sesión de simple_salesforce con las credenciales de Salesforce.
+
+        :param credentials: diccionario o path a un json con username, password, security_token y domain (opcional)
+        :return: Salesforce
+        '''
+        if credentials is None:
+            raise Exception('Salesforce credentials are required to use the REST API')
+        if isinstance(credentials, str):
+            with open(credentials, 'r') as f:
+                credentials = json.load(f)
+
+        missing = [key for key in ['username', 'password', 'security_token'] if key not in credentials]
+        if len(missing) > 0:
+            raise Exception(f'Salesforce credentials are missing {missing}')
+
+        return Salesforce(
+            username=credentials['username'],
+            password=credentials['password'],
+            security_token=credentials['security_token'],
+            domain=credentials.get('domain', 'login')
+        )
+
+    @classmethod
+    def from_credentials(cls, credentials, timeout:int=120) -> 'SalesforceRest':
+        '''
+        Construye el cliente con las credenciales de Salesforce. El login se hace hasta la primera llamada (ver login)
+        '''
+        if credentials is None:
+            raise Exception('Salesforce credentials are required to use the REST API')
+        return cls(credentials=credentials, timeout=timeout)
+
+    def get_base_url(self) -> str:
+        # Se leen del cliente en cada llamada porque simple_salesforce los actualiza cuando renueva la sesión
+        client = self.__get_client()
+        return client.base_url if client is not None else self.__base_url
+
+    def request(self, method:str, path:str, payload=None, params:dict=None, headers:dict=None) -> requests.Response:
+        '''
+        Hace una llamada al REST API.
+
+        :param method: método HTTP (GET, POST, PATCH, DELETE)
+        :param path: ruta relativa a base_url (eg. composite/sobjects) o absoluta en el servidor (eg. el nextRecordsUrl
+            de un query, /services/data/v59.0/query/01g...-2000)
+        :param payload: cuerpo de la llamada (se manda como JSON)
+        :param params: parámetros del url (eg. {'q':query})
+        :param headers: headers adicionales
+
+        :return: requests.Response (no se revisa el status, eso le toca al que llama)
+        '''
+        client = self.__get_client()
+        response = self.__send(client, method, path, payload, params, headers)
+        if self.__credentials is not None and response.status_code == 401 and 'INVALID_SESSION_ID' in response.text:
+            response = self.__send(self.__login_again(client), method, path, payload, params, headers)
+        return response
+
+    def __send(self, client:Salesforce, method:str, path:str, payload, params:dict, headers:dict) -> requests.Response:
+        request_headers = dict(client.headers if client is not None else self.__headers)
+        request_headers['Content-Type'] = 'application/json'
+        request_headers.update(headers or {})
+
+        base_url = client.base_url if client is not None else self.__base_url
+        if path.startswith('/'):
+            url = urljoin(base_url, path)
+        else:
+            url = base_url + path
+
+        session = self.__session if self.__session is not None else client.session
+        return session.request(
+            method,
+            url,
+            headers=request_headers,
+            params=params,
+            data=json.dumps(payload) if payload is not None else None,
+            timeout=self.__timeout
+        )
+
+    def __get_client(self) -> Salesforce:
+        '''
+        Regresa el cliente, haciendo login la primera vez si se especificaron credenciales (None si se usa base_url)
+        '''
+        if self.__client is None and self.__credentials is not None:
+            with self.__login_lock:
+                if self.__client is None:
+                    self.__client = self.login(self.__credentials)
+        return self.__client
+
+    def __login_again(self, expired:Salesforce) -> Salesforce:
+        '''
+        Reemplaza el cliente cuya sesión caducó. Si varios hilos se topan con la misma sesión caducada solo el primero
+        hace login; los demás usan el cliente nuevo.
+        '''
+        with self.__login_lock:
+            if self.__client is expired:
+                self.__client = self.login(self.__credentials)
+            return self.__client
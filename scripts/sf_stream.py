@@ -0,0 +1,108 @@
+import pandas as pd
+import pyarrow as pa
+from scripts.sf_rest import SalesforceRest
+
+class SalesforceStreamer:
+    '''
+    Esta clase ejecuta queries de SOQL con el REST API y regresa el resultado página por página (siguiendo nextRecordsUrl)
+    como record batches de arrow, en lugar de juntar todos los registros en una sola lista como extract_data.
+
+    De cada página se quita el campo attributes y se convierte a arrow en cuanto llega, así en memoria solo hay una página
+    en JSON a la vez. Las páginas se juntan con pa.concat_tables, que no copia los datos.
+
+    Las columnas con tipo conocido (column_types, eg. QuerySchemas.get_arrow_types) se convierten a ese tipo en cada página,
+    así no cambian de tipo entre páginas; las demás se infieren.
+    '''
+    def __init__(self, rest:SalesforceRest, page_size:int=2000) -> None:
+        '''
+        :param rest: cliente del REST API de Salesforce
+        :param page_size: registros por página que se le piden a Salesforce (entre 200 y 2000)
+        '''
+        if not 200 <= page_size <= 2000:
+            raise Exception(f'Invalid page size: {page_size}. Salesforce accepts between 200 and 2000 records per page')
+
+        self.__rest = rest
+        self.__page_size = page_size
+
+    @classmethod
+    def from_rest(cls, rest:SalesforceRest) -> 'SalesforceStreamer':
+        '''
+        Construye el streamer con el cliente del REST API (que renueva la sesión cuando caduca).
+
+        :return: SalesforceStreamer, o None si no hay cliente (en ese caso se usa extract_data)
+        '''
+        if rest is None:
+            return None
+        return cls(rest)
+
+    def iter_batches(self, query:str, column_types:dict=None):
+        '''
+        Ejecuta el query y regresa una página a la vez.
+
+        :param query: query de SOQL
+        :param column_types: diccionario campo -> tipo de pyarrow. Los campos que no vengan se infieren en cada página
+        :return: generador de pa.RecordBatch
+        '''
+        response = self.__get('query', params={'q':query})
+        while True:
+            records = [self.__flatten(record) for record in response.get('records', [])]
+            if len(records) > 0:
+                yield self.__to_batch(records, column_types or {})
+            del records
+
+            next_url = response.get('nextRecordsUrl')
+            if response.get('done', True) or next_url is None:
+                break
+            response = self.__get(next_url)
+
+    def query_table(self, query:str, column_types:dict=None) -> pa.Table:
+        '''
+        Ejecuta el query y regresa el resultado completo como tabla de arrow.
+        Los tipos inferidos que cambian entre páginas (eg. una columna que en una página solo trae nulos) se promueven al tipo común.
+        '''
+        tables = [pa.Table.from_batches([batch]) for batch in self.iter_batches(query, column_types)]
+        if len(tables) == 0:
+            return pa.table({})
+        return pa.concat_tables(tables, promote_options='permissive')
+
+    def query_data(self, query:str, column_types:dict=None) -> pd.DataFrame:
+        '''
+        Ejecuta el query y regresa el resultado como pd.DataFrame (vacío si no hay registros)
+        '''
+        return self.query_table(query, column_types).to_pandas()
+
+    def __get(self, path:str, params:dict=None) -> dict:
+        response = self.__rest.request('GET', path, params=params, headers={'Sforce-Query-Options':f'batchSize={self.__page_size}'})
+        if response.status_code >= 300:
+            raise Exception(f'Salesforce query failed with {response.status_code}: {response.text[:500]}')
+        return response.json()
+
+    def __to_batch(self, records:list, column_types:dict) -> pa.RecordBatch:
+        '''
+        Convierte una página a arrow, columna por columna. Si un campo no se puede convertir a su tipo
+        (eg. un número que Salesforce regresa como texto) se infiere y QuerySchemas lo convierte después.
+        '''
+        fields = list(dict.fromkeys(field for record in records for field in record))
+        arrays = []
+        for field in fields:
+            values = [record.get(field) for record in records]
+            arrow_type = column_types.get(field)
+            try:
+                arrays.append(pa.array(values, type=arrow_type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                if arrow_type is None: raise
+                arrays.append(pa.array(values))
+        return pa.RecordBatch.from_arrays(arrays, names=fields)
+
+    def __flatten(self, record:dict, prefix:str='') -> dict:
+        '''
+        Quita attributes del registro y aplana las relaciones (eg. Account.Name) en columnas con punto
+        '''
+        flat = {}
+        for field, value in record.items():
+            if field == 'attributes': continue
+            if isinstance(value, dict) and 'attributes' in value:
+                flat.update(self.__flatten(value, f'{prefix}{field}.'))
+            else:
+                flat[f'{prefix}{field}'] = value
+        return flat
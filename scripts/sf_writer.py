@@ -0,0 +1,170 @@
+import math
+import requests
+import numpy as np
+import pandas as pd
+from datetime import date, datetime
+from streamlit import markdown
+from scripts.sf_rest import SalesforceRest
+from scripts.sf_executor import SalesforceExecutor
+
+class SalesforceWriter:
+    '''
+    Esta clase actualiza registros de Salesforce en lotes con sObject Collections (hasta 200 registros por llamada)
+    en lugar de una llamada por registro.
+
+    Los lotes se mandan con allOrNone = false, así que un registro con error no detiene a los demás; el resultado de cada
+    registro se revisa por separado.
+
+    Los lotes se mandan en paralelo con SalesforceExecutor (hilos limitados y un máximo de llamadas por segundo). Los errores
+    temporales (límite de llamadas, registro bloqueado, errores de red) se reintentan con backoff, pero solo los registros
+    que fallaron; los demás errores se reportan sin reintentar.
+    '''
+    def __init__(self, rest:SalesforceRest, batch_size:int=200, executor:SalesforceExecutor=None) -> None:
+        '''
+        :param rest: cliente del REST API de Salesforce
+        :param batch_size: registros por llamada (el máximo que acepta Salesforce es 200)
+        :param executor: SalesforceExecutor con el que se mandan los lotes, si no se especifica se usa uno con los valores por default
+        '''
+        if not 0 < batch_size <= 200:
+            raise Exception(f'Invalid batch size: {batch_size}. Salesforce accepts between 1 and 200 records per call')
+
+        self.__RETRY_STATUS = {429, 502, 503, 504}
+        self.__RETRY_CODES = {'REQUEST_LIMIT_EXCEEDED', 'UNABLE_TO_LOCK_ROW', 'SERVER_UNAVAILABLE'}
+
+        self.__rest = rest
+        self.__batch_size = batch_size
+        self.__executor = executor if executor is not None else SalesforceExecutor()
+
+    def update_records(self, object_type:str, records:list, verbose:bool=False, print_every:int=1) -> list:
+        '''
+        Actualiza los registros especificados.
+
+        :param object_type: el tipo de objeto en salesforce que se modificará (eg. Account)
+        :param records: lista de tuplas (salesforce id, diccionario campo -> valor)
+        :param verbose: si se quiere imprimir el avance (cada print_every lotes)
+
+        :return: lista de tuplas (posición del registro en records, mensaje de error, campos con error) con los registros que no se actualizaron,
+            ordenada por posición. Si Salesforce no dice qué campos fallaron la lista de campos viene vacía
+        '''
+        if print_every <= 0: print_every = 1
+        batches = self.__make_batches(records, list(range(len(records))))
+        if verbose: markdown(f'Registros a cambiar: **{len(records)}** en **{len(batches)}** llamadas')
+
+        errors = []
+        attempt = 0
+        while len(batches) > 0:
+            def progress(done:int, total:int=len(batches)) -> None:
+                if verbose and done % print_every == 0: print(f'{done}/{total}')
+
+            results = self.__executor.run(lambda batch: self.__send_batch(object_type, records, batch), batches, on_done=progress)
+
+            retries, retry_after = [], None
+            for batch_errors, batch_retries, batch_retry_after in results:
+                errors.extend(batch_errors)
+                retries.extend(batch_retries)
+                if batch_retry_after is not None:
+                    retry_after = max(retry_after or 0, batch_retry_after)
+
+            if len(retries) == 0: break
+            if attempt >= self.__executor.get_max_retries():
+                errors.extend(retries)
+                break
+
+            if verbose: print(f'Reintentando {len(retries)} registros (intento {attempt + 1})')
+            self.__executor.backoff(attempt, retry_after)
+            attempt += 1
+            batches = self.__make_batches(records, sorted([position for position, _, _ in retries]))
+
+        return sorted(errors, key=lambda error: error[0])
+
+    def __send_batch(self, object_type:str, records:list, batch:list) -> tuple:
+        '''
+        Manda un lote y clasifica los errores de cada registro en permanentes o temporales (se pueden reintentar).
+        Si la llamada completa falla, todos los registros del lote se marcan con el mismo error.
+
+        :return: tupla (errores, errores a reintentar, segundos que pidió esperar Salesforce o None)
+        '''
+        payload = {
+            'allOrNone':False,
+            'records':[
+                {'attributes':{'type':object_type}, 'id':records[position][0], **self.__serialize(records[position][1])}
+                for position in batch
+            ]
+        }
+
+        try:
+            response = self.__rest.request('PATCH', 'composite/sobjects', payload)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            return [], [(position, str(e), []) for position in batch], None
+        except Exception as e:
+            return [(position, str(e), []) for position in batch], [], None
+
+        if response.status_code >= 300:
+            message = f'{response.status_code}: {response.text[:500]}'
+            failed = [(position, message, []) for position in batch]
+            if response.status_code in self.__RETRY_STATUS or any([code in response.text for code in self.__RETRY_CODES]):
+                return [], failed, self.__get_retry_after(response)
+            return failed, [], None
+
+        try:
+            results = response.json()
+        except Exception as e:
+            return [(position, str(e), []) for position in batch], [], None
+
+        # Salesforce regresa un resultado por registro y en el mismo orden en que se mandaron
+        errors, retries = [], []
+        for position, result in zip(batch, results):
+            if result.get('success'): continue
+            record_errors = result.get('errors', [])
+            message = '; '.join([f"{error.get('statusCode')}: {error.get('message')}" for error in record_errors])
+            fields = sorted({field for error in record_errors for field in (error.get('fields') or [])})
+
+            if len(record_errors) > 0 and all([error.get('statusCode') in self.__RETRY_CODES for error in record_errors]):
+                retries.append((position, message, fields))
+            else:
+                errors.append((position, message, fields))
+        return errors, retries, None
+
+    def __get_retry_after(self, response:requests.Response) -> float:
+        '''
+        Lee el header Retry-After (en segundos) si es que viene
+        '''
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+
+    def __make_batches(self, records:list, positions:list) -> list:
+        '''
+        Parte los registros (las posiciones especificadas) en lotes de batch_size. Un mismo id no puede venir dos veces
+        en la misma llamada, así que si se repite se empieza un lote nuevo.
+        '''
+        batches = []
+        batch, batch_ids = [], set()
+        for position in positions:
+            sf_id = records[position][0]
+            if len(batch) == self.__batch_size or sf_id in batch_ids:
+                batches.append(batch)
+                batch, batch_ids = [], set()
+            batch.append(position)
+            batch_ids.add(sf_id)
+        if len(batch) > 0:
+            batches.append(batch)
+        return batches
+
+    def __serialize(self, fields:dict) -> dict:
+        '''
+        Convierte los valores a tipos que se pueden mandar como JSON (numpy a python, fechas a ISO, NaN a null)
+        '''
+        serialized = {}
+        for field, value in fields.items():
+            if isinstance(value, np.generic):
+                value = value.item()
+            if isinstance(value, float) and math.isnan(value):
+                value = None
+            elif value is pd.NaT or value is pd.NA:
+                value = None
+            elif isinstance(value, (pd.Timestamp, datetime, date)):
+                value = value.isoformat()
+            serialized[field] = value
+        return serialized
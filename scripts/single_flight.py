@@ -0,0 +1,60 @@
+import threading
+
+class SingleFlight:
+    '''
+    Esta clase junta las llamadas simultáneas que piden lo mismo: la primera (el líder) ejecuta la función y las demás
+    esperan a que termine y reciben el mismo resultado (o la misma excepción). Cuando el líder termina la llave se libera,
+    así que la siguiente llamada vuelve a ejecutar la función.
+
+    Sirve para que N sesiones que cargan lo mismo al mismo tiempo (eg. cuando todos hacen login en la mañana)
+    cuesten una sola consulta a Metabase o Salesforce. Solo coordina los hilos de este proceso.
+
+    El resultado se comparte entre todas las llamadas, por lo que NO se debe modificar.
+    '''
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__calls = {} # llave -> llamada en curso
+
+        self.__flights = 0
+        self.__coalesced = 0
+
+    def do(self, key, function):
+        '''
+        Ejecuta la función, o espera a la llamada en curso con la misma llave y regresa su resultado.
+
+        :param key: llave (hashable) de lo que se está pidiendo
+        :param function: función sin argumentos que calcula el resultado
+        :return: el resultado de function
+        '''
+        with self.__lock:
+            call = self.__calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = {'done':threading.Event(), 'result':None, 'error':None}
+                self.__calls[key] = call
+                self.__flights += 1
+            else:
+                self.__coalesced += 1
+
+        if not is_leader:
+            call['done'].wait()
+            if call['error'] is not None: raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = function()
+        except BaseException as error:
+            call['error'] = error
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call['done'].set()
+        return call['result']
+
+    def get_stats(self) -> dict:
+        '''
+        :return: diccionario con flights (ejecuciones), coalesced (llamadas que esperaron a otra) e in_flight (en curso)
+        '''
+        with self.__lock:
+            return {'flights':self.__flights, 'coalesced':self.__coalesced, 'in_flight':len(self.__calls)}
@@ -1,8 +1,14 @@
 import streamlit as st
 # import openpyxl as xl
 from scripts.mps_finder import MPsFinder
+from scripts.reference_data import ReferenceDataManager
+from scripts.log_writer import LogWriter
 from scripts.item_manager import ItemManager
+from scripts.query_cache import QueryCache
+from scripts.sf_rest import SalesforceRest
 from my_apis.sheets_functions import SheetsFunctions
+from my_apis.sf_connection import SalesforceConnection
+from my_apis.mb_connection import MetabaseConnection
 
 def open_styles(location='templates/style.css'):
     
@@ -43,21 +49,60 @@ def user_is_verified() -> bool:
         return False
     return True
 
+@st.cache_resource(show_spinner=False)
+def load_reference_data() -> ReferenceDataManager:
+    '''
+    Regresa los datos de referencia compartidos por todas las sesiones del proceso.
+    Se crean con las credenciales de servicio (las default) y no con las del primer usuario que los pide,
+    porque el objeto vive lo que vive el proceso y no puede depender de que la sesión de ese usuario siga vigente.
+    '''
+    mb_credentials = 'templates/default_mb_credentials.json'
+    sf_credentials = 'templates/default_sf_credentials.json'
+    return ReferenceDataManager(
+        sfc=SalesforceConnection(sf_credentials),
+        mbc=MetabaseConnection(mb_credentials),
+        query_cache=load_query_cache(),
+        sf_rest=SalesforceRest.from_credentials(sf_credentials)
+    )
+
+def show_reference_data_status(data:ReferenceDataManager) -> None:
+    '''
+    Avisa en la barra lateral cuando los datos de referencia no se han podido refrescar (se siguen usando los anteriores)
+    '''
+    status = data.get_status()
+    if status['last_error'] is None or status['loaded_at'] is None: return
+    st.sidebar.warning(f"Reference data could not be refreshed, showing data loaded at {status['loaded_at']:%Y-%m-%d %H:%M} UTC")
+
+@st.cache_resource(show_spinner=False)
+def load_query_cache() -> QueryCache:
+    '''
+    Regresa el cache de resultados de queries compartido por todas las sesiones del proceso
+    (Automations, MPsFinder e ItemManager). Los resultados viven en disco, así que también se comparten entre procesos,
+    y las sesiones del proceso que piden el mismo query al mismo tiempo (eg. varios logins juntos) esperan a una sola consulta.
+    '''
+    return QueryCache(cache_dir='cache/queries')
+
+@st.cache_resource(show_spinner=False)
+def load_log_writer() -> LogWriter:
+    '''
+    Regresa el escritor de logs compartido por todas las sesiones del proceso.
+    '''
+    return LogWriter(log_dir='logs')
+
 def load_finder() -> MPsFinder:
     '''
     Solo llamar esta función si automations ya está cargada en session_state
     '''
     automations = st.session_state.automations
+    data = load_reference_data()
     if 'finder' not in st.session_state or st.session_state.finder is None:
-        finder = MPsFinder(
-            sfc=automations.get_salesforce_connection(), 
-            mbc=automations.get_metabase_connection(),
-            user=automations.get_user()
+        st.session_state.finder = MPsFinder(
+            data=data,
+            user=automations.get_user(),
+            logs=load_log_writer()
         )
-        st.session_state.finder = finder
-        return finder
-    else:
-        return st.session_state.finder
+    show_reference_data_status(data)
+    return st.session_state.finder
     
 def load_item_manager() -> ItemManager:
     '''
@@ -77,7 +122,10 @@ def load_item_manager() -> ItemManager:
         item_manager = ItemManager(
             mbc=automations.get_metabase_connection(),
             sf=sf,
-            sfc=automations.get_salesforce_connection()
+            sfc=automations.get_salesforce_connection(),
+            exporter=automations.get_mb_exporter(),
+            query_cache=load_query_cache(),
+            sf_rest=automations.get_salesforce_rest()
         )
         st.session_state.item_manager = item_manager
         return item_manager
@@ -0,0 +1,103 @@
+import json
+import numpy as np
+import pandas as pd
+import pydeck as pdk
+import geopandas as gpd
+
+class StateMap:
+    '''
+    Esta clase guarda la geometría de los estados ya simplificada y en GeoJSON para dibujar mapas interactivos con pydeck.
+    La geometría se simplifica una sola vez al cargarla; en cada mapa solo cambian los conteos y colores de cada estado,
+    y el navegador es el que dibuja los polígonos.
+    '''
+    def __init__(self, shapefile:gpd.GeoDataFrame, tolerance:float=0.01) -> None:
+        '''
+        :param shapefile: GeoDataFrame con columnas state y geometry
+        :param tolerance: tolerancia de la simplificación en grados (0.01 son ~1 km)
+        '''
+        if shapefile.crs is not None and shapefile.crs.to_epsg() != 4326:
+            shapefile = shapefile.to_crs(epsg=4326)
+
+        simplified = (
+            shapefile
+            [['state', 'geometry']]
+            .assign(geometry=lambda x: x.geometry.simplify(tolerance, preserve_topology=True))
+        )
+        self.__features = json.loads(simplified.to_json(drop_id=True))['features']
+
+        min_x, min_y, max_x, max_y = simplified.total_bounds
+        self.__view_state = pdk.ViewState(
+            longitude=(min_x + max_x) / 2,
+            latitude=(min_y + max_y) / 2,
+            zoom=4
+        )
+
+    def build_deck(self, counts:pd.DataFrame, quantiles:bool=False, start_color:str='#ede0d4', end_color:str='#1b263b', missing_color:str='#e5e5e5') -> pdk.Deck:
+        '''
+        Arma el mapa con los estados coloreados según su total.
+
+        :param counts: dataframe con columnas state y total
+        :param quantiles: si los colores se asignan por cuantiles o de forma lineal con el total
+        :param start_color: color (hex) del total más bajo
+        :param end_color: color (hex) del total más alto
+        :param missing_color: color (hex) de los estados sin datos
+
+        :return: pdk.Deck listo para st.pydeck_chart
+        '''
+        totals = counts.dropna(subset=['total']).drop_duplicates(subset=['state']).set_index('state').total.to_dict()
+        scale = self.__scale(np.array(list(totals.values()), dtype=float), quantiles)
+
+        start, end, missing = self.__hex_to_rgb(start_color), self.__hex_to_rgb(end_color), self.__hex_to_rgb(missing_color)
+
+        features = []
+        for feature in self.__features:
+            state = feature['properties']['state']
+            total = totals.get(state)
+            if total is None:
+                fill_color = missing
+            else:
+                position = scale(total)
+                fill_color = [int(round(a + (b - a) * position)) for a, b in zip(start, end)]
+
+            # La geometría se comparte entre mapas, solo las propiedades son nuevas
+            features.append({
+                'type':'Feature',
+                'geometry':feature['geometry'],
+                'properties':{'state':state, 'total':int(total) if total is not None else 0, 'fill_color':fill_color}
+            })
+
+        layer = pdk.Layer(
+            'GeoJsonLayer',
+            data={'type':'FeatureCollection', 'features':features},
+            pickable=True,
+            stroked=True,
+            filled=True,
+            get_fill_color='properties.fill_color',
+            get_line_color=[255, 255, 255],
+            line_width_min_pixels=1
+        )
+
+        return pdk.Deck(
+            layers=[layer],
+            initial_view_state=self.__view_state,
+            map_style=None,
+            tooltip={'html':'<b>{state}</b><br/>Total: {total}'}
+        )
+
+    def __scale(self, values:np.ndarray, quantiles:bool):
+        '''
+        Regresa una función que lleva un total a una posición entre 0 y 1 dentro de la escala de colores
+        '''
+        if values.size == 0 or values.max() == values.min():
+            return lambda total: 1.0
+
+        if quantiles:
+            edges = np.unique(np.quantile(values, [0.2, 0.4, 0.6, 0.8]))
+            return lambda total: np.searchsorted(edges, total, side='left') / edges.size
+
+        low, high = values.min(), values.max()
+        return lambda total: (total - low) / (high - low)
+
+    def __hex_to_rgb(self, hex_color:str) -> list:
+        hex_color = hex_color.lstrip('#')
+        return [int(hex_color[i:i+2], 16) for i in (0, 2, 4)]
@@ -0,0 +1,69 @@
+from datetime import date
+import pandas as pd
+from scripts.activity_index import ActivityIndex
+
+
+def activity(rows:list) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=['mp_id', 'doc_day', 'quotes', 'wos'])
+
+
+def counts(index:ActivityIndex, days:int) -> dict:
+    window = index.window_counts(days)
+    return {row.mp_id: (row.quotes, row.wos) for row in window.itertuples()}
+
+
+def test_windows_include_the_last_day_and_the_previous_days():
+    index = ActivityIndex(
+        activity([
+            ('A', '2024-05-31', 1, 0),
+            ('A', '2024-05-01', 2, 1),
+            ('A', '2024-04-30', 4, 0),
+            ('B', '2024-03-01', 0, 3)
+        ]),
+        start_date=date(2024, 1, 1),
+        end_date=date(2024, 5, 31)
+    )
+
+    assert counts(index, 0) == {'A':(1, 0), 'B':(0, 0)}
+    assert counts(index, 30) == {'A':(3, 1), 'B':(0, 0)}
+    assert counts(index, 31) == {'A':(7, 1), 'B':(0, 0)}
+    assert counts(index, 1000) == {'A':(7, 1), 'B':(0, 3)}
+
+
+def test_extend_replaces_the_incomplete_last_day_and_trims_history():
+    index = ActivityIndex(
+        activity([('A', '2024-05-30', 1, 0), ('A', '2024-05-31', 1, 0), ('A', '2024-05-01', 5, 0)]),
+        start_date=date(2024, 5, 1),
+        end_date=date(2024, 5, 31)
+    )
+
+    extended = index.extend(
+        activity([('A', '2024-05-31', 2, 1), ('C', '2024-06-01', 0, 1)]),
+        start_date=date(2024, 5, 31),
+        end_date=date(2024, 6, 1),
+        history_days=10
+    )
+
+    assert extended.start_date == date(2024, 5, 22)
+    assert counts(extended, 1) == {'A':(2, 1), 'C':(0, 1)}
+    assert counts(extended, 1000) == {'A':(3, 1), 'C':(0, 1)}
+    # El índice original no cambia
+    assert counts(index, 1000) == {'A':(7, 0)}
+
+
+def test_extend_replaces_every_day_from_start_date():
+    index = ActivityIndex(
+        activity([('A', '2024-05-10', 3, 1), ('A', '2024-05-20', 1, 0), ('B', '2024-05-25', 2, 0), ('A', '2024-05-01', 4, 0)]),
+        start_date=date(2024, 5, 1),
+        end_date=date(2024, 5, 31)
+    )
+
+    # Al volver a pedir desde el 2024-05-05 ya no viene el quote borrado del 05-20 ni el wo cancelado del 05-10
+    extended = index.extend(
+        activity([('A', '2024-05-10', 3, 0), ('B', '2024-05-25', 2, 0)]),
+        start_date=date(2024, 5, 5),
+        end_date=date(2024, 6, 1)
+    )
+
+    assert counts(extended, 1000) == {'A':(7, 0), 'B':(2, 0)}
+    assert counts(extended, 10) == {'A':(0, 0), 'B':(2, 0)}
@@ -0,0 +1,87 @@
+import os
+import re
+import threading
+import pandas as pd
+import pytest
+from scripts.contacts_cache import ContactsCache
+
+FIELDS = ['AccountId', 'LastName', 'FirstName', 'Phone', 'MobilePhone', 'Email', 'Title']
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    monkeypatch.chdir(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class StubConnection:
+    '''
+    Conexión de Salesforce que regresa un contacto por cada AccountId del query. fail_first hace que las primeras llamadas
+    truenen y release permite detener una carga hasta que la prueba la suelte.
+    '''
+    def __init__(self, fail_first:int=0, release:threading.Event=None) -> None:
+        self.queries = []
+        self.fail_first = fail_first
+        self.release = release
+
+    def extract_data(self, query:str) -> pd.DataFrame:
+        self.queries.append(query)
+        if self.release is not None:
+            self.release.wait(5)
+        if len(self.queries) <= self.fail_first:
+            raise ConnectionError('salesforce is down')
+
+        ids = re.findall(r"'(\w+)'", query)
+        if len(ids) == 0: raise KeyError('records')
+        return pd.DataFrame([{**{field: None for field in FIELDS}, 'AccountId':mp_id, 'LastName':f'contact {mp_id}'} for mp_id in ids])
+
+
+def test_missing_ids_are_loaded_in_batches():
+    sfc = StubConnection()
+    cache = ContactsCache(sfc, batch_size=2)
+
+    contacts = cache.get(['A', 'B', 'C', 'A'])
+    assert contacts.AccountId.tolist() == ['A', 'B', 'C']
+    assert len(sfc.queries) == 2
+
+    cache.get(['A', 'C'])
+    assert len(sfc.queries) == 2
+
+
+def test_failed_prefetch_is_reloaded_inline():
+    release = threading.Event()
+    sfc = StubConnection(fail_first=1, release=release)
+    cache = ContactsCache(sfc)
+
+    cache.prefetch(['A', 'B'])
+    results = []
+    getter = threading.Thread(target=lambda: results.append(cache.get(['A', 'B'])))
+    getter.start()
+    release.set()
+    getter.join(5)
+
+    assert results[0].AccountId.tolist() == ['A', 'B']
+    assert len(sfc.queries) == 2
+
+
+def test_repeated_failures_are_raised():
+    sfc = StubConnection(fail_first=10)
+    cache = ContactsCache(sfc)
+
+    with pytest.raises(ConnectionError):
+        cache.get(['A'])
+
+
+def test_least_recently_used_entries_are_evicted():
+    sfc = StubConnection()
+    cache = ContactsCache(sfc, max_entries=2)
+
+    cache.get(['A'])
+    cache.get(['B'])
+    cache.get(['A'])
+    cache.get(['C'])
+    assert len(sfc.queries) == 3
+
+    cache.get(['A', 'C'])
+    assert len(sfc.queries) == 3
+    cache.get(['B'])
+    assert len(sfc.queries) == 4
@@ -0,0 +1,67 @@
+import threading
+import pytest
+from scripts.data_loader import DataLoader
+
+
+def loader_threads() -> list:
+    return [thread for thread in threading.enumerate() if thread.name.startswith('data-loader')]
+
+
+def make_loader(calls:list) -> DataLoader:
+    def source(name:str, value):
+        def load(**dependencies):
+            calls.append(name)
+            return value(**dependencies) if callable(value) else value
+        return load
+
+    loader = DataLoader(max_workers=2)
+    loader.add_source('addresses', source('addresses', ['a1', 'a2']))
+    loader.add_source('states', source('states', ['s1']))
+    loader.add_source('mps', source('mps', lambda addresses, states: len(addresses) + len(states)), depends_on=['addresses', 'states'])
+    return loader
+
+
+def test_sources_are_loaded_once_with_their_dependencies():
+    calls = []
+    loader = make_loader(calls)
+
+    assert loader.get('mps') == 3
+    assert loader.load(['mps', 'states']) == {'addresses':['a1', 'a2'], 'states':['s1'], 'mps':3}
+    assert sorted(calls) == ['addresses', 'mps', 'states']
+    assert sorted(loader.get_loaded()) == ['addresses', 'mps', 'states']
+
+
+def test_failed_sources_are_retried():
+    attempts = []
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1: raise ConnectionError('timeout')
+        return 'ok'
+
+    loader = DataLoader(max_workers=2)
+    loader.add_source('flaky', flaky)
+
+    with pytest.raises(ConnectionError):
+        loader.get('flaky')
+    assert loader.get('flaky') == 'ok'
+
+
+def test_unknown_and_circular_sources_are_rejected():
+    loader = DataLoader()
+    loader.add_source('a', lambda b: b, depends_on=['b'])
+    loader.add_source('b', lambda a: a, depends_on=['a'])
+
+    with pytest.raises(Exception, match='Circular dependency'):
+        loader.get('a')
+    with pytest.raises(Exception, match='Unknown source'):
+        loader.get('c')
+
+
+def test_worker_threads_are_released_after_each_load():
+    before = len(loader_threads())
+    for _ in range(5):
+        make_loader([]).load()
+
+    for thread in loader_threads():
+        thread.join(5)
+    assert len(loader_threads()) <= before
@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import pandas as pd
+import pytest
+from scripts.incremental_sync import IncrementalSync
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    monkeypatch.chdir(ROOT)
+
+
+class SQLiteMetabase:
+    '''
+    Metabase sobre una base de sqlite en memoria. Solo traduce lo que sqlite no entiende de los queries del repo
+    (ILIKE y los literales timestamp '...'), así que los queries originales y los de delta corren sobre los mismos datos.
+    '''
+    def __init__(self) -> None:
+        self.connection = sqlite3.connect(':memory:')
+        self.connection.executescript('''
+            create table companies (id integer, salesforce_id text, fiscal_name text, updated_at text);
+            create table wos (id integer, companyid integer, purchase_order_id integer, created_at text, cancelled_at text, updated_at text);
+            create table quotations (id integer, manufacturing_partner_id integer, requirementid integer, created_at text, deleted_at text, updated_at text);
+            create table purchase_order_deliveries (id integer, purchase_order_id integer, status text, in_full text, on_time text, updated_at text);
+            create table rfqs (id integer, main_process_l0_code text);
+        ''')
+
+    def insert(self, table:str, rows:list) -> None:
+        columns = list(rows[0])
+        self.connection.executemany(
+            f'insert into {table} ({", ".join(columns)}) values ({", ".join("?" for _ in columns)})',
+            [tuple(row[column] for column in columns) for row in rows]
+        )
+
+    def execute(self, statement:str) -> None:
+        self.connection.execute(statement)
+
+    def query_data(self, query:str, database_id:int=None) -> pd.DataFrame:
+        query = query.replace('ILIKE', 'LIKE').replace("timestamp '", "'").rstrip().rstrip(';')
+        return pd.read_sql_query(query, self.connection)
+
+    def query_file(self, path:str) -> pd.DataFrame:
+        with open(os.path.join(ROOT, path), 'r') as f:
+            return self.query_data(f.read())
+
+
+def ts(day:str) -> str:
+    return f'2024-{day} 12:00:00'
+
+
+@pytest.fixture
+def mbc():
+    mbc = SQLiteMetabase()
+    mbc.insert('companies', [
+        {'id':1, 'salesforce_id':'A', 'fiscal_name':'a', 'updated_at':ts('01-01')},
+        {'id':2, 'salesforce_id':'B', 'fiscal_name':'b', 'updated_at':ts('01-01')},
+        {'id':3, 'salesforce_id':None, 'fiscal_name':'c', 'updated_at':ts('01-01')},
+        {'id':4, 'salesforce_id':'D', 'fiscal_name':'d', 'updated_at':ts('01-01')}
+    ])
+    mbc.insert('wos', [
+        {'id':10, 'companyid':1, 'purchase_order_id':100, 'created_at':ts('01-05'), 'cancelled_at':None, 'updated_at':ts('01-05')},
+        {'id':11, 'companyid':1, 'purchase_order_id':101, 'created_at':ts('02-05'), 'cancelled_at':ts('02-06'), 'updated_at':ts('02-06')},
+        {'id':12, 'companyid':2, 'purchase_order_id':102, 'created_at':ts('01-10'), 'cancelled_at':None, 'updated_at':ts('01-10')},
+        {'id':13, 'companyid':3, 'purchase_order_id':103, 'created_at':ts('01-11'), 'cancelled_at':None, 'updated_at':ts('01-11')},
+        {'id':14, 'companyid':9, 'purchase_order_id':104, 'created_at':ts('01-12'), 'cancelled_at':None, 'updated_at':ts('01-12')}
+    ])
+    mbc.insert('quotations', [
+        {'id':20, 'manufacturing_partner_id':1, 'requirementid':1, 'created_at':ts('01-02'), 'deleted_at':None, 'updated_at':ts('01-02')},
+        {'id':21, 'manufacturing_partner_id':1, 'requirementid':1, 'created_at':ts('01-03'), 'deleted_at':ts('01-04'), 'updated_at':ts('01-04')},
+        {'id':22, 'manufacturing_partner_id':4, 'requirementid':2, 'created_at':ts('01-03'), 'deleted_at':None, 'updated_at':ts('01-03')}
+    ])
+    mbc.insert('purchase_order_deliveries', [
+        {'id':30, 'purchase_order_id':100, 'status':'Fulfilled', 'in_full':'t', 'on_time':'t', 'updated_at':ts('01-06')},
+        {'id':31, 'purchase_order_id':100, 'status':'Fulfilled', 'in_full':'t', 'on_time':'f', 'updated_at':ts('01-07')},
+        {'id':32, 'purchase_order_id':102, 'status':'Fulfilled', 'in_full':None, 'on_time':'t', 'updated_at':ts('01-11')},
+        {'id':33, 'purchase_order_id':103, 'status':'Fulfilled', 'in_full':'t', 'on_time':'t', 'updated_at':ts('01-12')},
+        {'id':34, 'purchase_order_id':101, 'status':'Pending', 'in_full':'t', 'on_time':'t', 'updated_at':ts('02-06')}
+    ])
+    return mbc
+
+
+def expected(mbc:SQLiteMetabase, job:str) -> pd.DataFrame:
+    return mbc.query_file(f'queries/{job}_mb.sql')
+
+
+def normalize(data:pd.DataFrame, key:str) -> pd.DataFrame:
+    '''
+    Deja ambos resultados comparables: mismo orden de renglones, números como float y fechas en UTC
+    '''
+    data = data.copy()
+    for column in data.columns:
+        if column == key: continue
+        if column.startswith('date'):
+            data[column] = pd.to_datetime(data[column], utc=True, format='ISO8601')
+        else:
+            data[column] = pd.to_numeric(data[column]).astype(float)
+    data[key] = data[key].astype(object).where(data[key].notna(), None)
+    return data.sort_values(key, key=lambda values: values.fillna(''), ignore_index=True)
+
+
+def assert_matches_sql(sync:IncrementalSync, mbc:SQLiteMetabase, job:str, key:str) -> None:
+    result = normalize(sync.get_mb_data(job), key)
+    sql = normalize(expected(mbc, job), key)
+    pd.testing.assert_frame_equal(result[sql.columns], sql, check_dtype=False)
+
+
+@pytest.mark.parametrize('job, key', [('wos_quotes', 'salesforce_id'), ('last_wo_date', 'sf_id'), ('otif', 'salesforce_id')])
+def test_builders_match_the_queries_they_replace(tmp_path, mbc, job, key):
+    sync = IncrementalSync(mbc, sf_cache=None, state_dir=str(tmp_path))
+    assert_matches_sql(sync, mbc, job, key)
+
+
+@pytest.mark.parametrize('job, key', [('wos_quotes', 'salesforce_id'), ('last_wo_date', 'sf_id'), ('otif', 'salesforce_id')])
+def test_deltas_are_upserted(tmp_path, mbc, job, key):
+    sync = IncrementalSync(mbc, sf_cache=None, state_dir=str(tmp_path))
+    sync.get_mb_data(job)
+
+    # Un wo se cancela, otro se reasigna, llegan renglones nuevos y una entrega cambia de resultado
+    mbc.execute(f"update wos set cancelled_at = '{ts('03-01')}', updated_at = '{ts('03-01')}' where id = 12")
+    mbc.execute(f"update wos set companyid = 4, updated_at = '{ts('03-01')}' where id = 13")
+    mbc.insert('wos', [{'id':15, 'companyid':2, 'purchase_order_id':105, 'created_at':ts('03-02'), 'cancelled_at':None, 'updated_at':ts('03-02')}])
+    mbc.insert('quotations', [{'id':23, 'manufacturing_partner_id':2, 'requirementid':3, 'created_at':ts('03-02'), 'deleted_at':None, 'updated_at':ts('03-02')}])
+    mbc.execute(f"update quotations set deleted_at = '{ts('03-03')}', updated_at = '{ts('03-03')}' where id = 20")
+    mbc.execute(f"update purchase_order_deliveries set on_time = 't', updated_at = '{ts('03-03')}' where id = 31")
+    mbc.insert('purchase_order_deliveries', [{'id':35, 'purchase_order_id':105, 'status':'Fulfilled', 'in_full':'f', 'on_time':'t', 'updated_at':ts('03-04')}])
+
+    assert_matches_sql(sync, mbc, job, key)
+    assert sync.get_watermarks()['wos'] == pd.Timestamp(ts('03-02'), tz='UTC').isoformat()
+
+
+def test_physical_deletes_need_a_full_load(tmp_path, mbc):
+    sync = IncrementalSync(mbc, sf_cache=None, state_dir=str(tmp_path))
+    sync.get_mb_data('last_wo_date')
+    mbc.execute('delete from wos where id = 12')
+
+    assert 'B' in sync.get_mb_data('last_wo_date').sf_id.tolist()
+    assert 'B' not in sync.get_mb_data('last_wo_date', full=True).sf_id.tolist()
+
+
+def test_table_and_watermark_are_written_together(tmp_path, mbc):
+    sync = IncrementalSync(mbc, sf_cache=None, state_dir=str(tmp_path))
+    sync.update_table('wos')
+
+    assert sorted(os.listdir(tmp_path)) == ['wos.parquet']
+    assert IncrementalSync(mbc, sf_cache=None, state_dir=str(tmp_path)).get_watermarks()['wos'] == pd.Timestamp(ts('02-06'), tz='UTC').isoformat()
+
+    sync.reset('wos')
+    assert sync.get_watermarks()['wos'] is None
@@ -0,0 +1,105 @@
+import pandas as pd
+import pytest
+import scripts.log_analytics as log_analytics
+from scripts.log_analytics import LogAnalytics
+from scripts.log_writer import LogWriter
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    return tmp_path / 'logs'
+
+
+@pytest.fixture
+def writer(tmp_path, log_dir):
+    rm_template = tmp_path / 'rm_search_log_template.csv'
+    pd.DataFrame(columns=['user', 'date', 'state', 'products', 'mps']).to_csv(rm_template, index=False)
+    login_template = tmp_path / 'login_log_template.csv'
+    pd.DataFrame(columns=['date', 'user']).to_csv(login_template, index=False)
+
+    writer = LogWriter(log_dir=str(log_dir), flush_interval=60, compact_interval=3600)
+    writer.add_log('rm_search_log', str(rm_template))
+    writer.add_log('login_log', str(login_template))
+    return writer
+
+
+def search(user:str, date:str, products:list, mps:list) -> dict:
+    return {'user':user, 'date':pd.Timestamp(date), 'state':'Jalisco', 'products':products, 'mps':mps}
+
+
+def login(user:str, date:str) -> dict:
+    return {'user':user, 'date':pd.Timestamp(date)}
+
+
+def test_uncompacted_segments_are_included(writer, log_dir):
+    writer.write('rm_search_log', search('ana', '2024-05-02 10:00', ['pp'], ['MP1', 'MP2']))
+    writer.write('rm_search_log', search('ana', '2024-05-02 12:00', ['pp', 'pe'], ['MP1']))
+    writer.write('rm_search_log', search('luis', '2024-05-03 09:00', ['pe'], []))
+    writer.flush()
+
+    analytics = LogAnalytics(log_dir=str(log_dir))
+    assert analytics.build() == 2
+
+    searches = analytics.searches_per_user_per_day()
+    assert searches.values.tolist() == [['2024-05-02', 'ana', 2], ['2024-05-03', 'luis', 1]]
+    assert analytics.mp_exposure().set_index('mp').exposures.to_dict() == {'MP1':2, 'MP2':1}
+
+    # Compactar cambia los archivos del día pero no los renglones
+    writer.compact('rm_search_log')
+    assert analytics.build() == 2
+    assert analytics.searches_per_user_per_day().equals(searches)
+    assert analytics.build() == 0
+
+
+def test_login_table_is_materialized(writer, log_dir):
+    writer.write('login_log', login('ana', '2024-05-02 08:00'))
+    writer.write('login_log', login('ana', '2024-05-02 15:00'))
+    writer.write('login_log', login('luis', '2024-05-03 08:30'))
+    writer.flush()
+    writer.compact('login_log')
+    writer.write('login_log', login('luis', '2024-05-03 17:00'))
+    writer.flush()
+
+    analytics = LogAnalytics(log_dir=str(log_dir))
+    analytics.build()
+
+    logins = analytics.logins_per_user_per_day()
+    assert logins.values.tolist() == [['2024-05-02', 'ana', 2], ['2024-05-03', 'luis', 2]]
+    assert analytics.logins_per_user_per_day(start_date='2024-05-03').user.tolist() == ['luis']
+
+
+def test_legacy_file_is_read_once(writer, log_dir, monkeypatch):
+    log_dir.mkdir()
+    legacy = pd.DataFrame([search('old', f'2024-04-{day:02d} 09:00', ['pp'], ['MP1']) for day in range(1, 11)])
+    legacy.to_parquet(log_dir / 'rm_search_log.parquet')
+
+    reads = []
+    read_parquet = pd.read_parquet
+    def counting_read_parquet(path, *args, **kwargs):
+        reads.append(str(path))
+        return read_parquet(path, *args, **kwargs)
+    monkeypatch.setattr(log_analytics.pd, 'read_parquet', counting_read_parquet)
+
+    analytics = LogAnalytics(log_dir=str(log_dir))
+    assert analytics.build() == 10
+    assert reads == [str(log_dir / 'rm_search_log.parquet')]
+    assert analytics.searches_per_user_per_day().searches.sum() == 10
+
+
+def test_migrated_legacy_rows_are_not_counted_twice(writer, log_dir):
+    log_dir.mkdir()
+    legacy = pd.DataFrame([search('old', '2024-04-30 09:00', ['pp'], ['MP1'])])
+    legacy.to_parquet(log_dir / 'rm_search_log.parquet')
+
+    analytics = LogAnalytics(log_dir=str(log_dir))
+    analytics.build()
+
+    writer.write('rm_search_log', search('new', '2024-04-30 10:00', ['pe'], ['MP2']))
+    writer.flush()
+    writer.compact('rm_search_log')
+    # Simula una caída entre escribir part-legacy.parquet y renombrar el archivo viejo
+    (log_dir / 'rm_search_log.parquet.migrated').rename(log_dir / 'rm_search_log.parquet')
+
+    analytics.build()
+    searches = analytics.searches_per_user_per_day()
+    assert searches.set_index('user').searches.to_dict() == {'old':1, 'new':1}
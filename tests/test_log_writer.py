@@ -0,0 +1,135 @@
+import os
+import glob
+import subprocess
+import sys
+import time
+import pandas as pd
+import pytest
+from scripts.log_writer import LogWriter
+
+
+@pytest.fixture
+def template(tmp_path):
+    path = tmp_path / 'search_log_template.csv'
+    pd.DataFrame(columns=['user', 'date', 'products']).to_csv(path, index=False)
+    return str(path)
+
+
+def make_writer(log_dir, template) -> LogWriter:
+    writer = LogWriter(log_dir=str(log_dir), flush_interval=60, compact_interval=3600)
+    writer.add_log('search_log', template)
+    return writer
+
+
+def entry(user:str, date:str) -> dict:
+    return {'user':user, 'date':pd.Timestamp(date), 'products':['a', 'b']}
+
+
+def test_entries_are_read_before_and_after_compaction(tmp_path, template):
+    writer = make_writer(tmp_path / 'logs', template)
+    writer.write('search_log', entry('ana', '2024-05-02 10:00'))
+    writer.write('search_log', entry('luis', '2024-05-03 11:00'))
+    writer.flush()
+
+    assert len(glob.glob(str(tmp_path / 'logs' / 'search_log' / 'segments' / '*.arrow'))) == 1
+    assert writer.read('search_log').user.tolist() == ['ana', 'luis']
+
+    assert writer.compact('search_log')
+    days = sorted(os.path.basename(path) for path in glob.glob(str(tmp_path / 'logs' / 'search_log' / 'day=*')))
+    assert days == ['day=2024-05-02', 'day=2024-05-03']
+    assert glob.glob(str(tmp_path / 'logs' / 'search_log' / 'segments' / '*.arrow')) == []
+
+    data = writer.read('search_log')
+    assert data.user.tolist() == ['ana', 'luis']
+    assert list(data.products[0]) == ['a', 'b']
+
+
+def test_missing_columns_are_rejected(tmp_path, template):
+    writer = make_writer(tmp_path / 'logs', template)
+    with pytest.raises(Exception, match='Missing columns'):
+        writer.write('search_log', {'user':'ana', 'date':pd.Timestamp('2024-05-02')})
+
+
+def test_legacy_file_is_migrated_on_first_compaction(tmp_path, template):
+    log_dir = tmp_path / 'logs'
+    log_dir.mkdir()
+    legacy = pd.DataFrame([entry('old', '2024-04-30 09:00'), entry('older', '2024-04-29 09:00')])
+    legacy.to_parquet(log_dir / 'search_log.parquet')
+
+    writer = make_writer(log_dir, template)
+    writer.write('search_log', entry('new', '2024-05-02 10:00'))
+    writer.flush()
+    assert writer.read('search_log').user.tolist() == ['older', 'old', 'new']
+
+    writer.compact('search_log')
+
+    assert not (log_dir / 'search_log.parquet').exists()
+    assert (log_dir / 'search_log.parquet.migrated').exists()
+    assert (log_dir / 'search_log' / 'day=2024-04-30' / 'part-legacy.parquet').exists()
+    assert writer.read('search_log').user.tolist() == ['older', 'old', 'new']
+
+
+def test_failed_writes_are_requeued_and_reported(tmp_path, template):
+    log_dir = tmp_path / 'logs'
+    writer = make_writer(log_dir, template)
+    log_dir.mkdir()
+    (log_dir / 'search_log').write_text('not a directory')
+
+    writer.write('search_log', entry('ana', '2024-05-02 10:00'))
+    with pytest.raises(OSError):
+        writer.flush()
+    assert writer.get_status()['queued'] == 1
+
+    (log_dir / 'search_log').unlink()
+    writer.flush()
+    assert writer.get_status()['queued'] == 0
+    assert writer.read('search_log').user.tolist() == ['ana']
+
+
+def test_background_errors_are_logged_once(tmp_path, template, caplog):
+    log_dir = tmp_path / 'logs'
+    writer = LogWriter(log_dir=str(log_dir), flush_interval=0.05, max_queue=3)
+    writer.add_log('search_log', template)
+    log_dir.mkdir()
+    (log_dir / 'search_log').write_text('not a directory')
+
+    with caplog.at_level('ERROR', logger='scripts.log_writer'):
+        for i in range(5):
+            writer.write('search_log', entry(f'user {i}', '2024-05-02 10:00'))
+        for _ in range(100):
+            if writer.get_status()['failures'] >= 3: break
+            time.sleep(0.02)
+
+    status = writer.get_status()
+    assert status['failures'] >= 3
+    assert status['last_error'].startswith(('NotADirectoryError', 'FileExistsError'))
+    assert status['queued'] == 3 and status['dropped'] == 2
+    assert len([record for record in caplog.records if 'Error writing logs' in record.getMessage()]) == 1
+
+    # Para que el flush de atexit ya no falle
+    (log_dir / 'search_log').unlink()
+    writer.flush()
+
+
+def test_stale_lock_from_a_dead_process_is_removed(tmp_path, template):
+    writer = make_writer(tmp_path / 'logs', template)
+    writer.write('search_log', entry('ana', '2024-05-02 10:00'))
+    writer.flush()
+
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    lock_path = tmp_path / 'logs' / 'search_log' / '.compact.lock'
+    lock_path.write_text(str(dead.pid))
+
+    assert writer.compact('search_log')
+    assert not lock_path.exists()
+
+
+def test_lock_held_by_a_live_process_is_respected(tmp_path, template):
+    writer = make_writer(tmp_path / 'logs', template)
+    lock_path = tmp_path / 'logs' / 'search_log' / '.compact.lock'
+    lock_path.parent.mkdir(parents=True)
+    lock_path.write_text(str(os.getppid()))
+
+    assert not writer.compact('search_log')
+    assert lock_path.exists()
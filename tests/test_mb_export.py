@@ -0,0 +1,116 @@
+import gzip
+import json
+import threading
+import pyarrow as pa
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from scripts.mb_export import MetabaseExporter
+
+# Respuestas enlatadas del endpoint /api/dataset/csv, por query
+EXPORTS = {
+    'select items': ('text/csv', b'name,zip_code,unit_price,item_name\n1,07000,1.5,tornillo\n2,44100,,"tuerca, 1/2"\n3,01000,10,\n'),
+    'select nothing': ('text/csv', b'name,zip_code,unit_price,item_name\n'),
+    'select broken': ('application/json', b'{"error":"ERROR: syntax error at or near \\"selec\\""}'),
+}
+
+
+class CannedExportHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        form = {key: values[0] for key, values in parse_qs(body).items()}
+        self.server.requests.append({'path':self.path, 'form':form, 'session':self.headers.get('X-Metabase-Session')})
+
+        query = json.loads(form['query'])['native']['query']
+        if self.headers.get('X-Metabase-Session') != 'valid-session':
+            return self.__send(401, 'text/plain', b'Unauthenticated')
+        if query not in EXPORTS:
+            return self.__send(500, 'text/plain', b'Internal error')
+
+        content_type, content = EXPORTS[query]
+        self.__send(200, content_type, content, compress=query == 'select items')
+
+    def __send(self, status, content_type, content, compress=False):
+        if compress: content = gzip.compress(content)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if compress: self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CannedExportHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_exporter(server, session_id='valid-session'):
+    return MetabaseExporter(f'http://127.0.0.1:{server.server_address[1]}/', session_id=session_id, database_id=6, timeout=10)
+
+
+def test_export_sends_native_query_without_formatting(server):
+    table = make_exporter(server).export('select items')
+
+    request = server.requests[-1]
+    assert request['path'] == '/api/dataset/csv'
+    assert request['form']['format_rows'] == 'false'
+    assert json.loads(request['form']['query']) == {'database':6, 'type':'native', 'native':{'query':'select items'}}
+    assert table.num_rows == 3
+    assert table.column('name').to_pylist() == [1, 2, 3]
+
+
+def test_column_types_are_not_inferred(server):
+    inferred = make_exporter(server).export('select items')
+    declared = make_exporter(server).export('select items', column_types={'zip_code':pa.string(), 'unit_price':pa.float64()})
+
+    assert inferred.schema.field('zip_code').type == pa.int64()
+    assert declared.schema.field('zip_code').type == pa.string()
+    assert declared.column('zip_code').to_pylist() == ['07000', '44100', '01000']
+    assert declared.column('unit_price').to_pylist() == [1.5, None, 10.0]
+    assert declared.column('item_name').to_pylist() == ['tornillo', 'tuerca, 1/2', None]
+
+
+def test_iter_frames_yields_dataframes(server):
+    frames = list(make_exporter(server).iter_frames('select items', column_types={'zip_code':pa.string()}))
+
+    assert sum(len(frame) for frame in frames) == 3
+    assert frames[0].zip_code.tolist()[:1] == ['07000']
+
+
+def test_empty_result_keeps_columns(server):
+    frames = list(make_exporter(server).iter_frames('select nothing'))
+
+    assert len(frames) == 1
+    assert frames[0].shape == (0, 4)
+    assert frames[0].columns.tolist() == ['name', 'zip_code', 'unit_price', 'item_name']
+
+
+def test_error_payload_raises(server):
+    with pytest.raises(Exception, match='Metabase export failed: .*syntax error'):
+        make_exporter(server).export('select broken')
+
+
+@pytest.mark.parametrize('query, session_id, status', [('select items', 'expired-session', 401), ('select unknown', 'valid-session', 500)])
+def test_non_200_response_raises(server, query, session_id, status):
+    with pytest.raises(Exception, match=f'Metabase export failed with {status}'):
+        list(make_exporter(server, session_id=session_id).iter_frames(query))
+
+
+def test_from_credentials_prefers_connection_session(server):
+    credentials = {'metabase_domain':f'http://127.0.0.1:{server.server_address[1]}', 'current-token':'expired-session'}
+
+    assert MetabaseExporter.from_credentials({'current-token':'valid-session'}) is None
+    assert MetabaseExporter.from_credentials(credentials, session_id='valid-session').export('select items').num_rows == 3
+    assert server.requests[-1]['session'] == 'valid-session'
+    with pytest.raises(Exception, match='Metabase export failed with 401'):
+        MetabaseExporter.from_credentials(credentials).export('select items')
@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+import pandas as pd
+import pytest
+from scripts.query_cache import QueryCache
+
+ACCOUNTS = 'select Id, Name from Account where Type = \'MP\''
+WOS = 'select w.id from wos w join companies c on c.id = w.companyid'
+
+
+def frame(value:int) -> pd.DataFrame:
+    return pd.DataFrame({'id':[value], 'name':[f'row {value}']})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return QueryCache(cache_dir=str(tmp_path))
+
+
+def test_results_are_stored_and_read_back(cache):
+    key = cache.make_key('salesforce', None, ACCOUNTS)
+    assert cache.get(key) is None
+
+    assert cache.put(key, frame(1), query=ACCOUNTS, ttl=60, source='salesforce')
+    pd.testing.assert_frame_equal(cache.get(key), frame(1))
+    assert cache.get_stats()['hits'] == 1
+    assert cache.get_stats()['misses'] == 1
+
+
+def test_keys_ignore_formatting_but_not_source_or_database(cache):
+    key = cache.make_key('metabase', 6, 'select 1\nfrom wos;')
+    assert key == cache.make_key('metabase', 6, '  select 1  \n\n   from wos  ')
+    assert key != cache.make_key('metabase', 7, 'select 1\nfrom wos')
+    assert key != cache.make_key('salesforce', 6, 'select 1\nfrom wos')
+
+
+def test_expired_results_are_removed(cache):
+    key = cache.make_key('salesforce', None, ACCOUNTS)
+    cache.put(key, frame(1), query=ACCOUNTS, ttl=0.01, source='salesforce')
+    time.sleep(0.05)
+
+    assert cache.get(key) is None
+    assert cache.get_stats()['expirations'] == 1
+    assert cache.get_stats()['entries'] == 0
+
+
+def test_invalidate_only_removes_results_that_read_the_objects(cache):
+    accounts_key = cache.make_key('salesforce', None, ACCOUNTS)
+    wos_key = cache.make_key('metabase', 6, WOS)
+    cache.put(accounts_key, frame(1), query=ACCOUNTS, ttl=60, source='salesforce')
+    cache.put(wos_key, frame(2), query=WOS, ttl=60, source='metabase')
+
+    assert cache.invalidate(['account']) == 1
+    assert cache.get(accounts_key) is None
+    assert cache.get(wos_key) is not None
+
+    assert cache.invalidate(['COMPANIES']) == 1
+    assert cache.get(wos_key) is None
+    assert cache.get_stats()['invalidations'] == 2
+
+
+def test_results_fetched_before_an_invalidate_are_not_stored(cache):
+    key = cache.make_key('salesforce', None, ACCOUNTS)
+    started, finish = threading.Event(), threading.Event()
+
+    def slow_fetch():
+        started.set()
+        finish.wait(5)
+        return frame(1)
+
+    worker = threading.Thread(target=cache.get_or_fetch, args=(key, slow_fetch), kwargs={'query':ACCOUNTS, 'ttl':60, 'source':'salesforce'})
+    worker.start()
+    started.wait(5)
+    cache.invalidate(['Account'])
+
+    # La llamada que llega después del invalidate no espera a la que empezó antes
+    fresh = cache.get_or_fetch(key, lambda: frame(2), query=ACCOUNTS, ttl=60, source='salesforce')
+    finish.set()
+    worker.join(5)
+
+    assert fresh.id.tolist() == [2]
+    assert cache.get(key).id.tolist() == [2]
+
+
+def test_least_recently_used_results_are_evicted(cache, tmp_path):
+    keys = [cache.make_key('metabase', 6, f'select {value} from wos') for value in range(3)]
+    cache.put(keys[0], frame(0), query='select 0 from wos', ttl=60, source='metabase')
+    entry_size = os.path.getsize(tmp_path / f'{keys[0]}.parquet')
+
+    small = QueryCache(cache_dir=str(tmp_path), max_bytes=int(entry_size * 2.5))
+    small.put(keys[1], frame(1), query='select 1 from wos', ttl=60, source='metabase')
+    past = time.time() - 60
+    os.utime(tmp_path / f'{keys[1]}.parquet', (past, past))
+    assert small.get(keys[0]) is not None
+
+    small.put(keys[2], frame(2), query='select 2 from wos', ttl=60, source='metabase')
+    assert small.get(keys[1]) is None
+    assert small.get(keys[0]) is not None
+    assert small.get(keys[2]) is not None
+    assert small.get_stats()['evictions'] == 1
+
+
+def test_zero_ttl_is_never_stored(cache):
+    key = cache.make_key('metabase', 6, WOS)
+    calls = []
+    fetch = lambda: calls.append(1) or frame(1)
+
+    cache.get_or_fetch(key, fetch, query=WOS, ttl=0, source='metabase')
+    cache.get_or_fetch(key, fetch, query=WOS, ttl=0, source='metabase')
+    assert len(calls) == 2
+    assert cache.get_stats()['entries'] == 0
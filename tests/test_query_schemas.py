@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+from scripts.query_schemas import QuerySchemas
+from scripts.reconciliation import Reconciler
+
+
+def test_last_wo_date_keeps_the_salesforce_representation():
+    data = pd.DataFrame({'Id':['001A', '001B'], 'Name':['MP A', 'MP B'], 'last_wo_date__c':['2024-05-01', None]})
+    mps = QuerySchemas().apply('queries/mps_manufacturing.sql', data)
+
+    assert mps.last_wo_date.tolist() == ['2024-05-01', None]
+    assert mps.mp_id.tolist() == ['001A', '001B']
+
+
+def test_counts_and_dates_are_converted():
+    data = pd.DataFrame({
+        'activity_id':['1', '2'],
+        'mp_id':['001A', None],
+        'doc_day':['2024-05-01T10:00:00Z', '2024-05-02T00:00:00Z'],
+        'quotes':[3, None],
+        'wos':['1', '0']
+    })
+    activity = QuerySchemas().apply('daily_activity', data)
+
+    assert activity.doc_day.tolist() == [pd.Timestamp('2024-05-01'), pd.Timestamp('2024-05-02')]
+    assert activity.quotes.tolist() == [3, 0]
+    assert activity.wos.dtype == 'int32'
+
+
+def test_empty_results_keep_every_column():
+    empty = QuerySchemas().apply('queries/addresses.sql', pd.DataFrame())
+    assert list(empty.columns) == ['mp_id', 'state_code']
+
+
+def test_unknown_queries_are_rejected():
+    with pytest.raises(Exception, match='has no schema'):
+        QuerySchemas().apply('queries/unknown.sql', pd.DataFrame())
+
+
+def test_last_wo_date_reconcile_matches_the_original_comparison():
+    mb_data = pd.DataFrame({
+        'sf_id':['001A', '001B', '001C', '001D'],
+        'date_last_wo':['2024-05-01T10:00:00+00:00', '2024-05-01T23:30:00-06:00', '2024-04-01T00:00:00+00:00', '2024-03-03T00:00:00+00:00']
+    })
+    sf_data = pd.DataFrame({'Id':['001A', '001B', '001C'], 'last_wo_date__c':['2024-05-01', '2024-05-01', '2024-03-01']})
+
+    # Comparación de Automations.update_last_wo_date antes de Reconciler
+    original = (
+        mb_data
+        .set_index('sf_id')
+        .join(sf_data.set_index('Id'), how='left')
+        .assign(date_last_wo=lambda x: pd.to_datetime(x.date_last_wo, utc=True).dt.strftime('%Y-%m-%d'))
+        .query('date_last_wo != last_wo_date__c')
+        .date_last_wo
+        .to_dict()
+    )
+
+    changes = Reconciler().diff('last_wo_date', mb_data, sf_data)
+    assert dict(zip(changes.id, changes.new)) == original == {'001B':'2024-05-02', '001C':'2024-04-01', '001D':'2024-03-03'}
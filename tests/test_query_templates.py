@@ -0,0 +1,97 @@
+import os
+from datetime import date, datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+import pytest
+from scripts.query_templates import QueryTemplates
+
+QUERY = '''select id, name
+from companies
+--insert_where_clause_here
+--insert_order_by_clause_here
+'''
+
+
+@pytest.fixture
+def templates():
+    return QueryTemplates()
+
+
+@pytest.mark.parametrize('value, postgres, soql', [
+    ("O'Brien", "'O''Brien'", "'O\\'Brien'"),
+    ("'; drop table companies; --", "'''; drop table companies; --'", "'\\'; drop table companies; --'"),
+    ('back\\slash', "'back\\slash'", "'back\\\\slash'"),
+    ('two\nlines\ttab', "'two\nlines\ttab'", "'two\\nlines\\ttab'"),
+    (None, 'null', 'null'),
+    (float('nan'), 'null', 'null'),
+    (pd.NaT, 'null', 'null'),
+    (True, 'true', 'true'),
+    (np.int64(7), '7', '7'),
+    (2.5, '2.5', '2.5'),
+    (date(2024, 5, 1), "date '2024-05-01'", '2024-05-01'),
+    (datetime(2024, 5, 1, 10, 30), "timestamp '2024-05-01 10:30:00'", '2024-05-01T10:30:00Z'),
+    (datetime(2024, 5, 1, 22, 0, tzinfo=timezone(timedelta(hours=-6))), "timestamp '2024-05-02 04:00:00'", '2024-05-02T04:00:00Z'),
+    (pd.Timestamp('2024-05-01 10:30', tz='UTC'), "timestamp '2024-05-01 10:30:00'", '2024-05-01T10:30:00Z'),
+    (['a', "b'c"], "('a', 'b''c')", "('a', 'b\\'c')")
+])
+def test_literals_are_escaped_per_dialect(templates, value, postgres, soql):
+    assert templates.to_literal(value, 'postgres') == postgres
+    assert templates.to_literal(value, 'soql') == soql
+
+
+@pytest.mark.parametrize('value, message', [
+    ([], 'empty list'),
+    (float('inf'), 'non finite'),
+    ({'a':1}, 'Unsupported bind parameter type')
+])
+def test_invalid_literals_are_rejected(templates, value, message):
+    with pytest.raises(Exception, match=message):
+        templates.to_literal(value)
+
+
+def test_params_are_bound_as_literals(templates):
+    text = templates.render('select * from wos where updated_at >= {since} and name = {name}', params={'since':date(2024, 1, 1), 'name':"x' or '1'='1"}, is_path=False)
+    assert text == "select * from wos where updated_at >= date '2024-01-01' and name = 'x'' or ''1''=''1'"
+
+
+def test_params_must_match_the_query(templates):
+    with pytest.raises(Exception, match=r"Missing: \['since'\], unknown: \['until'\]"):
+        templates.render('select * from wos where updated_at >= {since}', params={'until':1}, is_path=False)
+
+
+def test_postgres_filters_keep_the_pagination_markers(templates):
+    text = templates.render(QUERY, filters=[('name', 'in', ['a', "b'c"]), ('id', '>=', 10)], is_path=False)
+
+    assert "where name in ('a', 'b''c') and id >= 10" in text
+    assert text.startswith('select *\nfrom (\n')
+    assert text.rstrip().endswith('--insert_where_clause_here\n--insert_order_by_clause_here')
+
+
+def test_soql_filters_extend_the_existing_where(templates):
+    text = templates.render("select Id from Contact where Email != null", filters=[('AccountId', 'in', ['001A', "001'B"])], dialect='soql', is_path=False)
+    assert text == "select Id from Contact where (Email != null) and AccountId in ('001A', '001\\'B')"
+
+    text = templates.render('select Id from Contact', filters=[('AccountId', '=', '001A')], dialect='soql', is_path=False)
+    assert text == "select Id from Contact\nwhere AccountId = '001A'"
+
+
+@pytest.mark.parametrize('column, operator, value, message', [
+    ('name; drop table companies', '=', 'a', 'Invalid column name'),
+    ('name', 'like', 'a%', 'Invalid operator'),
+    ('name', 'in', 'a', 'needs a list'),
+    ('name', '=', ['a'], 'needs a single value')
+])
+def test_invalid_filters_are_rejected(templates, column, operator, value, message):
+    with pytest.raises(Exception, match=message):
+        templates.render(QUERY, filters=[(column, operator, value)], is_path=False)
+
+
+def test_templates_are_reloaded_when_the_file_changes(templates, tmp_path):
+    path = tmp_path / 'query.sql'
+    path.write_text('select {value}')
+    assert templates.render(str(path), params={'value':1}) == 'select 1'
+
+    path.write_text('select {value} + 1')
+    stat = path.stat()
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert templates.render(str(path), params={'value':1}) == 'select 1 + 1'
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scripts.reconciliation import Reconciler
+
+
+def as_changes(changes:pd.DataFrame, field:str) -> dict:
+    changes = changes[changes.field == field]
+    return dict(zip(changes.id, changes.new))
+
+
+def test_otif_matches_the_original_outer_comparison():
+    mb_data = pd.DataFrame({'salesforce_id':['001A', '001B', '001C'], 'otif':[100 * 2 / 3, 50.0, 80.0]})
+    sf_data = pd.DataFrame({'Id':['001A', '001B', '001D'], 'OTIF__c':[66.67, 50.0, 90.0]})
+
+    # Comparación de Automations.update_otif antes de Reconciler (los dos vacíos también se mandaban, sin efecto)
+    original = (
+        mb_data
+        .set_index('salesforce_id')
+        .join(sf_data.set_index('Id'), how='outer')
+        .query('otif != OTIF__c')
+        .otif
+        .to_dict()
+    )
+
+    changes = as_changes(Reconciler().diff('otif', mb_data, sf_data), 'OTIF__c')
+    assert changes == {'001A':100 * 2 / 3, '001C':80.0, '001D':None}
+    assert changes.keys() == original.keys()
+    assert all(changes[key] == original[key] or (changes[key] is None and np.isnan(original[key])) for key in changes)
+
+
+def test_status_sends_every_row_of_the_metabase_query():
+    mb_data = pd.DataFrame({
+        'salesforce_id':['001A', '001B', '001C'],
+        'status_quo':['New MP', 'Active MP (working)', 'Developing MP (Quoted)'],
+        'mb_status':['Active MP (working)', 'Developing MP (Quoted)', None]
+    })
+
+    changes = Reconciler().diff('status', mb_data)
+    assert as_changes(changes, 'Account_Status__c') == {'001A':'Active MP (working)', '001B':'Developing MP (Quoted)', '001C':None}
+
+
+def test_wos_quotes_treats_zero_and_empty_alike():
+    mb_data = pd.DataFrame({'salesforce_id':['001A', '001B', '001C'], 'mb_wos':[3, 0, np.nan], 'mb_quotes':[5.0, 2.0, 1.0]})
+    sf_data = pd.DataFrame({'Id':['001A', '001B', '001C'], 'Completed_Work_Orders__c':[3.0, np.nan, 4.0], 'Number_of_RFQs_MP_has_quoted__c':[4.0, 2.0, 1.0]})
+
+    changes = Reconciler().diff('wos_quotes', mb_data, sf_data)
+    assert as_changes(changes, 'Completed_Work_Orders__c') == {'001C':None}
+    assert as_changes(changes, 'Number_of_RFQs_MP_has_quoted__c') == {'001A':5}
+
+
+def test_jobs_are_validated():
+    reconciler = Reconciler()
+    with pytest.raises(Exception, match='Missing key'):
+        reconciler.add_job('kpi', {'mb_query':'queries/kpi.sql', 'fields':[]})
+    with pytest.raises(Exception, match='Unsupported field type'):
+        reconciler.add_job('kpi', {'mb_query':'q', 'mb_id':'id', 'sf_id':'Id', 'object_type':'Account', 'fields':[{'mb':'a', 'sf':'b', 'type':'money'}]})
+    with pytest.raises(Exception, match='Unknown sync job'):
+        reconciler.diff('kpi', pd.DataFrame())
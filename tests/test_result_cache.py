@@ -0,0 +1,80 @@
+import threading
+from scripts.result_cache import BytesCache, ResultCache
+
+
+def test_results_are_reused_until_evicted():
+    cache = ResultCache(max_entries=2)
+    calls = []
+    compute = lambda value: lambda: calls.append(value) or value
+
+    assert cache.get_or_compute(('a',), 1, compute('A')) == 'A'
+    assert cache.get_or_compute(('b',), 1, compute('B')) == 'B'
+    assert cache.get_or_compute(('a',), 1, compute('A2')) == 'A'
+    assert cache.get_or_compute(('c',), 1, compute('C')) == 'C'
+
+    # 'b' era la menos usada, así que es la que salió
+    assert cache.get_or_compute(('b',), 1, compute('B2')) == 'B2'
+    assert calls == ['A', 'B', 'C', 'B2']
+    assert cache.get_stats() == {'hits':1, 'misses':4, 'evictions':2, 'invalidations':0, 'entries':2}
+
+
+def test_new_version_invalidates_every_entry():
+    cache = ResultCache()
+    cache.get_or_compute(('a',), 1, lambda: 'old a')
+    cache.get_or_compute(('b',), 1, lambda: 'old b')
+
+    assert cache.get_or_compute(('a',), 2, lambda: 'new a') == 'new a'
+    assert cache.get_stats()['invalidations'] == 2
+    assert cache.get_or_compute(('b',), 2, lambda: 'new b') == 'new b'
+
+
+def test_older_versions_are_computed_but_not_stored():
+    cache = ResultCache()
+    cache.get_or_compute(('a',), 2, lambda: 'current')
+
+    assert cache.get_or_compute(('a',), 1, lambda: 'stale') == 'stale'
+    assert cache.get_or_compute(('a',), 2, lambda: 'recomputed') == 'current'
+    assert cache.get_stats()['entries'] == 1
+
+
+def test_result_computed_while_version_changed_is_not_stored():
+    cache = ResultCache()
+    started, finish = threading.Event(), threading.Event()
+
+    def slow_compute():
+        started.set()
+        finish.wait(5)
+        return 'computed with version 1'
+
+    worker = threading.Thread(target=cache.get_or_compute, args=(('a',), 1, slow_compute))
+    worker.start()
+    started.wait(5)
+    cache.get_or_compute(('b',), 2, lambda: 'version 2')
+    finish.set()
+    worker.join(5)
+
+    assert cache.get_or_compute(('a',), 2, lambda: 'recomputed') == 'recomputed'
+
+
+def test_clear_counts_invalidations():
+    cache = ResultCache()
+    cache.get_or_compute(('a',), 1, lambda: 'a')
+    cache.clear()
+
+    assert cache.get_stats()['invalidations'] == 1
+    assert cache.get_or_compute(('a',), 1, lambda: 'again') == 'again'
+
+
+def test_bytes_cache_evicts_by_size():
+    cache = BytesCache(max_bytes=10)
+    cache.put(('a',), b'1234')
+    cache.put(('b',), b'5678')
+    assert cache.get(('a',)) == b'1234'
+
+    cache.put(('c',), b'90ab')
+    assert cache.get(('b',)) is None
+    assert cache.get(('a',)) == b'1234'
+    assert cache.get_stats()['bytes'] == 8
+
+    cache.put(('big',), b'x' * 11)
+    assert cache.get(('big',)) is None
@@ -0,0 +1,90 @@
+import re
+import pandas as pd
+from scripts.sf_cache import SalesforceTableCache
+
+QUERY = 'select Id, Name from Account where Type = \'MP\''
+
+
+class StubConnection:
+    '''
+    Conexión de Salesforce sobre una tabla en memoria. Entiende los tres queries que hace el cache:
+    la carga completa, la lista de ids vigentes y el delta desde un SystemModstamp.
+    '''
+    def __init__(self, records:list) -> None:
+        self.records = pd.DataFrame(records)
+        self.queries = []
+
+    def extract_data(self, query:str) -> pd.DataFrame:
+        self.queries.append(query)
+        data = self.records
+        since = re.search(r'SystemModstamp >= (\S+)', query)
+        if since is not None:
+            data = data[pd.to_datetime(data.SystemModstamp, utc=True) >= pd.Timestamp(since.group(1))]
+        if query.startswith('select Id from'):
+            data = data[['Id']]
+        if data.size == 0: raise KeyError('records')
+        return data.reset_index(drop=True)
+
+
+def record(record_id:str, name:str, modstamp:str) -> dict:
+    return {'Id':record_id, 'SystemModstamp':modstamp, 'Name':name}
+
+
+def test_warm_start_only_requests_the_delta(tmp_path):
+    sfc = StubConnection([record('1', 'uno', '2024-01-01T00:00:00Z'), record('2', 'dos', '2024-01-02T00:00:00Z')])
+    SalesforceTableCache(sfc, cache_dir=str(tmp_path)).load('accounts', QUERY)
+
+    sfc.records = pd.DataFrame([record('2', 'dos bis', '2024-01-03T00:00:00Z'), record('3', 'tres', '2024-01-04T00:00:00Z')])
+    sfc.queries = []
+    table = SalesforceTableCache(sfc, cache_dir=str(tmp_path)).load('accounts', QUERY)
+
+    assert table.sort_values('Id').values.tolist() == [['2', 'dos bis'], ['3', 'tres']]
+    assert sfc.queries[1].endswith("SystemModstamp >= 2024-01-02T00:00:00Z")
+
+
+def test_watermark_is_stored_with_the_table(tmp_path):
+    (tmp_path / 'accounts.json').write_text('{"query": "old", "watermark": "2030-01-01T00:00:00Z"}')
+    # Archivo temporal de un proceso que se cayó a medio escribir
+    (tmp_path / 'accounts.parquet.999.deadbeef.tmp').write_bytes(b'partial')
+
+    sfc = StubConnection([record('1', 'uno', '2024-01-01T00:00:00Z')])
+    SalesforceTableCache(sfc, cache_dir=str(tmp_path)).load('accounts', QUERY)
+
+    assert not (tmp_path / 'accounts.json').exists()
+    sfc.queries = []
+    SalesforceTableCache(sfc, cache_dir=str(tmp_path)).load('accounts', QUERY)
+    assert sfc.queries[1].endswith('SystemModstamp >= 2024-01-01T00:00:00Z')
+
+
+def test_changed_query_triggers_a_full_load(tmp_path):
+    sfc = StubConnection([record('1', 'uno', '2024-01-01T00:00:00Z')])
+    SalesforceTableCache(sfc, cache_dir=str(tmp_path)).load('accounts', QUERY)
+
+    sfc.queries = []
+    SalesforceTableCache(sfc, cache_dir=str(tmp_path)).load('accounts', 'select Id, Name from Account')
+    assert sfc.queries == ['select Id, SystemModstamp, Name from Account']
+
+
+def test_mixed_type_columns_are_saved_as_text(tmp_path, caplog):
+    sfc = StubConnection([record('1', 'uno', '2024-01-01T00:00:00Z'), record('2', 2, '2024-01-02T00:00:00Z'), record('3', None, '2024-01-02T00:00:00Z')])
+    SalesforceTableCache(sfc, cache_dir=str(tmp_path)).load('accounts', QUERY)
+
+    assert (tmp_path / 'accounts.parquet').exists()
+    assert 'Column Name of cached Salesforce table accounts has mixed types' in caplog.text
+
+    sfc.queries = []
+    table = SalesforceTableCache(sfc, cache_dir=str(tmp_path)).load('accounts', QUERY)
+    assert sfc.queries[1].endswith('SystemModstamp >= 2024-01-02T00:00:00Z')
+    assert table.sort_values('Id').Id.tolist() == ['1', '2', '3']
+
+
+def test_streamer_failures_fall_back_to_extract_data(tmp_path):
+    class ExpiredStreamer:
+        def query_data(self, query, column_types=None):
+            raise Exception('Salesforce query failed with 401: INVALID_SESSION_ID')
+
+    sfc = StubConnection([record('1', 'uno', '2024-01-01T00:00:00Z')])
+    table = SalesforceTableCache(sfc, cache_dir=str(tmp_path), streamer=ExpiredStreamer()).load('accounts', QUERY)
+
+    assert table.values.tolist() == [['1', 'uno']]
+    assert sfc.queries == ["select Id, SystemModstamp, Name from Account where Type = 'MP'"]
@@ -0,0 +1,76 @@
+import json
+import pyarrow as pa
+from scripts.sf_rest import SalesforceRest
+from scripts.sf_stream import SalesforceStreamer
+
+BASE_URL = 'https://prima.my.salesforce.com/services/data/v59.0/'
+
+
+class StubResponse:
+    def __init__(self, body:dict) -> None:
+        self.status_code = 200
+        self.text = json.dumps(body)
+        self.__body = body
+
+    def json(self):
+        return self.__body
+
+
+class StubSession:
+    '''
+    Regresa las páginas especificadas en orden, la primera para el query y las demás para cada nextRecordsUrl
+    '''
+    def __init__(self, pages:list) -> None:
+        self.urls = []
+        self.__pages = pages
+
+    def request(self, method, url, headers=None, params=None, data=None, timeout=None):
+        self.urls.append(url)
+        page = len(self.urls) - 1
+        done = page == len(self.__pages) - 1
+        body = {'done':done, 'records':[{'attributes':{'type':'Account'}, **record} for record in self.__pages[page]]}
+        if not done: body['nextRecordsUrl'] = f'/services/data/v59.0/query/01gNEXT-{page + 1}'
+        return StubResponse(body)
+
+
+def make_streamer(pages:list) -> tuple:
+    session = StubSession(pages)
+    return SalesforceStreamer(SalesforceRest(base_url=BASE_URL, session=session)), session
+
+
+def test_pages_are_read_until_done():
+    streamer, session = make_streamer([
+        [{'Id':'001A', 'Owner':{'attributes':{'type':'User'}, 'Name':'Ana'}}],
+        [{'Id':'001B', 'Owner':None}]
+    ])
+
+    data = streamer.query_data('select Id, Owner.Name from Account')
+
+    assert data.Id.tolist() == ['001A', '001B']
+    assert data['Owner.Name'].tolist()[0] == 'Ana'
+    assert session.urls[1].endswith('/query/01gNEXT-1')
+
+
+def test_known_columns_keep_their_type_on_every_page():
+    streamer, _ = make_streamer([
+        [{'Id':'001A', 'Name':None, 'Completed_Work_Orders__c':3}],
+        [{'Id':'001B', 'Name':'MP B', 'Completed_Work_Orders__c':2.5}]
+    ])
+    types = {'Id':pa.string(), 'Name':pa.string(), 'Completed_Work_Orders__c':pa.float64()}
+
+    batches = list(streamer.iter_batches('select Id, Name, Completed_Work_Orders__c from Account', column_types=types))
+
+    assert all(batch.schema.field('Name').type == pa.string() for batch in batches)
+    assert all(batch.schema.field('Completed_Work_Orders__c').type == pa.float64() for batch in batches)
+
+
+def test_values_that_do_not_match_their_type_are_inferred():
+    streamer, _ = make_streamer([[{'Name':'00012'}]])
+
+    table = streamer.query_table('select Name from quoted_items__c', column_types={'Name':pa.int64()})
+    assert table.schema.field('Name').type == pa.string()
+
+
+def test_empty_results_return_an_empty_table():
+    streamer, _ = make_streamer([[]])
+    assert streamer.query_data('select Id from Account').shape == (0, 0)
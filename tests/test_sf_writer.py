@@ -0,0 +1,209 @@
+import json
+import threading
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pytest
+from scripts.sf_rest import SalesforceRest
+from scripts.sf_writer import SalesforceWriter
+from scripts.sf_executor import SalesforceExecutor
+
+BASE_URL = 'https://prima.my.salesforce.com/services/data/v59.0/'
+
+
+class StubResponse:
+    def __init__(self, status_code:int, body, headers:dict=None) -> None:
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.__body = body
+        self.text = body if isinstance(body, str) else json.dumps(body)
+
+    def json(self):
+        return self.__body
+
+
+class StubSession:
+    '''
+    Sesión de requests que responde a sObject Collections sin red. responder recibe el payload (y el número de llamada)
+    y regresa un StubResponse; por default todos los registros se actualizan bien.
+    '''
+    def __init__(self, responder=None) -> None:
+        self.calls = []
+        self.__responder = responder or (lambda payload, call: StubResponse(200, [{'success':True} for _ in payload['records']]))
+        self.__lock = threading.Lock()
+
+    def request(self, method, url, headers=None, params=None, data=None, timeout=None):
+        payload = json.loads(data) if data is not None else None
+        with self.__lock:
+            call = len(self.calls)
+            self.calls.append({'method':method, 'url':url, 'headers':headers, 'params':params, 'payload':payload})
+        return self.__responder(payload, call)
+
+
+def make_writer(session:StubSession, max_retries:int=3) -> SalesforceWriter:
+    rest = SalesforceRest(base_url=BASE_URL, headers={'Authorization':'Bearer token'}, session=session)
+    return make_writer_with(rest, max_retries)
+
+
+def make_writer_with(rest:SalesforceRest, max_retries:int=3) -> SalesforceWriter:
+    executor = SalesforceExecutor(max_workers=2, requests_per_second=1000, max_retries=max_retries, base_delay=0, max_delay=0)
+    return SalesforceWriter(rest, executor=executor)
+
+
+def sent_ids(session:StubSession) -> list:
+    return [[record['id'] for record in call['payload']['records']] for call in session.calls]
+
+
+def test_records_are_sent_in_batches_of_200():
+    session = StubSession()
+    records = [(f'001{i:05d}', {'wos__c':i}) for i in range(450)]
+
+    errors = make_writer(session).update_records('Account', records)
+
+    assert errors == []
+    assert sorted(len(ids) for ids in sent_ids(session)) == [50, 200, 200]
+    assert sorted(sum(sent_ids(session), [])) == [sf_id for sf_id, _ in records]
+
+    call = session.calls[0]
+    assert call['method'] == 'PATCH'
+    assert call['url'] == BASE_URL + 'composite/sobjects'
+    assert call['headers']['Authorization'] == 'Bearer token'
+    assert call['headers']['Content-Type'] == 'application/json'
+    assert call['payload']['allOrNone'] is False
+    assert call['payload']['records'][0]['attributes'] == {'type':'Account'}
+
+
+def test_batch_size_is_validated():
+    with pytest.raises(Exception, match='Invalid batch size'):
+        SalesforceWriter(SalesforceRest(base_url=BASE_URL, session=StubSession()), batch_size=201)
+
+
+def test_repeated_ids_go_in_different_batches():
+    session = StubSession()
+    records = [('001A', {'wos__c':1}), ('001B', {'wos__c':2}), ('001A', {'quotes__c':3})]
+
+    make_writer(session).update_records('Account', records)
+
+    assert all(len(ids) == len(set(ids)) for ids in sent_ids(session))
+    assert sorted(sum(sent_ids(session), [])) == ['001A', '001A', '001B']
+
+
+def test_partial_failures_only_retry_the_failed_records():
+    def responder(payload, call):
+        results = []
+        for record in payload['records']:
+            if record['id'] == '001BAD':
+                results.append({'success':False, 'errors':[{'statusCode':'FIELD_CUSTOM_VALIDATION_EXCEPTION', 'message':'invalid', 'fields':['wos__c']}]})
+            elif record['id'] == '001LOCK' and call == 0:
+                results.append({'success':False, 'errors':[{'statusCode':'UNABLE_TO_LOCK_ROW', 'message':'locked', 'fields':[]}]})
+            else:
+                results.append({'success':True})
+        return StubResponse(200, results)
+
+    session = StubSession(responder)
+    records = [('001OK', {'wos__c':1}), ('001BAD', {'wos__c':2}), ('001LOCK', {'wos__c':3}), ('001OK2', {'wos__c':4})]
+
+    errors = make_writer(session).update_records('Account', records)
+
+    # allOrNone = false: los registros buenos no se reenvían y el error permanente no se reintenta
+    assert sent_ids(session) == [['001OK', '001BAD', '001LOCK', '001OK2'], ['001LOCK']]
+    assert errors == [(1, 'FIELD_CUSTOM_VALIDATION_EXCEPTION: invalid', ['wos__c'])]
+
+
+def test_failed_calls_are_retried_only_when_temporary():
+    def responder(payload, call):
+        if payload['records'][0]['id'] == '001UNAVAILABLE' and call < 2:
+            return StubResponse(503, 'Service Unavailable', headers={'Retry-After':'0'})
+        if payload['records'][0]['id'] == '001MALFORMED':
+            return StubResponse(400, [{'errorCode':'MALFORMED_ID'}])
+        return StubResponse(200, [{'success':True} for _ in payload['records']])
+
+    session = StubSession(responder)
+    writer = make_writer(session)
+
+    assert writer.update_records('Account', [('001UNAVAILABLE', {'wos__c':1})]) == []
+    assert len(session.calls) == 3
+
+    errors = writer.update_records('Account', [('001MALFORMED', {'wos__c':1})])
+    assert len(session.calls) == 4
+    assert errors[0][0] == 0 and errors[0][1].startswith('400')
+
+
+def test_retries_are_limited():
+    session = StubSession(lambda payload, call: StubResponse(429, 'REQUEST_LIMIT_EXCEEDED'))
+
+    errors = make_writer(session, max_retries=2).update_records('Account', [('001A', {'wos__c':1})])
+
+    assert len(session.calls) == 3
+    assert [position for position, _, _ in errors] == [0]
+
+
+def test_values_are_serialized_to_json():
+    session = StubSession()
+    fields = {'wos__c':np.int64(3), 'score__c':np.nan, 'last_wo_date__c':pd.Timestamp('2024-01-02'), 'empty__c':pd.NaT, 'active__c':np.bool_(True)}
+
+    make_writer(session).update_records('Account', [('001A', fields)])
+
+    record = session.calls[0]['payload']['records'][0]
+    assert record['wos__c'] == 3
+    assert record['score__c'] is None
+    assert record['last_wo_date__c'] == '2024-01-02T00:00:00'
+    assert record['empty__c'] is None
+    assert record['active__c'] is True
+
+
+def test_rest_paths_and_client_headers():
+    class StubClient:
+        base_url = BASE_URL
+        headers = {'Authorization':'Bearer first'}
+        session = StubSession(lambda payload, call: StubResponse(200, {}))
+
+    client = StubClient()
+    rest = SalesforceRest(client=client)
+
+    rest.request('GET', 'query', params={'q':'select Id from Account'})
+    client.headers = {'Authorization':'Bearer renewed'} # simple_salesforce renueva la sesión
+    rest.request('GET', '/services/data/v59.0/query/01gNEXT-2000')
+
+    calls = client.session.calls
+    assert calls[0]['url'] == BASE_URL + 'query' and calls[0]['params'] == {'q':'select Id from Account'}
+    assert calls[1]['url'] == 'https://prima.my.salesforce.com/services/data/v59.0/query/01gNEXT-2000'
+    assert calls[1]['headers']['Authorization'] == 'Bearer renewed'
+
+
+def test_credentials_log_in_on_the_first_call_and_again_when_the_session_expires(monkeypatch):
+    expired = StubResponse(401, [{'errorCode':'INVALID_SESSION_ID', 'message':'Session expired or invalid'}])
+    session = StubSession(lambda payload, call: expired if call == 0 else StubResponse(200, [{'success':True} for _ in payload['records']]))
+    logins = []
+
+    def login(credentials):
+        logins.append(credentials)
+        return SimpleNamespace(base_url=BASE_URL, headers={'Authorization':f'Bearer {len(logins)}'}, session=session)
+    monkeypatch.setattr(SalesforceRest, 'login', staticmethod(login))
+
+    rest = SalesforceRest.from_credentials('templates/sf_credentials.json')
+    assert logins == []
+
+    errors = make_writer_with(rest).update_records('Account', [('001A', {'wos__c':1})])
+    assert errors == []
+    assert [call['headers']['Authorization'] for call in session.calls] == ['Bearer 1', 'Bearer 2']
+
+
+def test_an_expired_session_is_renewed_only_once_per_call(monkeypatch):
+    session = StubSession(lambda payload, call: StubResponse(401, [{'errorCode':'INVALID_SESSION_ID', 'message':'Session expired or invalid'}]))
+    monkeypatch.setattr(SalesforceRest, 'login', staticmethod(lambda credentials: SimpleNamespace(base_url=BASE_URL, headers={}, session=session)))
+
+    errors = make_writer_with(SalesforceRest.from_credentials('templates/sf_credentials.json')).update_records('Account', [('001A', {'wos__c':1})])
+    assert len(session.calls) == 2
+    assert errors[0][1].startswith('401')
+
+
+def test_login_requires_credentials():
+    with pytest.raises(Exception, match='credentials are required'):
+        SalesforceRest.login(None)
+    with pytest.raises(Exception, match="missing \\['security_token'\\]"):
+        SalesforceRest.login({'username':'user', 'password':'password'})
+    with pytest.raises(Exception, match='credentials are required'):
+        SalesforceRest.from_credentials(None)
+    with pytest.raises(Exception, match='Either base_url or client'):
+        SalesforceRest()
@@ -0,0 +1,93 @@
+import threading
+import time
+import pandas as pd
+from scripts.single_flight import SingleFlight
+from scripts.query_cache import QueryCache
+
+
+def run_concurrently(n:int, target) -> tuple:
+    '''
+    Lanza n hilos con target. Regresa los hilos y la lista donde cada uno deja lo que regresó (o lanzó)
+    '''
+    results = [None] * n
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as error:
+            results[i] = error
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads: thread.start()
+    return threads, results
+
+
+def blocking_function(release:threading.Event, calls:list, value=None, error:Exception=None):
+    def function():
+        calls.append(1)
+        release.wait(5)
+        if error is not None: raise error
+        return value
+    return function
+
+
+def wait_for_waiters(stats, n:int) -> None:
+    '''
+    Espera a que n llamadas estén esperando a otra (stats regresa los contadores de SingleFlight o QueryCache)
+    '''
+    deadline = time.monotonic() + 5
+    while stats()['coalesced'] < n and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_simultaneous_calls_share_one_execution():
+    flight, release, calls = SingleFlight(), threading.Event(), []
+    function = blocking_function(release, calls, value={'rows':3})
+
+    threads, results = run_concurrently(8, lambda: flight.do('accounts', function))
+    wait_for_waiters(flight.get_stats, 7)
+    release.set()
+    for thread in threads: thread.join(5)
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.get_stats() == {'flights':1, 'coalesced':7, 'in_flight':0}
+
+
+def test_errors_reach_every_waiter_and_release_the_key():
+    flight, release, calls = SingleFlight(), threading.Event(), []
+    function = blocking_function(release, calls, error=ConnectionError('metabase is down'))
+
+    threads, results = run_concurrently(4, lambda: flight.do('accounts', function))
+    wait_for_waiters(flight.get_stats, 3)
+    release.set()
+    for thread in threads: thread.join(5)
+
+    assert len(calls) == 1
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert flight.do('accounts', lambda: 'retried') == 'retried'
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    flight, release, calls = SingleFlight(), threading.Event(), []
+    threads, _ = run_concurrently(1, lambda: flight.do('slow', blocking_function(release, calls, value=1)))
+
+    assert flight.do('fast', lambda: 2) == 2
+    release.set()
+    for thread in threads: thread.join(5)
+    assert flight.get_stats()['coalesced'] == 0
+
+
+def test_query_cache_coalesces_simultaneous_fetches(tmp_path):
+    cache = QueryCache(cache_dir=str(tmp_path))
+    key = cache.make_key('metabase', 6, 'select id from wos')
+    release, calls = threading.Event(), []
+    fetch = blocking_function(release, calls, value=pd.DataFrame({'id':[1, 2]}))
+
+    threads, results = run_concurrently(5, lambda: cache.get_or_fetch(key, fetch, query='select id from wos', ttl=60, source='metabase'))
+    wait_for_waiters(cache.get_stats, 4)
+    release.set()
+    for thread in threads: thread.join(5)
+
+    assert len(calls) == 1
+    assert all(result.id.tolist() == [1, 2] for result in results)
+    assert cache.get_or_fetch(key, lambda: pd.DataFrame(), query='select id from wos', ttl=60, source='metabase').id.tolist() == [1, 2]